@@ -119,6 +119,25 @@ export class CoinsController {
     );
   }
 
+  @Get('bars/:coin_name')
+  async getBarsByCoinName(
+    @Param('coin_name') coin_name: string,
+    @Query('interval') interval: string = '1m',
+    @Query('exchange') exchange?: 'BINANCE' | 'COINEX',
+    @Query('start') start?: string,
+    @Query('end') end?: string,
+    @Query('limit') limit: number = 1000,
+  ) {
+    return this.coinsService.findBarsByCoinName(
+      coin_name,
+      interval,
+      exchange,
+      start ? new Date(start) : undefined,
+      end ? new Date(end) : undefined,
+      limit,
+    );
+  }
+
   @Get('data/:coin_name/last')
   async getMostRecentPriceByCoinName(@Param('coin_name') coin_name: string) {
     return this.coinsService.findMostRecentPriceByCoinName(coin_name);
@@ -1,9 +1,16 @@
-import { Injectable } from '@nestjs/common';
+import { BadRequestException, Injectable } from '@nestjs/common';
 import { InjectRepository } from '@nestjs/typeorm';
 import { Repository } from 'typeorm';
 import { Coin } from './coins.entity';
 import { CoinData, ExchangeEnum } from './entities/coin-data.entity';
 
+// Rollup tables by bar interval (sql/init.sql)
+const BAR_TABLES: Record<string, string> = {
+  '1s': 'coin_bar_1s',
+  '1m': 'coin_bar_1m',
+  '1h': 'coin_bar_1h',
+};
+
 @Injectable()
 export class CoinsService {
   constructor(
@@ -80,6 +87,38 @@ export class CoinsService {
     });
   }
 
+  // Downsampled bars from the rollup tables kept by the Python collectors,
+  // newest first; long ranges read these instead of raw coin_data_table rows
+  async findBarsByCoinName(
+    coin_name: string,
+    interval: string,
+    exchange: 'BINANCE' | 'COINEX' | undefined,
+    start: Date | undefined,
+    end: Date | undefined,
+    limit: number,
+  ): Promise<any[]> {
+    const table = BAR_TABLES[interval];
+    if (!table) {
+      throw new BadRequestException(`Unknown interval ${interval}`);
+    }
+    const coin = await this.coinsRepository.findOne({ where: { coin_name } });
+    if (!coin) {
+      throw new Error('Coin not found');
+    }
+    return this.coinDataRepository.query(
+      `SELECT exchange, bucket, open, high, low, close, ticks,
+              spread_bps_avg, spread_bps_max
+       FROM ${table}
+       WHERE coin_id = $1
+         AND ($2::exchange_enum IS NULL OR exchange = $2::exchange_enum)
+         AND ($3::timestamptz IS NULL OR bucket >= $3::timestamptz)
+         AND ($4::timestamptz IS NULL OR bucket < $4::timestamptz)
+       ORDER BY bucket DESC
+       LIMIT $5`,
+      [coin.coin_id, exchange ?? null, start ?? null, end ?? null, limit],
+    );
+  }
+
   async findMostRecentPriceByCoinName(coin_name: string): Promise<any[]> {
     const coin = await this.coinsRepository.findOne({ where: { coin_name } });
     if (!coin) {
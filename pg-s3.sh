@@ -29,9 +29,9 @@ else
 fi
 
 # Check if an argument is provided for the format
-if [ -z "$2" ]; then
-    log_message "No format argument provided. Defaulting to binary."
-    FORMAT="binary"
+if [ -z "$2" ] || [[ "$2" == --* ]]; then
+    log_message "No format argument provided. Defaulting to parquet."
+    FORMAT="parquet"
 else
     FORMAT=$2
     log_message "Exporting data in $FORMAT format."
@@ -54,6 +54,26 @@ log_message "POSTGRES_PORT is set to: $POSTGRES_PORT"
 log_message "S3_BUCKET is set to: $S3_BUCKET"
 log_message "REGION is set to: $REGION"
 
+# Parquet archives are written by the Python exporter, which streams the data,
+# verifies row counts and drops whole partitions instead of deleting rows
+if [ "$FORMAT" == "parquet" ]; then
+    EXPORT_ARGS=("$DAYS" --dest "s3://$S3_BUCKET")
+    if [ "$NO_DELETE" = false ]; then
+        EXPORT_ARGS+=(--delete)
+    fi
+    DB_NAME=$POSTGRES_DB DB_USER=$POSTGRES_USER DB_PASSWORD=$POSTGRES_PASSWORD \
+    DB_HOST=$POSTGRES_HOST DB_PORT=$POSTGRES_PORT S3_REGION=$REGION \
+        python3 "$(dirname "$0")/python/scripts/archive_exporter.py" "${EXPORT_ARGS[@]}"
+    STATUS=$?
+    if [ $STATUS -eq 0 ]; then
+        log_message "Parquet export successful."
+    else
+        log_message "Parquet export failed."
+    fi
+    log_message "Script completed."
+    exit $STATUS
+fi
+
 # Define the tables and their respective date columns
 declare -A TABLES
 TABLES=( ["coins_table"]="" ["coin_data_table"]="updated_at" )
@@ -70,7 +90,7 @@ for TABLE in "${!TABLES[@]}"; do
         elif [ "$FORMAT" == "text" ]; then
             PGPASSWORD=$POSTGRES_PASSWORD psql -h $POSTGRES_HOST -U $POSTGRES_USER -d $POSTGRES_DB -p $POSTGRES_PORT -c "\copy (SELECT * FROM $TABLE WHERE $DATE_COLUMN < NOW() - INTERVAL '$DAYS days') TO '$EXPORT_FILE' WITH DELIMITER E'\t'"
         elif [ "$FORMAT" == "binary" ]; then
-            PGPASSWORD=$POSTGRES_PASSWORD psql -h $POSTGRES_HOST -U $POSTGRES_USER -d $POSTGRES_DB -p $POSTGRES_PORT -c "\copy $TABLE TO '$EXPORT_FILE' WITH BINARY"
+            PGPASSWORD=$POSTGRES_PASSWORD psql -h $POSTGRES_HOST -U $POSTGRES_USER -d $POSTGRES_DB -p $POSTGRES_PORT -c "\copy (SELECT * FROM $TABLE WHERE $DATE_COLUMN < NOW() - INTERVAL '$DAYS days') TO '$EXPORT_FILE' WITH BINARY"
         fi
     else
         log_message "Skipping table $TABLE because it doesn't have a date column."
@@ -0,0 +1,43 @@
+"""
+Vectorized analytics over the collected ticks: slices of coin_data_table
+(or the Parquet archive) loaded straight into NumPy arrays, as-of aligned
+across exchanges, and resampled into premium and spread bars.
+"""
+
+from .compute import (
+    MINUTE_US,
+    align_exchanges,
+    asof,
+    premium_bars,
+    premiums,
+    resample_ohlc,
+    rolling_mean_std,
+    spread_bps,
+)
+from .loader import (
+    EXCHANGE_CODES,
+    TICK_DTYPE,
+    iter_days,
+    iter_ticks,
+    load_ticks,
+    resolve_coins,
+    select,
+)
+
+__all__ = [
+    "EXCHANGE_CODES",
+    "MINUTE_US",
+    "TICK_DTYPE",
+    "align_exchanges",
+    "asof",
+    "iter_days",
+    "iter_ticks",
+    "load_ticks",
+    "premium_bars",
+    "premiums",
+    "resample_ohlc",
+    "resolve_coins",
+    "rolling_mean_std",
+    "select",
+    "spread_bps",
+]
@@ -0,0 +1,114 @@
+"""
+Premium bars for backtesting, from the database or the Parquet archive:
+
+  python -m analytics BTCUSDT ETHUSDT --start 2024-05-01 --end 2024-05-15 \
+      --interval 60 --window 60 --output premiums.csv
+  python -m analytics BTCUSDT --start 2024-01-01 --end 2024-02-01 \
+      --archive s3://coins-prices
+
+Ranges are processed one UTC day at a time to bound memory; the rolling
+statistics run over the concatenated bars.
+"""
+
+import argparse
+import csv
+import os
+import sys
+from datetime import datetime, timezone
+import numpy as np
+from dotenv import load_dotenv
+from .compute import premium_bars, rolling_mean_std
+from .loader import SOURCES, TICK_DTYPE, iter_ticks, resolve_coins
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+from db_manager import DBManager  # noqa: E402
+
+COLUMNS = (
+    "timestamp",
+    "open",
+    "high",
+    "low",
+    "close",
+    "count",
+    "mean",
+    "std",
+    "entry_premium",
+    "exit_premium",
+    "base_spread_bps",
+    "other_spread_bps",
+)
+
+
+def parse_time(value):
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def coin_bars(days, coin_id, interval, window):
+    parts = [premium_bars(ticks, coin_id, interval, None) for _, ticks in days]
+    if not parts:
+        parts = [premium_bars(np.empty(0, dtype=TICK_DTYPE), coin_id, interval, None)]
+    bars = {
+        name: np.concatenate([part[name] for part in parts])
+        for name in COLUMNS
+        if name not in ("mean", "std")
+    }
+    bars["mean"], bars["std"] = rolling_mean_std(bars["close"], window)
+    return bars
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Cross-exchange premium bars.")
+    parser.add_argument("coins", nargs="+", help="Coin names, e.g. BTCUSDT")
+    parser.add_argument("--start", type=parse_time, required=True)
+    parser.add_argument("--end", type=parse_time, required=True)
+    parser.add_argument("--interval", type=float, default=60, help="Bar seconds")
+    parser.add_argument("--window", type=int, default=60, help="Rolling bars")
+    parser.add_argument("--source", choices=SOURCES, default="coin_data_table")
+    parser.add_argument("--archive", help="Read this archive instead of the DB")
+    parser.add_argument(
+        "--table", default="coin_data_table", help="Archived table to read"
+    )
+    parser.add_argument("--output", help="CSV file (default stdout)")
+    args = parser.parse_args()
+
+    db_manager = DBManager()
+    coin_ids = resolve_coins(db_manager.conn, args.coins)
+    db_manager.conn.rollback()
+    interval = int(args.interval * 1000000)
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    writer = csv.writer(output)
+    writer.writerow(("coin",) + COLUMNS)
+    try:
+        for coin_name, coin_id in sorted(coin_ids.items()):
+            if args.archive:
+                from .archive import iter_archive  # Needs pyarrow
+
+                days = iter_archive(
+                    args.archive, [coin_id], args.start, args.end, table=args.table
+                )
+            else:
+                days = iter_ticks(
+                    db_manager.conn,
+                    [coin_id],
+                    args.start,
+                    args.end,
+                    source=args.source,
+                )
+            bars = coin_bars(days, coin_id, interval, args.window)
+            for i in range(len(bars["timestamp"])):
+                row = [coin_name]
+                for name in COLUMNS:
+                    value = bars[name][i]
+                    if name == "timestamp":
+                        value = datetime.fromtimestamp(value / 1e6, timezone.utc)
+                    row.append(value)
+                writer.writerow(row)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        db_manager.close()
@@ -0,0 +1,111 @@
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs
+from .loader import (
+    ANALYTICS_MAX_ROWS,
+    EXCHANGE_CODES,
+    TICK_DTYPE,
+    iter_days,
+    sort_ticks,
+)
+
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION", "sa-east-1")
+
+PRICE_COLUMNS = ("best_bid", "best_ask", "mark_price")
+QTY_COLUMNS = ("best_bid_qty", "best_ask_qty")
+
+
+def open_archive(dest):
+    """
+    Filesystem and root for an archive written by archive_exporter.py
+    (pg-s3.sh): s3://bucket/prefix or a local directory.
+    """
+    if dest.startswith("s3://"):
+        filesystem = fs.S3FileSystem(
+            region=S3_REGION, endpoint_override=S3_ENDPOINT_URL
+        )
+        return filesystem, dest[len("s3://") :].rstrip("/")
+    return fs.LocalFileSystem(), os.path.abspath(dest)
+
+
+def _column(table, name):
+    # Nulls become NaN, integers of the compact layout become float64
+    return table.column(name).cast(pa.float64()).to_numpy()
+
+
+def _to_ticks(table, exchange):
+    ticks = np.empty(table.num_rows, dtype=TICK_DTYPE)
+    ticks["timestamp"] = (
+        table.column("timestamp").cast(pa.timestamp("us", tz="UTC")).cast(pa.int64())
+    ).to_numpy()
+    ticks["coin_id"] = table.column("coin_id").to_numpy()
+    ticks["exchange"] = EXCHANGE_CODES[exchange]
+    if "price_scale" in table.column_names:
+        # coin_tick_table archive: scaled integers with per-row scales
+        price_factor = 10.0 ** -_column(table, "price_scale")
+        qty_factor = 10.0 ** -_column(table, "qty_scale")
+        for name in PRICE_COLUMNS:
+            ticks[name] = _column(table, name) * price_factor
+        for name in QTY_COLUMNS:
+            ticks[name] = _column(table, name) * qty_factor
+    else:
+        for name in PRICE_COLUMNS + QTY_COLUMNS:
+            ticks[name] = _column(table, name)
+    return ticks
+
+
+def read_archive(
+    dest,
+    coin_ids,
+    start,
+    end,
+    exchanges=tuple(EXCHANGE_CODES),
+    table="coin_data_table",
+    max_rows=ANALYTICS_MAX_ROWS,
+):
+    """
+    Same result as loader.load_ticks, read from the Parquet archive instead
+    of the database. Only the needed columns are read and the coin and time
+    filters are pushed down to the row groups.
+    """
+    filesystem, root = open_archive(dest)
+    columns = ["timestamp", "coin_id", *PRICE_COLUMNS, *QTY_COLUMNS]
+    if table == "coin_tick_table":
+        columns += ["price_scale", "qty_scale"]
+    chunks = []
+    rows = 0
+    for day_start, day_end in iter_days(start, end):
+        for exchange in exchanges:
+            path = (
+                f"{root}/{table}/exchange={exchange}/"
+                f"date={day_start.date().isoformat()}/part-0.parquet"
+            )
+            try:
+                parquet = pq.read_table(
+                    path,
+                    filesystem=filesystem,
+                    columns=columns,
+                    filters=[
+                        ("coin_id", "in", list(coin_ids)),
+                        ("timestamp", ">=", day_start),
+                        ("timestamp", "<", day_end),
+                    ],
+                )
+            except FileNotFoundError:
+                continue  # Nothing archived for that exchange and day
+            rows += parquet.num_rows
+            if rows > max_rows:
+                raise MemoryError(f"More than {max_rows} rows, read smaller slices")
+            chunks.append(_to_ticks(parquet, exchange))
+    if not chunks:
+        return np.empty(0, dtype=TICK_DTYPE)
+    return sort_ticks(np.concatenate(chunks))
+
+
+def iter_archive(dest, coin_ids, start, end, **kwargs):
+    # read_archive one UTC day at a time, like loader.iter_ticks
+    for day_start, day_end in iter_days(start, end):
+        yield day_start, read_archive(dest, coin_ids, day_start, day_end, **kwargs)
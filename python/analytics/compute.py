@@ -0,0 +1,136 @@
+import numpy as np
+from .loader import select
+
+MINUTE_US = 60 * 1000000
+
+
+def asof(timestamps, source_timestamps, values, tolerance=None):
+    """
+    For every timestamp, the last value of a time ordered source at or
+    before it (NaN if there is none, or it is more than `tolerance`
+    microseconds old).
+    """
+    result = np.full(len(timestamps), np.nan)
+    if not len(source_timestamps):
+        return result
+    index = np.searchsorted(source_timestamps, timestamps, side="right") - 1
+    valid = index >= 0
+    if tolerance is not None:
+        age = timestamps - source_timestamps[np.maximum(index, 0)]
+        valid &= age <= tolerance
+    result[valid] = values[index[valid]]
+    return result
+
+
+def align_exchanges(ticks, coin_id, base="BINANCE", other="COINEX", tolerance=None):
+    """
+    As-of join of one coin's quotes on two exchanges: on the union of their
+    tick timestamps, each side carries its latest quote forward. Rows before
+    both sides have quoted are dropped.
+    """
+    left = select(ticks, coin_id, base)
+    right = select(ticks, coin_id, other)
+    timestamps = np.union1d(left["timestamp"], right["timestamp"])
+    aligned = {"timestamp": timestamps}
+    for prefix, side in (("base", left), ("other", right)):
+        for name in ("best_bid", "best_ask"):
+            aligned[f"{prefix}_{name[5:]}"] = asof(
+                timestamps, side["timestamp"], side[name], tolerance
+            )
+    complete = ~(np.isnan(aligned["base_bid"]) | np.isnan(aligned["other_bid"]))
+    return {name: column[complete] for name, column in aligned.items()}
+
+
+def premiums(aligned):
+    """
+    Same definitions as premium_engine.PremiumEngine, in percent: mid
+    premium, entry (other bid / base ask) and exit (other ask / base bid).
+    """
+    base_mid = aligned["base_bid"] + aligned["base_ask"]
+    other_mid = aligned["other_bid"] + aligned["other_ask"]
+    return {
+        "premium": 100 * (other_mid / base_mid - 1),
+        "entry_premium": 100 * (aligned["other_bid"] / aligned["base_ask"] - 1),
+        "exit_premium": 100 * (aligned["other_ask"] / aligned["base_bid"] - 1),
+    }
+
+
+def spread_bps(bid, ask):
+    return 10000 * (ask - bid) / ((ask + bid) / 2)
+
+
+def resample_ohlc(timestamps, values, interval=MINUTE_US):
+    """
+    Open/high/low/close/count of `values` per `interval` microseconds, for
+    time ordered input. Only buckets with at least one value are returned.
+    """
+    keep = ~np.isnan(values)
+    timestamps, values = timestamps[keep], values[keep]
+    if not len(values):
+        empty = np.empty(0)
+        return {
+            "timestamp": np.empty(0, dtype="i8"),
+            "open": empty,
+            "high": empty,
+            "low": empty,
+            "close": empty,
+            "count": np.empty(0, dtype="i8"),
+        }
+    buckets = timestamps // interval
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.concatenate((starts[1:], [len(values)]))
+    return {
+        "timestamp": buckets[starts] * interval,
+        "open": values[starts],
+        "high": np.maximum.reduceat(values, starts),
+        "low": np.minimum.reduceat(values, starts),
+        "close": values[ends - 1],
+        "count": ends - starts,
+    }
+
+
+def rolling_mean_std(values, window):
+    """
+    Rolling mean and sample standard deviation over the last `window`
+    values, NaN until the window is full. Cumulative sums are taken around
+    the overall mean to keep cancellation error small on long series.
+    """
+    mean = np.full(len(values), np.nan)
+    std = np.full(len(values), np.nan)
+    if len(values) < window:
+        return mean, std
+    centre = np.nanmean(values)
+    centred = values - centre
+    sums = np.concatenate(([0.0], np.cumsum(centred)))
+    squares = np.concatenate(([0.0], np.cumsum(centred * centred)))
+    window_sum = sums[window:] - sums[:-window]
+    window_squares = squares[window:] - squares[:-window]
+    mean[window - 1 :] = window_sum / window + centre
+    if window > 1:
+        variance = (window_squares - window_sum * window_sum / window) / (window - 1)
+        std[window - 1 :] = np.sqrt(np.maximum(variance, 0.0))
+    return mean, std
+
+
+def premium_bars(ticks, coin_id, interval=MINUTE_US, window=60, tolerance=None):
+    """
+    Per-interval OHLC of the mid premium with the rolling mean/std of the
+    closes over `window` bars (skipped when None), plus the mean entry and
+    exit premium and the average spreads of both exchanges in each bar.
+    """
+    aligned = align_exchanges(ticks, coin_id, tolerance=tolerance)
+    values = premiums(aligned)
+    bars = resample_ohlc(aligned["timestamp"], values["premium"], interval)
+    if window:
+        bars["mean"], bars["std"] = rolling_mean_std(bars["close"], window)
+    buckets = aligned["timestamp"] // interval
+    bar_index = np.searchsorted(bars["timestamp"] // interval, buckets)
+    for name, series in (
+        ("entry_premium", values["entry_premium"]),
+        ("exit_premium", values["exit_premium"]),
+        ("base_spread_bps", spread_bps(aligned["base_bid"], aligned["base_ask"])),
+        ("other_spread_bps", spread_bps(aligned["other_bid"], aligned["other_ask"])),
+    ):
+        totals = np.bincount(bar_index, weights=series, minlength=len(bars["count"]))
+        bars[name] = totals / np.maximum(bars["count"], 1)
+    return bars
@@ -0,0 +1,181 @@
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# Refuse slices that would not fit comfortably in memory; load long ranges
+# day by day with iter_ticks instead
+ANALYTICS_MAX_ROWS = int(os.getenv("ANALYTICS_MAX_ROWS", "10000000"))
+
+EXCHANGE_CODES = {"BINANCE": 0, "COINEX": 1}
+EXCHANGE_NAMES = {code: name for name, code in EXCHANGE_CODES.items()}
+
+# (column, SQL expression, wire type of the binary COPY field, in-memory type)
+TICK_FIELDS = (
+    (
+        "timestamp",
+        "(extract(epoch FROM timestamp) * 1000000)::int8",
+        ">i8",
+        "i8",
+    ),
+    ("coin_id", "coin_id::int4", ">i4", "i4"),
+    (
+        "exchange",
+        "(CASE exchange WHEN 'BINANCE' THEN 0 ELSE 1 END)::int2",
+        ">i2",
+        "i1",
+    ),
+    ("best_bid", "COALESCE(best_bid::float8, 'NaN')", ">f8", "f8"),
+    ("best_ask", "COALESCE(best_ask::float8, 'NaN')", ">f8", "f8"),
+    ("best_bid_qty", "COALESCE(best_bid_qty::float8, 'NaN')", ">f8", "f8"),
+    ("best_ask_qty", "COALESCE(best_ask_qty::float8, 'NaN')", ">f8", "f8"),
+    ("mark_price", "COALESCE(mark_price::float8, 'NaN')", ">f8", "f8"),
+)
+
+# One tick per element; timestamp is epoch microseconds (UTC)
+TICK_DTYPE = np.dtype([(name, native) for name, _, _, native in TICK_FIELDS])
+
+# Every field is fixed width and never NULL, so each binary COPY tuple has the
+# same size and a whole run of them can be viewed with a single dtype
+_COPY_ROW_DTYPE = np.dtype(
+    [("field_count", ">i2")]
+    + [
+        item
+        for name, _, wire, _ in TICK_FIELDS
+        for item in ((f"{name}_length", ">i4"), (name, wire))
+    ]
+)
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+# Sources with the coin_data_table columns; coin_tick_view decodes the
+# scaled integers of the compact table
+SOURCES = ("coin_data_table", "coin_tick_view")
+
+
+class _CopyParser:
+    """
+    File-like target for cursor.copy_expert that turns the binary COPY
+    stream into TICK_DTYPE chunks as it arrives, so only one network chunk
+    of raw bytes is held at a time.
+    """
+
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.buffer = bytearray()
+        self.header_done = False
+        self.chunks = []
+        self.rows = 0
+
+    def write(self, data):
+        self.buffer += data
+        if not self.header_done:
+            if len(self.buffer) < 19:
+                return len(data)
+            if bytes(self.buffer[:11]) != _COPY_SIGNATURE:
+                raise ValueError("Not a binary COPY stream")
+            extension = int.from_bytes(self.buffer[15:19], "big")
+            if len(self.buffer) < 19 + extension:
+                return len(data)
+            del self.buffer[: 19 + extension]
+            self.header_done = True
+        count = len(self.buffer) // _COPY_ROW_DTYPE.itemsize
+        if count:
+            size = count * _COPY_ROW_DTYPE.itemsize
+            raw = np.frombuffer(bytes(self.buffer[:size]), dtype=_COPY_ROW_DTYPE)
+            del self.buffer[:size]
+            if (raw["field_count"] != len(TICK_FIELDS)).any():
+                raise ValueError("Unexpected tuple layout in COPY stream")
+            self.rows += count
+            if self.rows > self.max_rows:
+                raise MemoryError(
+                    f"More than {self.max_rows} rows, load smaller slices"
+                )
+            chunk = np.empty(count, dtype=TICK_DTYPE)
+            for name in TICK_DTYPE.names:
+                chunk[name] = raw[name]
+            self.chunks.append(chunk)
+        return len(data)
+
+    def result(self):
+        # Only the two byte end-of-data marker may be left over
+        if self.buffer not in (b"", b"\xff\xff"):
+            raise ValueError(f"{len(self.buffer)} trailing bytes in COPY stream")
+        if not self.chunks:
+            return np.empty(0, dtype=TICK_DTYPE)
+        return np.concatenate(self.chunks)
+
+
+def resolve_coins(conn, coin_names):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT coin_name, coin_id FROM coins_table WHERE coin_name = ANY(%s);",
+            (list(coin_names),),
+        )
+        return dict(cursor.fetchall())
+
+
+def load_ticks(
+    conn,
+    coin_ids,
+    start,
+    end,
+    exchanges=tuple(EXCHANGE_CODES),
+    source="coin_data_table",
+    max_rows=ANALYTICS_MAX_ROWS,
+):
+    """
+    Load the ticks of `coin_ids` on `exchanges` in [start, end) as a
+    TICK_DTYPE array ordered by coin, exchange and time, streamed with a
+    binary COPY so no Python object is built per row.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Unknown tick source: {source}")
+    with conn.cursor() as cursor:
+        query = cursor.mogrify(
+            f"""
+            SELECT {", ".join(expression for _, expression, _, _ in TICK_FIELDS)}
+            FROM {source}
+            WHERE coin_id = ANY(%s) AND exchange = ANY(%s::exchange_enum[])
+              AND timestamp >= %s AND timestamp < %s
+            ORDER BY coin_id, exchange, timestamp
+            """,
+            (list(coin_ids), list(exchanges), start, end),
+        ).decode("utf-8")
+        parser = _CopyParser(max_rows)
+        try:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH BINARY", parser)
+        finally:
+            conn.rollback()  # Read only; do not leave a transaction open
+    return parser.result()
+
+
+def iter_days(start, end):
+    # [start, end) split at UTC midnights
+    start = start.astimezone(timezone.utc)
+    day = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+    while day < end:
+        next_day = day + timedelta(days=1)
+        yield max(day, start), min(next_day, end)
+        day = next_day
+
+
+def iter_ticks(conn, coin_ids, start, end, **kwargs):
+    """
+    load_ticks one UTC day at a time, which bounds memory to a single day
+    for multi-week ranges. Yields (day_start, ticks).
+    """
+    for day_start, day_end in iter_days(start, end):
+        yield day_start, load_ticks(conn, coin_ids, day_start, day_end, **kwargs)
+
+
+def select(ticks, coin_id, exchange):
+    # Time ordered ticks of one coin on one exchange
+    mask = (ticks["coin_id"] == coin_id) & (
+        ticks["exchange"] == EXCHANGE_CODES[exchange]
+    )
+    selected = ticks[mask]
+    return selected[np.argsort(selected["timestamp"], kind="stable")]
+
+
+def sort_ticks(ticks):
+    order = np.lexsort((ticks["timestamp"], ticks["exchange"], ticks["coin_id"]))
+    return ticks[order]
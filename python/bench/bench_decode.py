@@ -0,0 +1,113 @@
+"""
+Per-message decode cost of the collectors, old path against decoders.py.
+
+  coinex    gzip.decompress + utf-8 decode + json.loads + dict, against
+            zlib inflate + the configured JSON backend + Tick
+  binance   json.loads + dict with float() fields, against the JSON backend
+            + Tick
+
+No database or network is needed:
+
+  python python/bench/bench_decode.py --messages 200000
+  JSON_DECODER=json python python/bench/bench_decode.py
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "scripts"))
+
+from decoders import JSON_BACKEND, binance_tick, coinex_tick, loads  # noqa: E402
+from feeds import (  # noqa: E402
+    PriceWalk,
+    bench_symbols,
+    binance_book_ticker,
+    coinex_bbo,
+    coinex_frame,
+)
+
+
+def legacy_coinex(frame):
+    parsed_msg = json.loads(gzip.decompress(frame).decode("utf-8"))
+    data = parsed_msg["data"]
+    return {
+        "symbol": data["market"],
+        "best_bid": data["best_bid_price"],
+        "best_ask": data["best_ask_price"],
+        "best_bid_qty": data["best_bid_size"],
+        "best_ask_qty": data["best_ask_size"],
+        "mark_price": None,
+        "last_price": None,
+        "timestamp": data["updated_at"],
+    }
+
+
+def legacy_binance(text):
+    data = json.loads(text)["data"]
+    return {
+        "symbol": data["s"],
+        "bidPrice": float(data["b"]),
+        "bidQty": float(data["B"]),
+        "askPrice": float(data["a"]),
+        "askQty": float(data["A"]),
+        "time": datetime.fromtimestamp(data.get("T", 0) / 1000, timezone.utc),
+        "lastUpdateId": data.get("u", 0),
+        "mark_price": None,
+    }
+
+
+def fast_binance(text):
+    return binance_tick(loads(text)["data"])
+
+
+def per_message_us(decode, messages, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for message in messages:
+            decode(message)
+        best = min(best, time.perf_counter() - started)
+    return 1e6 * best / len(messages)
+
+
+def build_messages(count, symbols):
+    walk = PriceWalk(symbols)
+    now = int(time.time() * 1000)
+    coinex, binance = [], []
+    for i in range(count):
+        symbol = symbols[i % len(symbols)]
+        price, update_id = walk.next(symbol)
+        coinex.append(coinex_frame(coinex_bbo(symbol, now + i, price)))
+        binance.append(
+            json.dumps(binance_book_ticker(symbol, now + i, update_id, price))
+        )
+    return coinex, binance
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark message decoding.")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3, help="Best of N rounds")
+    args = parser.parse_args()
+
+    coinex, binance = build_messages(args.messages, bench_symbols(args.symbols))
+    result = {"json_backend": JSON_BACKEND, "messages": args.messages}
+    for name, legacy, fast, messages in (
+        ("coinex", legacy_coinex, coinex_tick, coinex),
+        ("binance", legacy_binance, fast_binance, binance),
+    ):
+        legacy_us = per_message_us(legacy, messages, args.rounds)
+        fast_us = per_message_us(fast, messages, args.rounds)
+        result[name] = {
+            "legacy_us": round(legacy_us, 3),
+            "fast_us": round(fast_us, 3),
+            "speedup": round(legacy_us / fast_us, 2),
+        }
+    print(json.dumps(result, indent=2))
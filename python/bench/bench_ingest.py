@@ -0,0 +1,229 @@
+"""
+Ingest benchmark for the collectors.
+
+Replays synthetic (or recorded) bookTicker/BBO messages at a fixed rate into
+one ingest path and reports sustained throughput, tick-to-commit latency,
+CPU and peak RSS. Targets:
+
+  db             BatchWriter rows straight into coin_data_table
+  coinex         CoinexWebSocket.on_message with gzip BBO frames
+  binance        BinanceStreamTicker against the local mock websocket server
+  binance-rest   BinanceFuturesTicker polling the local mock REST server
+
+Start the benchmark database first:
+
+  docker compose -f python/bench/docker-compose.yml up -d
+  python python/bench/bench_ingest.py coinex --rate 10000 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+
+# Point at the benchmark database and mock exchange unless told otherwise;
+# the collector modules read these at import time
+MOCK_PORT = int(os.getenv("BENCH_MOCK_PORT", "8765"))
+os.environ.setdefault("DB_NAME", "bench")
+os.environ.setdefault("DB_USER", "postgres")
+os.environ.setdefault("DB_PASSWORD", "postgres")
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "5433")
+os.environ.setdefault("COINS_API_URL", f"http://127.0.0.1:{MOCK_PORT}/coins")
+os.environ.setdefault("BINANCE_REST_URL", f"http://127.0.0.1:{MOCK_PORT}")
+os.environ.setdefault("BINANCE_STREAM_URL", f"ws://127.0.0.1:{MOCK_PORT}")
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "scripts"))
+
+from db_manager import DBManager  # noqa: E402
+from feeds import (  # noqa: E402
+    Pacer,
+    PriceWalk,
+    bench_symbols,
+    coinex_bbo,
+    coinex_frame,
+    load_recorded,
+    restamp,
+)
+from mock_server import MockExchange, start_mock_server  # noqa: E402
+from symbol_registry import SymbolRegistry  # noqa: E402
+
+
+class IngestStats:
+    def __init__(self):
+        self.latencies = array("d")  # seconds from tick timestamp to commit
+        self.committed = 0
+        self.flushes = 0
+        self.started = time.perf_counter()
+        self.usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    def watch(self, writer):
+        timestamp_index = writer.columns.index("timestamp")
+
+        def on_flush(rows):
+            now = time.time()
+            self.flushes += 1
+            self.committed += len(rows)
+            self.latencies.extend(
+                now - row[timestamp_index].timestamp() for row in rows
+            )
+
+        writer.on_flush = on_flush
+
+    def report(self, target, sent, extra=None):
+        elapsed = time.perf_counter() - self.started
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = usage.ru_utime + usage.ru_stime
+        cpu -= self.usage.ru_utime + self.usage.ru_stime
+        latencies = sorted(self.latencies)
+        result = {
+            "target": target,
+            "duration_s": round(elapsed, 2),
+            "sent": sent,
+            "committed": self.committed,
+            "sent_per_s": round(sent / elapsed, 1),
+            "committed_per_s": round(self.committed / elapsed, 1),
+            "flushes": self.flushes,
+            "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "cpu_percent": round(100 * cpu / elapsed, 1),
+            "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        }
+        result.update(extra or {})
+        return result
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def seed_symbols(count):
+    symbols = bench_symbols(count)
+    db_manager = DBManager()
+    SymbolRegistry(db_manager).resolve(symbols)
+    db_manager.close()
+    return symbols
+
+
+def bench_db(args, symbols):
+    from ws_coinex import COINEX_COLUMNS
+
+    db_manager = DBManager()
+    registry = SymbolRegistry(db_manager)
+    writer = db_manager.create_batch_writer("coin_data_table", COINEX_COLUMNS)
+    stats = IngestStats()
+    stats.watch(writer)
+    walk = PriceWalk(symbols)
+    sent = 0
+    for count in Pacer(args.rate, args.duration):
+        now = datetime.now(timezone.utc)
+        for _ in range(count):
+            symbol = symbols[sent % len(symbols)]
+            price, _ = walk.next(symbol)
+            writer.add(
+                (
+                    registry.get(symbol),
+                    now,
+                    price * 0.9999,
+                    price * 1.0001,
+                    1.0,
+                    1.0,
+                    None,
+                    None,
+                    now,
+                    "COINEX",
+                )
+            )
+            sent += 1
+    db_manager.close()
+    return stats.report("db", sent)
+
+
+def bench_coinex(args, symbols):
+    from ws_coinex import CoinexWebSocket
+
+    db_manager = DBManager()
+    coinex = CoinexWebSocket(None, None, db_manager)
+    coinex.start()
+    time.sleep(0.1)  # Let the writer threads create their writers
+    stats = IngestStats()
+    for worker_db_manager in coinex.worker_db_managers:
+        for writer in worker_db_manager.writers:
+            stats.watch(writer)
+    recorded = load_recorded(args.replay) if args.replay else None
+    walk = PriceWalk(symbols)
+    handler_time = 0.0
+    sent = 0
+    for count in Pacer(args.rate, args.duration):
+        now_ms = int(time.time() * 1000)
+        for _ in range(count):
+            if recorded:
+                message = restamp(recorded[sent % len(recorded)], now_ms)
+            else:
+                symbol = symbols[sent % len(symbols)]
+                message = coinex_bbo(symbol, now_ms, walk.next(symbol)[0])
+            frame = coinex_frame(message)
+            started = time.perf_counter()
+            coinex.on_message(None, frame)
+            handler_time += time.perf_counter() - started
+            sent += 1
+    coinex.stop()
+    db_manager.close()
+    return stats.report(
+        "coinex",
+        sent,
+        {
+            "on_message_us": round(1e6 * handler_time / max(sent, 1), 2),
+            "pipeline": coinex.pipeline.stats(),
+        },
+    )
+
+
+async def bench_binance(args, symbols, rest=False):
+    from ws_binance import BinanceFuturesTicker, BinanceStreamTicker
+
+    recorded = load_recorded(args.replay) if args.replay else None
+    exchange = MockExchange(symbols, args.rate, args.duration, recorded)
+    runner = await start_mock_server(exchange, port=MOCK_PORT)
+    ticker = BinanceFuturesTicker() if rest else BinanceStreamTicker()
+    stats = IngestStats()
+    stats.watch(ticker.writer)
+    task = asyncio.create_task(ticker.run())
+    await asyncio.sleep(args.duration)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await runner.cleanup()
+    return stats.report("binance-rest" if rest else "binance", exchange.sent)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark collector ingest paths.")
+    parser.add_argument("target", choices=["db", "coinex", "binance", "binance-rest"])
+    parser.add_argument("--rate", type=float, default=1000, help="Messages/second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds")
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--replay", help="JSONL file of recorded exchange messages")
+    parser.add_argument("--output", help="Append the result as JSON to this file")
+    args = parser.parse_args()
+
+    symbols = seed_symbols(args.symbols)
+    if args.target == "db":
+        result = bench_db(args, symbols)
+    elif args.target == "coinex":
+        result = bench_coinex(args, symbols)
+    else:
+        result = asyncio.run(
+            bench_binance(args, symbols, rest=args.target == "binance-rest")
+        )
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
@@ -0,0 +1,129 @@
+import asyncio
+import gzip
+import json
+import random
+import time
+
+
+def bench_symbols(count):
+    return [f"BENCH{i}USDT" for i in range(count)]
+
+
+class PriceWalk:
+    # Random walk per symbol so consecutive ticks look like a real book
+    def __init__(self, symbols, start=100.0):
+        self.prices = {s: start * (1 + i % 7) for i, s in enumerate(symbols)}
+        self.update_ids = {symbol: 0 for symbol in symbols}
+
+    def next(self, symbol):
+        price = self.prices[symbol] * (1 + random.uniform(-0.0005, 0.0005))
+        self.prices[symbol] = price
+        self.update_ids[symbol] += 1
+        return price, self.update_ids[symbol]
+
+
+def coinex_bbo(symbol, ts_ms, price):
+    return {
+        "method": "bbo.update",
+        "data": {
+            "market": symbol,
+            "updated_at": ts_ms,
+            "best_bid_price": f"{price * 0.9999:.6f}",
+            "best_bid_size": f"{random.uniform(1, 100):.3f}",
+            "best_ask_price": f"{price * 1.0001:.6f}",
+            "best_ask_size": f"{random.uniform(1, 100):.3f}",
+        },
+        "id": None,
+    }
+
+
+def coinex_frame(message):
+    return gzip.compress(json.dumps(message).encode("utf-8"))
+
+
+def binance_book_ticker(symbol, ts_ms, update_id, price):
+    return {
+        "stream": f"{symbol.lower()}@bookTicker",
+        "data": {
+            "e": "bookTicker",
+            "u": update_id,
+            "s": symbol,
+            "b": f"{price * 0.9999:.6f}",
+            "B": f"{random.uniform(1, 100):.3f}",
+            "a": f"{price * 1.0001:.6f}",
+            "A": f"{random.uniform(1, 100):.3f}",
+            "T": ts_ms,
+            "E": ts_ms,
+        },
+    }
+
+
+def binance_mark_price(symbol, ts_ms, price):
+    return {
+        "stream": f"{symbol.lower()}@markPrice@1s",
+        "data": {
+            "e": "markPriceUpdate",
+            "E": ts_ms,
+            "s": symbol,
+            "p": f"{price:.6f}",
+            "r": "0.00010000",
+            "T": ts_ms,
+        },
+    }
+
+
+def load_recorded(path):
+    # One raw JSON message per line, as captured from an exchange feed
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def restamp(message, ts_ms):
+    # Recorded messages get the send time so tick-to-commit latency is measurable
+    data = message.get("data", {})
+    if "updated_at" in data:
+        data["updated_at"] = ts_ms
+    for key in ("T", "E"):
+        if key in data:
+            data[key] = ts_ms
+    return message
+
+
+class Pacer:
+    """
+    Yields how many messages to send next so the long-run rate matches
+    `rate` messages per second. Messages go out in small bursts because a
+    sleep per message cannot keep up above a few thousand msg/s.
+    """
+
+    def __init__(self, rate, duration, burst_interval=0.001):
+        self.rate = rate
+        self.duration = duration
+        self.burst_interval = burst_interval
+
+    def __iter__(self):
+        start = time.perf_counter()
+        sent = 0
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.duration:
+                return
+            due = int(elapsed * self.rate) - sent
+            if due > 0:
+                sent += due
+                yield due
+            else:
+                time.sleep(self.burst_interval)
+
+    async def paced(self):
+        start = time.perf_counter()
+        sent = 0
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.duration:
+                return
+            due = int(elapsed * self.rate) - sent
+            if due > 0:
+                sent += due
+                yield due
+            await asyncio.sleep(self.burst_interval)
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+import time
+from aiohttp import web, WSMsgType
+from feeds import (
+    Pacer,
+    PriceWalk,
+    bench_symbols,
+    binance_book_ticker,
+    binance_mark_price,
+    coinex_bbo,
+    coinex_frame,
+    restamp,
+)
+
+
+class MockExchange:
+    """
+    Local stand-in for the NestJS coin list, the Binance futures REST and
+    combined-stream endpoints and the Coinex futures websocket. Websocket
+    feeds push `rate` messages per second in total, shared between the
+    connections by the number of symbols each one subscribed to.
+    """
+
+    def __init__(self, symbols, rate, duration=3600, recorded=None):
+        self.symbols = symbols
+        self.rate = rate
+        self.duration = duration
+        # Recorded messages are replayed in a loop instead of synthetic ticks
+        self.recorded = [json.dumps(message) for message in recorded or []]
+        self.walk = PriceWalk(symbols)
+        self.sent = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/coins", self.coins)
+        app.router.add_get("/fapi/v1/ticker/bookTicker", self.book_ticker)
+        app.router.add_get("/fapi/v1/premiumIndex", self.premium_index)
+        app.router.add_get("/stream", self.binance_stream)
+        app.router.add_get("/v2/futures", self.coinex_stream)
+        return app
+
+    async def coins(self, request):
+        return web.json_response(
+            [
+                {"coin_id": i + 1, "coin_name": symbol, "collecting": True}
+                for i, symbol in enumerate(self.symbols)
+            ]
+        )
+
+    def requested_symbols(self, request):
+        symbol = request.query.get("symbol")
+        return [symbol] if symbol else self.symbols
+
+    async def book_ticker(self, request):
+        now = int(time.time() * 1000)
+        tickers = []
+        for symbol in self.requested_symbols(request):
+            price, update_id = self.walk.next(symbol)
+            data = binance_book_ticker(symbol, now, update_id, price)["data"]
+            tickers.append(
+                {
+                    "symbol": symbol,
+                    "bidPrice": data["b"],
+                    "bidQty": data["B"],
+                    "askPrice": data["a"],
+                    "askQty": data["A"],
+                    "time": now,
+                    "lastUpdateId": update_id,
+                }
+            )
+        self.sent += len(tickers)
+        return web.json_response(tickers[0] if "symbol" in request.query else tickers)
+
+    async def premium_index(self, request):
+        now = int(time.time() * 1000)
+        marks = [
+            {"symbol": s, "markPrice": f"{self.walk.prices[s]:.6f}", "time": now}
+            for s in self.requested_symbols(request)
+        ]
+        return web.json_response(marks[0] if "symbol" in request.query else marks)
+
+    async def binance_stream(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        msg = await ws.receive()
+        if msg.type != WSMsgType.TEXT:
+            return ws
+        subscription = json.loads(msg.data)
+        symbols = sorted(
+            {stream.split("@")[0].upper() for stream in subscription["params"]}
+        )
+        await ws.send_str(json.dumps({"result": None, "id": subscription["id"]}))
+        rate = self.rate * len(symbols) / len(self.symbols)
+        i = 0
+        async for count in Pacer(rate, self.duration).paced():
+            now = int(time.time() * 1000)
+            for _ in range(count):
+                if self.recorded:
+                    message = json.loads(self.recorded[i % len(self.recorded)])
+                    await ws.send_str(json.dumps(restamp(message, now)))
+                    i += 1
+                    continue
+                symbol = symbols[i % len(symbols)]
+                price, update_id = self.walk.next(symbol)
+                if update_id % 10 == 0:
+                    message = binance_mark_price(symbol, now, price)
+                else:
+                    message = binance_book_ticker(symbol, now, update_id, price)
+                await ws.send_str(json.dumps(message))
+                i += 1
+            self.sent += count
+            if ws.closed:
+                break
+        return ws
+
+    async def coinex_stream(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        symbols = self.symbols
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            request_msg = json.loads(msg.data)
+            if request_msg.get("method") == "bbo.subscribe":
+                symbols = request_msg["params"]["market_list"] or self.symbols
+                break
+        i = 0
+        async for count in Pacer(self.rate, self.duration).paced():
+            now = int(time.time() * 1000)
+            for _ in range(count):
+                symbol = symbols[i % len(symbols)]
+                price, _ = self.walk.next(symbol)
+                await ws.send_bytes(coinex_frame(coinex_bbo(symbol, now, price)))
+                i += 1
+            self.sent += count
+            if ws.closed:
+                break
+        return ws
+
+
+async def start_mock_server(exchange, host="127.0.0.1", port=8765):
+    runner = web.AppRunner(exchange.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve mock exchange feeds.")
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=1000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    exchange = MockExchange(bench_symbols(args.symbols), args.rate)
+
+    async def serve():
+        await start_mock_server(exchange, port=args.port)
+        print(f"Mock exchange listening on http://127.0.0.1:{args.port}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
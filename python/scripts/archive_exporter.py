@@ -0,0 +1,396 @@
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from db_manager import DBManager
+from partition_manager import PartitionManager
+
+ARCHIVE_CHUNK_ROWS = int(os.getenv("ARCHIVE_CHUNK_ROWS", "100000"))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+ARCHIVE_TMP_DIR = os.getenv("ARCHIVE_TMP_DIR", "/tmp/coin-archive")
+ARCHIVE_DEST = os.getenv("ARCHIVE_DEST", "s3://coins-prices")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # e.g. a MinIO server
+S3_REGION = os.getenv("S3_REGION", "sa-east-1")
+
+EXCHANGES = ("BINANCE", "COINEX")
+
+COIN_DATA_SCHEMA = pa.schema(
+    [
+        ("data_id", pa.int32()),
+        ("coin_id", pa.int32()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("best_bid", pa.float32()),
+        ("best_ask", pa.float32()),
+        ("best_bid_qty", pa.float32()),
+        ("best_ask_qty", pa.float32()),
+        ("mark_price", pa.float32()),
+        ("last_price", pa.float32()),
+        ("updated_at", pa.timestamp("us", tz="UTC")),
+        ("exchange", pa.dictionary(pa.int8(), pa.string())),
+    ]
+)
+
+COIN_TICK_SCHEMA = pa.schema(
+    [
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("coin_id", pa.int32()),
+        ("exchange", pa.dictionary(pa.int8(), pa.string())),
+        ("best_bid", pa.int32()),
+        ("best_ask", pa.int32()),
+        ("mark_price", pa.int32()),
+        ("last_price", pa.int32()),
+        ("best_bid_qty", pa.int64()),
+        ("best_ask_qty", pa.int64()),
+        ("price_scale", pa.int16()),
+        ("qty_scale", pa.int16()),
+    ]
+)
+
+TABLE_SCHEMAS = {
+    "coin_data_table": COIN_DATA_SCHEMA,
+    "coin_tick_table": COIN_TICK_SCHEMA,
+}
+
+COINS_SCHEMA = pa.schema(
+    [
+        ("coin_id", pa.int32()),
+        ("coin_name", pa.string()),
+        ("precision_binance", pa.int32()),
+        ("precision_coinex", pa.int32()),
+        ("min_amount_binance", pa.float32()),
+        ("min_amount_coinex", pa.float32()),
+        ("trading", pa.bool_()),
+        ("collecting", pa.bool_()),
+    ]
+)
+
+
+class LocalDestination:
+    def __init__(self, root):
+        self.root = root
+
+    def upload(self, path, key):
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+        return os.path.getsize(target) == os.path.getsize(path)
+
+    def fetch(self, key):
+        # The object's bytes, None if there is none
+        try:
+            with open(os.path.join(self.root, key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def __str__(self):
+        return self.root
+
+
+class S3Destination:
+    def __init__(
+        self, bucket, prefix="", endpoint_url=S3_ENDPOINT_URL, region=S3_REGION
+    ):
+        import boto3  # Only needed when uploading to S3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    def upload(self, path, key):
+        key = f"{self.prefix}/{key}" if self.prefix else key
+        self.client.upload_file(path, self.bucket, key)
+        head = self.client.head_object(Bucket=self.bucket, Key=key)
+        return head["ContentLength"] == os.path.getsize(path)
+
+    def fetch(self, key):
+        key = f"{self.prefix}/{key}" if self.prefix else key
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def __str__(self):
+        return f"s3://{self.bucket}/{self.prefix}"
+
+
+def archive_key(exchange, day, table="coin_data_table"):
+    return f"{table}/exchange={exchange}/date={day.isoformat()}/part-0.parquet"
+
+
+def marker_key(day, table="coin_data_table"):
+    # Written once every file of the day is uploaded, with its row counts
+    return f"{table}/_exported/date={day.isoformat()}.json"
+
+
+def open_destination(dest):
+    if dest.startswith("s3://"):
+        bucket, _, prefix = dest[len("s3://") :].partition("/")
+        return S3Destination(bucket, prefix)
+    return LocalDestination(dest)
+
+
+class ArchiveExporter:
+    """
+    Streams a tick table out through a server-side cursor into one
+    compressed Parquet file per exchange and day, uploads it, and only
+    deletes a day from the database once every file for it has been
+    uploaded and its row count matches the table. An archived day gets a
+    marker object holding its row counts, so later runs skip it as long as
+    the table still has the same rows.
+    """
+
+    def __init__(
+        self,
+        db_manager,
+        destination,
+        chunk_rows=ARCHIVE_CHUNK_ROWS,
+        compression=ARCHIVE_COMPRESSION,
+        tmp_dir=ARCHIVE_TMP_DIR,
+        table="coin_data_table",
+    ):
+        self.db_manager = db_manager
+        self.destination = destination
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.tmp_dir = tmp_dir
+        self.table = table
+        self.schema = TABLE_SCHEMAS[table]
+        self.partitions = PartitionManager(db_manager, table)
+
+    @staticmethod
+    def day_bounds(day):
+        start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        return start, start + timedelta(days=1)
+
+    def days_to_export(self, older_than_days):
+        cutoff = datetime.now(timezone.utc).date() - timedelta(days=older_than_days)
+        result = self.db_manager.execute_query(
+            f"SELECT min(timestamp) FROM {self.table} WHERE timestamp < %s;",
+            (self.day_bounds(cutoff)[0],),
+        )
+        if not result or result[0][0] is None:
+            return []
+        day = result[0][0].astimezone(timezone.utc).date()
+        days = []
+        while day < cutoff:
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def count_rows(self, exchange, start, end):
+        result = self.db_manager.execute_query(
+            f"""
+            SELECT count(*) FROM {self.table}
+            WHERE exchange = %s AND timestamp >= %s AND timestamp < %s;
+            """,
+            (exchange, start, end),
+        )
+        return result[0][0] if result else None
+
+    def write_day(self, exchange, day, path):
+        start, end = self.day_bounds(day)
+        query = f"""
+        SELECT {", ".join(self.schema.names)} FROM {self.table}
+        WHERE exchange = %s AND timestamp >= %s AND timestamp < %s
+        ORDER BY timestamp;
+        """
+        written = 0
+        writer = None
+        try:
+            for rows in self.db_manager.stream_query(
+                query, (exchange, start, end), self.chunk_rows, name="archive_export"
+            ):
+                if writer is None:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    writer = pq.ParquetWriter(
+                        path, self.schema, compression=self.compression
+                    )
+                columns = list(zip(*rows))
+                batch = pa.RecordBatch.from_arrays(
+                    [
+                        pa.array(column, type=field.type)
+                        for column, field in zip(columns, self.schema)
+                    ],
+                    schema=self.schema,
+                )
+                writer.write_batch(batch)
+                written += len(rows)
+        finally:
+            if writer is not None:
+                writer.close()
+        return written
+
+    def export_day(self, day):
+        # Rows archived per exchange, None unless every exchange's rows for
+        # the day are archived and verified
+        verified = True
+        counts = {}
+        for exchange in EXCHANGES:
+            key = archive_key(exchange, day, self.table)
+            path = os.path.join(self.tmp_dir, key)
+            expected = self.count_rows(exchange, *self.day_bounds(day))
+            if expected is None:
+                verified = False
+                continue
+            counts[exchange] = expected
+            if expected == 0:
+                continue
+            started = datetime.now(timezone.utc)
+            written = self.write_day(exchange, day, path)
+            archived = pq.ParquetFile(path).metadata.num_rows if written else 0
+            if not (expected == written == archived):
+                print(
+                    f"Row count mismatch for {exchange} {day}: "
+                    f"table={expected} written={written} file={archived}"
+                )
+                verified = False
+                continue
+            if not self.destination.upload(path, key):
+                print(f"Upload of {key} to {self.destination} could not be verified")
+                verified = False
+                continue
+            elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+            print(
+                f"Archived {written} {exchange} rows for {day} "
+                f"({os.path.getsize(path)} bytes, {elapsed:.1f}s) to {self.destination}"
+            )
+            os.remove(path)
+        return counts if verified else None
+
+    def exported(self, day):
+        # Row counts per exchange of an earlier archive of the day, or None
+        data = self.destination.fetch(marker_key(day, self.table))
+        return None if data is None else json.loads(data)["rows"]
+
+    def mark_exported(self, day, counts):
+        key = marker_key(day, self.table)
+        path = os.path.join(self.tmp_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(
+                {"rows": counts, "exported_at": datetime.now(timezone.utc).isoformat()},
+                file,
+            )
+        uploaded = self.destination.upload(path, key)
+        os.remove(path)
+        return uploaded
+
+    def archive_day(self, day):
+        # True once the day is archived, by this run or an earlier one
+        counts = self.exported(day)
+        if counts is not None:
+            current = {
+                exchange: self.count_rows(exchange, *self.day_bounds(day))
+                for exchange in EXCHANGES
+            }
+            if current == counts:
+                print(f"{day} is already archived to {self.destination}")
+                return True
+            print(f"Rows for {day} changed since it was archived, exporting again")
+        counts = self.export_day(day)
+        if counts is None:
+            return False
+        if not self.mark_exported(day, counts):
+            print(f"Archive marker for {day} could not be verified")
+        return True
+
+    def export_coins(self):
+        key = "coins_table/coins_table.parquet"
+        path = os.path.join(self.tmp_dir, key)
+        rows = self.db_manager.execute_query(
+            f"SELECT {', '.join(COINS_SCHEMA.names)} FROM coins_table ORDER BY coin_id;"
+        )
+        if rows is None:
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        columns = list(zip(*rows)) if rows else [[] for _ in COINS_SCHEMA]
+        table = pa.Table.from_arrays(
+            [
+                pa.array(column, type=field.type)
+                for column, field in zip(columns, COINS_SCHEMA)
+            ],
+            schema=COINS_SCHEMA,
+        )
+        pq.write_table(table, path, compression=self.compression)
+        uploaded = self.destination.upload(path, key)
+        os.remove(path)
+        return uploaded
+
+    def delete_day(self, day):
+        name = self.partitions.list_partitions().get(day)
+        if name:
+            return self.partitions.drop_partition(name)
+        # No daily partition, the rows live in the default partition
+        start, end = self.day_bounds(day)
+        deleted = self.db_manager.execute_command(
+            f"DELETE FROM {self.table} WHERE timestamp >= %s AND timestamp < %s;",
+            (start, end),
+        )
+        if deleted is None:
+            return False
+        self.db_manager.commit()
+        print(f"Deleted {deleted} rows for {day}")
+        return True
+
+    def run(self, older_than_days, delete=False):
+        # A day that fails (an S3 outage, a bad file) is logged and left for
+        # the next run; the days after it are still archived and dropped
+        try:
+            self.export_coins()
+        except Exception as e:
+            print(f"Error archiving coins_table: {e}")
+        for day in self.days_to_export(older_than_days):
+            try:
+                archived = self.archive_day(day)
+            except Exception as e:
+                print(f"Error archiving {day}: {e}")
+                archived = False
+            if not delete:
+                continue
+            if not archived:
+                print(f"Keeping data for {day}: archive could not be verified")
+                continue
+            try:
+                self.delete_day(day)
+            except Exception as e:
+                print(f"Error deleting data for {day}: {e}")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Archive tick tables to compressed Parquet files."
+    )
+    parser.add_argument(
+        "days", type=int, nargs="?", default=7, help="Export data older than N days"
+    )
+    parser.add_argument(
+        "--dest", default=ARCHIVE_DEST, help="s3://bucket/prefix or a directory"
+    )
+    parser.add_argument("--chunk-rows", type=int, default=ARCHIVE_CHUNK_ROWS)
+    parser.add_argument("--compression", default=ARCHIVE_COMPRESSION)
+    parser.add_argument(
+        "--table", choices=sorted(TABLE_SCHEMAS), default="coin_data_table"
+    )
+    parser.add_argument(
+        "--delete", action="store_true", help="Delete data once it has been verified"
+    )
+    args = parser.parse_args()
+
+    db_manager = DBManager()
+    exporter = ArchiveExporter(
+        db_manager,
+        open_destination(args.dest),
+        chunk_rows=args.chunk_rows,
+        compression=args.compression,
+        table=args.table,
+    )
+    try:
+        exporter.run(args.days, delete=args.delete)
+    finally:
+        db_manager.close()
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import random
+import time
+import asyncpg
+from db_manager import (
+    DEFAULT_FLUSH_INTERVAL,
+    DEFAULT_FLUSH_SIZE,
+    LATEST_UPSERT,
+    call_on_flush,
+)
+from metrics import (
+    FLUSH_ERRORS,
+    FLUSH_ROWS,
+    FLUSH_SECONDS,
+    RECONNECTS,
+    SKIPPED_ROWS,
+)
+
+# Use the asyncpg pool from asyncio collectors instead of the blocking DBManager
+DB_ASYNC = os.getenv("DB_ASYNC", "on") != "off"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "4"))
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "5"))
+
+CONNECTION_ERRORS = (
+    OSError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+)
+ROW_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+class AsyncDBManager:
+    """
+    asyncio counterpart of DBManager backed by an asyncpg connection pool.
+    Statements go through asyncpg's per-connection prepared statement cache,
+    a background task pings the pool, and a lost database is reconnected with
+    jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        health_check_interval=DB_HEALTH_CHECK_INTERVAL,
+        max_backoff=30.0,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.max_backoff = max_backoff
+        self.pool = None
+        self.writers = []
+        self.health_task = None
+        self.reconnecting = None
+
+    async def connect(self):
+        attempt = 0
+        while True:
+            try:
+                self.pool = await asyncpg.create_pool(
+                    database=os.getenv("DB_NAME"),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    host=os.getenv("DB_HOST"),
+                    port=int(os.getenv("DB_PORT", "5432")),
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    server_settings=(
+                        {"coin_data.latest_trigger": "off"} if LATEST_UPSERT else None
+                    ),
+                )
+                print("Connected to DB (async pool)")
+                break
+            except Exception as e:
+                delay = min(self.max_backoff, 0.5 * 2**attempt)
+                delay *= random.uniform(0.5, 1.0)
+                print(f"Error connecting to DB: {e}, retrying in {delay:.1f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+        if self.health_task is None:
+            self.health_task = asyncio.create_task(self.health_check_loop())
+
+    async def reconnect(self):
+        # Concurrent failures share a single reconnect
+        if self.reconnecting is None or self.reconnecting.done():
+            self.reconnecting = asyncio.create_task(self._reconnect())
+        await asyncio.shield(self.reconnecting)
+
+    async def _reconnect(self):
+        RECONNECTS.labels("db").inc()
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.terminate()
+        await self.connect()
+
+    async def health_check_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                if self.pool is not None:
+                    await self.pool.fetchval("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"DB health check failed: {e}, reconnecting")
+                await self.reconnect()
+
+    async def close(self):
+        for writer in self.writers:
+            if writer.flush_task is not None:
+                await asyncio.gather(writer.flush_task, return_exceptions=True)
+            await writer.flush()
+        if self.health_task is not None:
+            self.health_task.cancel()
+            await asyncio.gather(self.health_task, return_exceptions=True)
+            self.health_task = None
+        if self.pool is not None:
+            await self.pool.close()
+
+    async def execute_query(self, query, *args):
+        try:
+            return await self.pool.fetch(query, *args)
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return None
+
+    def create_batch_writer(self, table, columns, **kwargs):
+        writer = AsyncBatchWriter(self, table, columns, **kwargs)
+        self.writers.append(writer)
+        return writer
+
+
+class AsyncBatchWriter:
+    """
+    Same interface as BatchWriter, but add() and flush_if_due() never block:
+    a due flush runs as a task using binary COPY on a pooled connection while
+    the event loop keeps serving the websockets.
+    """
+
+    def __init__(
+        self,
+        db_manager,
+        table,
+        columns,
+        flush_size=DEFAULT_FLUSH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        latest_store=None,
+        on_flush=None,
+        max_pending=100000,
+        spill=None,
+        notifier=None,
+    ):
+        self.db_manager = db_manager
+        self.table = table
+        self.columns = tuple(columns)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.latest_store = latest_store
+        self.on_flush = on_flush  # Called with the rows of every committed flush
+        self.max_pending = max_pending
+        self.spill = spill
+        self.notifier = notifier  # Announces the rows in the flush's transaction
+        self.rows = []
+        self.last_flush = time.monotonic()
+        self.flush_task = None
+
+    def add(self, row):
+        self.rows.append(row)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        if self.flush_task is not None and not self.flush_task.done():
+            # One flush in flight at a time keeps rows in order; rows piling
+            # up behind a slow database go to the spill buffer
+            if self.spill is not None and len(self.rows) >= self.max_pending:
+                self._spill_rows(self.rows)
+                self.rows = []
+            return
+        if len(self.rows) >= self.flush_size or (
+            self.rows and time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self):
+        rows, self.rows = self.rows, []
+        self.last_flush = time.monotonic()
+        if not rows:
+            return 0
+        pool = self.db_manager.pool
+        started = time.perf_counter()
+        try:
+            if pool is None:
+                raise ConnectionError("no database connection")
+            async with pool.acquire() as conn:
+                try:
+                    await self._write(conn, rows)
+                except ROW_ERRORS as e:
+                    print(f"Rows rejected by {self.table}: {e}, retrying row by row")
+                    FLUSH_ERRORS.labels(self.table).inc()
+                    rows = await self._write(conn, rows, row_by_row=True)
+            FLUSH_SECONDS.labels(self.table).observe(time.perf_counter() - started)
+            FLUSH_ROWS.labels(self.table).observe(len(rows))
+            if self.latest_store is not None:
+                self.latest_store.clear_dirty()
+        except Exception as e:
+            print(f"Error flushing {len(rows)} rows into {self.table}: {e}")
+            FLUSH_ERRORS.labels(self.table).inc()
+            if isinstance(e, CONNECTION_ERRORS):
+                if self.spill is not None:
+                    self._spill_rows(rows)
+                else:
+                    # Keep the rows for the next flush, bounded so an outage
+                    # cannot grow memory without limit
+                    self.rows = (rows + self.rows)[-self.max_pending :]
+                asyncio.get_running_loop().create_task(self.db_manager.reconnect())
+            return 0
+        call_on_flush(self.on_flush, self.table, rows)
+        return len(rows)
+
+    def _spill_rows(self, rows):
+        if self.latest_store is not None:
+            self.latest_store.add_rows(rows)
+        self.spill.append(rows)
+
+    async def _write(self, conn, rows, row_by_row=False):
+        # Writes the rows in one transaction, returning the ones written
+        async with conn.transaction():
+            if row_by_row:
+                rows = await self._insert_each(conn, rows)
+            else:
+                await conn.copy_records_to_table(
+                    self.table, records=rows, columns=self.columns
+                )
+            if self.latest_store is not None:
+                self.latest_store.add_rows(rows)
+                await self.upsert_latest(conn)
+            if self.notifier is not None:
+                await self.notifier.notify_async(conn, rows)
+        return rows
+
+    async def _insert_each(self, conn, rows):
+        # A nested transaction is a savepoint: a rejected row only rolls
+        # back itself
+        placeholders = ", ".join(f"${i + 1}" for i in range(len(self.columns)))
+        query = (
+            f"INSERT INTO {self.table} ({', '.join(self.columns)}) "
+            f"VALUES ({placeholders})"
+        )
+        written = []
+        for row in rows:
+            try:
+                async with conn.transaction():
+                    await conn.execute(query, *row)
+            except ROW_ERRORS as e:
+                print(f"Skipping row {row!r} of {self.table}: {e}")
+                SKIPPED_ROWS.labels(self.table).inc()
+                continue
+            written.append(row)
+        return written
+
+    async def upsert_latest(self, conn):
+        values = self.latest_store.dirty_rows()
+        if values:
+            # executemany goes through the connection's prepared statement cache
+            placeholders = ", ".join(f"${i + 1}" for i in range(len(values[0])))
+            query = self.latest_store.upsert_query(f"({placeholders})")
+            await conn.executemany(query, values)
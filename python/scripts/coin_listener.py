@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import select
+import threading
+import psycopg2
+import psycopg2.extensions
+
+COINS_CHANNEL = os.getenv("COINS_CHANNEL", "coins_changed")
+# Full resync against coins_table in case a notification was missed while the
+# listener was disconnected
+COINS_RESYNC_INTERVAL = float(os.getenv("COINS_RESYNC_INTERVAL", "3600"))
+
+
+COLLECTING_QUERY = (
+    "SELECT coin_name FROM coins_table WHERE collecting ORDER BY coin_name;"
+)
+
+
+def collecting_coins(db_manager):
+    result = db_manager.execute_query(COLLECTING_QUERY)
+    db_manager.commit()
+    return None if result is None else [coin_name for (coin_name,) in result]
+
+
+class CoinSet:
+    """
+    The set of coins a collector subscribes to. apply() takes a
+    coins_changed notification and update() a full list, and both return
+    only what changed as (added, removed). With a sharding.Shard only the
+    coins that hash to it are kept.
+    """
+
+    def __init__(self, coins=(), shard=None):
+        self.shard = shard
+        self.coins = self.owned(coins)
+
+    def __iter__(self):
+        return iter(sorted(self.coins))
+
+    def __len__(self):
+        return len(self.coins)
+
+    def owned(self, coins):
+        if self.shard is None:
+            return set(coins)
+        return {coin for coin in coins if self.shard.owns(coin)}
+
+    def update(self, coins):
+        coins = self.owned(coins)
+        added = sorted(coins - self.coins)
+        removed = sorted(self.coins - coins)
+        self.coins = coins
+        return added, removed
+
+    def apply(self, event):
+        name = event.get("coin_name")
+        old_name = event.get("old_coin_name")
+        wanted = event.get("op") != "DELETE" and bool(event.get("collecting"))
+        coins = set(self.coins)
+        if old_name and old_name != name:
+            coins.discard(old_name)  # Renamed
+        if wanted and (self.shard is None or self.shard.owns(name)):
+            coins.add(name)
+        else:
+            coins.discard(name)
+        return self.update(coins)
+
+
+class CoinListener:
+    """
+    LISTENs on COINS_CHANNEL, which the coins_table trigger in sql/init.sql
+    notifies with one JSON payload per changed row. Uses its own autocommit
+    connection; fileno() lets asyncio or select() wait on it.
+    """
+
+    def __init__(self, channel=COINS_CHANNEL):
+        self.channel = channel
+        self.conn = None
+        self.resync_due = True  # Set on every (re)connect
+
+    def connect(self):
+        try:
+            self.conn = psycopg2.connect(
+                dbname=os.getenv("DB_NAME"),
+                user=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASSWORD"),
+                host=os.getenv("DB_HOST"),
+                port=os.getenv("DB_PORT"),
+            )
+            self.conn.set_isolation_level(
+                psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+            )
+            with self.conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel};")
+            print(f"Listening for coin changes on {self.channel}")
+            self.resync_due = True
+            return True
+        except Exception as e:
+            print(f"Error connecting coin listener: {e}")
+            self.conn = None
+            return False
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def events(self):
+        # Notifications that have arrived, without blocking
+        self.conn.poll()
+        events = []
+        while self.conn.notifies:
+            notify = self.conn.notifies.pop(0)
+            try:
+                events.append(json.loads(notify.payload))
+            except ValueError:
+                print(f"Ignoring malformed coin notification: {notify.payload}")
+        return events
+
+    def collecting_coins(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute(COLLECTING_QUERY)
+            return [coin_name for (coin_name,) in cursor.fetchall()]
+
+    def wait(self, timeout):
+        # False if nothing arrived within timeout seconds
+        return bool(select.select([self.conn], [], [], timeout)[0])
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def run_listener_thread(on_events, on_resync, stop_event, channel=COINS_CHANNEL):
+    """
+    For blocking collectors: a daemon thread that calls on_events(events)
+    for every batch of notifications, and on_resync(coins) with the full
+    collecting list after (re)connecting and every COINS_RESYNC_INTERVAL
+    seconds without notifications.
+    """
+
+    def loop():
+        listener = CoinListener(channel)
+        while not stop_event.is_set():
+            if listener.conn is None:
+                if not listener.connect():
+                    stop_event.wait(5)
+                    continue
+            try:
+                if listener.resync_due:
+                    on_resync(listener.collecting_coins())
+                    listener.resync_due = False
+                if not listener.wait(COINS_RESYNC_INTERVAL):
+                    listener.resync_due = True
+                    continue
+                events = listener.events()
+                if events:
+                    on_events(events)
+            except Exception as e:
+                print(f"Coin listener error: {e}, reconnecting")
+                listener.close()
+        listener.close()
+
+    thread = threading.Thread(target=loop, name="coin-listener", daemon=True)
+    thread.start()
+    return thread
+
+
+async def listen(on_events, on_resync, channel=COINS_CHANNEL):
+    """
+    asyncio variant of run_listener_thread with coroutine callbacks; the
+    listener socket is watched with the event loop instead of a thread.
+    Connecting and the resync query block, so they run in the default
+    executor to keep the loop serving the websockets meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    listener = CoinListener(channel)
+    while True:
+        if not await loop.run_in_executor(None, listener.connect):
+            await asyncio.sleep(5)
+            continue
+        ready = asyncio.Event()
+        fd = listener.fileno()
+        loop.add_reader(fd, ready.set)
+        try:
+            while True:
+                if listener.resync_due:
+                    coins = await loop.run_in_executor(None, listener.collecting_coins)
+                    await on_resync(coins)
+                    listener.resync_due = False
+                try:
+                    await asyncio.wait_for(ready.wait(), COINS_RESYNC_INTERVAL)
+                except asyncio.TimeoutError:
+                    listener.resync_due = True
+                    continue
+                ready.clear()
+                events = listener.events()
+                if events:
+                    await on_events(events)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Coin listener error: {e}, reconnecting")
+        finally:
+            loop.remove_reader(fd)
+            listener.close()
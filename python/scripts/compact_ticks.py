@@ -0,0 +1,173 @@
+import os
+from decimal import Decimal
+from latest_store import LatestQuoteStore
+from spill_buffer import open_spill
+from tick_notify import open_tick_notifier
+
+# wide writes coin_data_table (REAL columns), compact writes coin_tick_table
+STORAGE_MODE = os.getenv("STORAGE_MODE", "wide")
+COMPACT_TABLE = "coin_tick_table"
+# Decimal places used when coins_table has no precision for the exchange
+COMPACT_PRICE_SCALE = int(os.getenv("COMPACT_PRICE_SCALE", "8"))
+COMPACT_QTY_SCALE = int(os.getenv("COMPACT_QTY_SCALE", "8"))
+
+# Largest values of the INT price and BIGINT quantity columns
+INT_MAX = 2**31 - 1
+BIGINT_MAX = 2**63 - 1
+# Below this a float product rounds to the exact integer
+EXACT_FLOAT = 2**52
+
+# Same order as coin_tick_table in sql/init.sql
+COMPACT_COLUMNS = (
+    "timestamp",
+    "coin_id",
+    "exchange",
+    "best_bid",
+    "best_ask",
+    "mark_price",
+    "last_price",
+    "best_bid_qty",
+    "best_ask_qty",
+    "price_scale",
+    "qty_scale",
+)
+PRICE_COLUMNS = ("best_bid", "best_ask", "mark_price", "last_price")
+QTY_COLUMNS = ("best_bid_qty", "best_ask_qty")
+
+
+def scale_values(values, scale, limit=INT_MAX):
+    """
+    Scale values to integers with `scale` decimal places. The scale is
+    lowered (below zero if need be) until every value is at most `limit`,
+    so a value too large for its column costs digits instead of failing the
+    flush. Products beyond float precision are scaled exactly as decimals.
+    """
+    numbers = [abs(float(value)) for value in values if value is not None]
+    largest = max(numbers, default=0)
+    while largest * 10.0**scale > limit:
+        scale -= 1
+    factor = 10.0**scale
+    if largest * factor < EXACT_FLOAT:
+        return scale, [
+            None if value is None else round(float(value) * factor) for value in values
+        ]
+    return scale, [
+        None if value is None else round(Decimal(str(value)).scaleb(scale))
+        for value in values
+    ]
+
+
+class CompactEncoder:
+    """
+    Builds coin_tick_table rows from Ticks. Prices (INT) and quantities
+    (BIGINT) are stored as integers at the exchange's precision from
+    coins_table, which is lossless for quotes on that grid; coins without
+    one use COMPACT_PRICE_SCALE and COMPACT_QTY_SCALE. Both scales are
+    stored per row, so a later precision change never reinterprets history.
+    """
+
+    def __init__(
+        self,
+        registry,
+        exchange,
+        price_scale=COMPACT_PRICE_SCALE,
+        qty_scale=COMPACT_QTY_SCALE,
+    ):
+        self.registry = registry
+        self.exchange = exchange
+        self.price_scale = price_scale
+        self.qty_scale = qty_scale
+
+    def row(self, coin_id, tick):
+        precision = self.registry.precision(coin_id, self.exchange)
+        price_scale, prices = scale_values(
+            (tick.best_bid, tick.best_ask, tick.mark_price, tick.last_price),
+            self.price_scale if precision is None else precision,
+        )
+        qty_scale, quantities = scale_values(
+            (tick.best_bid_qty, tick.best_ask_qty),
+            self.qty_scale if precision is None else precision,
+            BIGINT_MAX,
+        )
+        return (
+            tick.time,
+            coin_id,
+            self.exchange,
+            *prices,
+            *quantities,
+            price_scale,
+            qty_scale,
+        )
+
+
+class CompactLatestQuoteStore(LatestQuoteStore):
+    """
+    LatestQuoteStore for coin_tick_table rows: the scaled integers are turned
+    back into plain numbers for latest_coin_data_table.
+    """
+
+    def __init__(self, columns=COMPACT_COLUMNS):
+        super().__init__(columns)
+        scale_columns = dict.fromkeys(PRICE_COLUMNS, columns.index("price_scale"))
+        scale_columns.update(dict.fromkeys(QTY_COLUMNS, columns.index("qty_scale")))
+        self.scale_indexes = [scale_columns.get(column) for column in self.columns]
+
+    def dirty_rows(self):
+        values = []
+        for key in self.dirty:
+            row = self.quotes[key]
+            values.append(
+                tuple(
+                    (
+                        row[index]
+                        if scale is None or row[index] is None
+                        else row[index] / 10.0 ** row[scale]
+                    )
+                    for index, scale in zip(self.indexes, self.scale_indexes)
+                )
+            )
+        return values
+
+
+def tick_columns(wide_columns):
+    # Columns of the rows the collectors write in the configured STORAGE_MODE
+    return COMPACT_COLUMNS if STORAGE_MODE == "compact" else tuple(wide_columns)
+
+
+def create_tick_writer(
+    db_manager, wide_columns, latest_upsert, spill_name=None, on_flush=None
+):
+    # Batch writer for the configured STORAGE_MODE, spilling to disk under
+    # SPILL_DIR/<spill_name> while the database is unreachable and announcing
+    # its committed ticks on TICK_CHANNEL
+    if STORAGE_MODE == "compact":
+        return db_manager.create_batch_writer(
+            COMPACT_TABLE,
+            COMPACT_COLUMNS,
+            latest_store=CompactLatestQuoteStore() if latest_upsert else None,
+            on_flush=on_flush,
+            spill=(
+                open_spill(
+                    spill_name,
+                    COMPACT_TABLE,
+                    COMPACT_COLUMNS,
+                    scaled=True,
+                    on_flush=on_flush,
+                )
+                if spill_name
+                else None
+            ),
+            notifier=open_tick_notifier(COMPACT_COLUMNS),
+        )
+    return db_manager.create_batch_writer(
+        "coin_data_table",
+        wide_columns,
+        latest_store=LatestQuoteStore(wide_columns) if latest_upsert else None,
+        on_flush=on_flush,
+        spill=(
+            open_spill(spill_name, "coin_data_table", wide_columns, on_flush=on_flush)
+            if spill_name
+            else None
+        ),
+        notifier=open_tick_notifier(wide_columns),
+    )
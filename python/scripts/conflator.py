@@ -0,0 +1,94 @@
+import os
+import threading
+
+# Snapshot cadence for conflation; 0 disables it and every tick is stored
+DEFAULT_CONFLATE_INTERVAL = float(os.getenv("CONFLATE_INTERVAL_MS", "0")) / 1000
+DEFAULT_CONFLATE_SLOTS = int(os.getenv("CONFLATE_SLOTS", "4096"))
+
+
+class TickConflator:
+    """
+    Keeps only the most recent tick per (symbol, exchange) in a fixed-size
+    slot table and hands the changed slots to emit() once per interval.
+    Ticks whose version (Binance lastUpdateId, Coinex updated_at) is not newer
+    than the one already held are dropped as duplicates.
+    """
+
+    def __init__(
+        self, emit, interval=DEFAULT_CONFLATE_INTERVAL, slots=DEFAULT_CONFLATE_SLOTS
+    ):
+        self.emit = emit
+        self.interval = interval
+        self.slots = slots
+        self.index = {}
+        self.ticks = [None] * slots
+        self.versions = [None] * slots
+        self.dirty = bytearray(slots)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.offered = 0
+        self.duplicates = 0
+        self.emitted = 0
+        self.overflow = 0
+
+    def offer(self, symbol, exchange, version, tick):
+        with self.lock:
+            self.offered += 1
+            slot = self.index.get((symbol, exchange))
+            if slot is None and len(self.index) < self.slots:
+                slot = self.index[(symbol, exchange)] = len(self.index)
+            if slot is not None:
+                last = self.versions[slot]
+                if version is not None and last is not None and version <= last:
+                    self.duplicates += 1
+                    return False
+                self.versions[slot] = version
+                self.ticks[slot] = tick
+                self.dirty[slot] = 1
+                return True
+            self.overflow += 1
+        # Slot table is full, pass the tick straight through
+        self.emit(tick)
+        return True
+
+    def drain(self):
+        with self.lock:
+            used = len(self.index)
+            snapshot = [self.ticks[slot] for slot in range(used) if self.dirty[slot]]
+            self.dirty[:used] = bytes(used)
+        return snapshot
+
+    def flush(self):
+        snapshot = self.drain()
+        for tick in snapshot:
+            self.emit(tick)
+        self.emitted += len(snapshot)
+        return len(snapshot)
+
+    def stats(self):
+        return {
+            "slots_used": len(self.index),
+            "offered": self.offered,
+            "duplicates": self.duplicates,
+            "emitted": self.emitted,
+            "overflow": self.overflow,
+        }
+
+    def start(self):
+        # Thread-driven cadence for callback based collectors (websocket-client)
+        self.thread = threading.Thread(target=self._run, name="conflator", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error emitting conflated ticks: {e}")
@@ -1,11 +1,58 @@
+import base64
+import io
 import os
+import time
+from datetime import datetime
 import psycopg2
+from psycopg2.extras import execute_values
+from metrics import (
+    FLUSH_ERRORS,
+    FLUSH_ROWS,
+    FLUSH_SECONDS,
+    RECONNECTS,
+    SKIPPED_ROWS,
+)
+
+# Default batching for bulk writers, overridable per collector via env
+DEFAULT_FLUSH_SIZE = int(os.getenv("DB_FLUSH_SIZE", "500"))
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "1.0"))
+
+# When on, collectors maintain latest_coin_data_table themselves and their
+# sessions switch off the per-row update_latest_trigger (see sql/init.sql)
+LATEST_UPSERT = os.getenv("LATEST_UPSERT", "on") != "off"
+
+# After a failed flush, writers with a spill buffer (spill_buffer.py) send
+# their rows there for this long before trying the database again
+SPILL_RETRY_INTERVAL = float(os.getenv("SPILL_RETRY_INTERVAL", "5"))
+
+# Errors that mean the database is unreachable rather than the rows are bad
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+# Errors caused by the rows themselves (a value out of range, a broken
+# constraint): retrying the same statement can only fail again
+ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+# Rows per HistoryReader.page and per chunk of HistoryReader.stream
+HISTORY_PAGE_ROWS = int(os.getenv("HISTORY_PAGE_ROWS", "1000"))
+HISTORY_CHUNK_ROWS = int(os.getenv("HISTORY_CHUNK_ROWS", "10000"))
+HISTORY_COLUMNS = (
+    "data_id",
+    "coin_id",
+    "exchange",
+    "timestamp",
+    "best_bid",
+    "best_ask",
+    "best_bid_qty",
+    "best_ask_qty",
+    "mark_price",
+    "last_price",
+)
 
 
 class DBManager:
     def __init__(self):
         self.conn = None
         self.cursor = None
+        self.writers = []
         self.connect()
 
     def connect(self):
@@ -16,13 +63,27 @@ class DBManager:
                 password=os.getenv("DB_PASSWORD"),
                 host=os.getenv("DB_HOST"),
                 port=os.getenv("DB_PORT"),
+                options="-c coin_data.latest_trigger=off" if LATEST_UPSERT else None,
             )
             self.cursor = self.conn.cursor()
             print("Connected to DB")
         except Exception as e:
             print(f"Error connecting to DB: {e}")
 
+    def reconnect(self):
+        RECONNECTS.labels("db").inc()
+        try:
+            if self.conn is not None:
+                self.conn.close()
+        except Exception:
+            pass
+        self.conn = None
+        self.cursor = None
+        self.connect()
+
     def close(self):
+        for writer in self.writers:
+            writer.flush()
         if self.cursor:
             self.cursor.close()
         if self.conn:
@@ -37,9 +98,358 @@ class DBManager:
             self.conn.rollback()  # Rollback the transaction on error
             return None
 
+    def execute_command(self, query, params=None):
+        # For statements without a result set (DDL, UPDATE, DELETE)
+        try:
+            self.cursor.execute(query, params)
+            return self.cursor.rowcount
+        except Exception as e:
+            print(f"Error executing command: {e}")
+            self.conn.rollback()  # Rollback the transaction on error
+            return None
+
+    def stream_query(self, query, params=None, chunk_size=10000, name="stream"):
+        # Server-side (named) cursor: yields lists of at most chunk_size rows
+        # so large result sets never have to fit in memory at once
+        try:
+            with self.conn.cursor(name=name) as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+        finally:
+            self.conn.commit()  # End the transaction the named cursor opened
+
     def commit(self):
         try:
             self.conn.commit()
         except Exception as e:
             print(f"Error committing transaction: {e}")
             self.conn.rollback()  # Rollback the transaction on error
+
+    def create_batch_writer(self, table, columns, **kwargs):
+        writer = BatchWriter(self, table, columns, **kwargs)
+        self.writers.append(writer)
+        return writer
+
+
+def encode_history_token(timestamp, data_id):
+    # Opaque continuation token: the (timestamp, data_id) of the last row read
+    key = f"{timestamp.isoformat()}|{data_id}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_history_token(token):
+    try:
+        timestamp, data_id = base64.urlsafe_b64decode(token).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(data_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid history token: {token!r}") from e
+
+
+class HistoryReader:
+    """
+    Time-range reads of coin_data_table in (timestamp, data_id) order. Each
+    call continues after the row a token points at instead of skipping an
+    OFFSET, so with coin_id and exchange given every page or chunk is one
+    range scan of coin_data_coin_exchange_timestamp_idx, however deep it is.
+    Wider reads use the BRIN index on timestamp to find the range. Use a
+    DBManager of its own: the streaming cursor holds a transaction open.
+    """
+
+    def __init__(self, db_manager, columns=HISTORY_COLUMNS):
+        if "data_id" not in columns or "timestamp" not in columns:
+            raise ValueError("History reads need data_id and timestamp columns")
+        self.db_manager = db_manager
+        self.columns = tuple(columns)
+        self.id_index = self.columns.index("data_id")
+        self.timestamp_index = self.columns.index("timestamp")
+        self.streams = 0
+
+    def query(
+        self,
+        coin_id=None,
+        exchange=None,
+        start=None,
+        end=None,
+        after=None,
+        descending=False,
+        limit=None,
+    ):
+        conditions, params = [], []
+        if coin_id is not None:
+            conditions.append("coin_id = %s")
+            params.append(coin_id)
+        if exchange is not None:
+            conditions.append("exchange = %s")
+            params.append(exchange)
+        if start is not None:
+            conditions.append("timestamp >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < %s")
+            params.append(end)
+        if after is not None:
+            # The plain timestamp bound is what the indexes can use; data_id
+            # only orders rows that share a timestamp
+            timestamp, data_id = decode_history_token(after)
+            op = "<" if descending else ">"
+            conditions.append(
+                f"timestamp {op}= %s AND (timestamp {op} %s OR data_id {op} %s)"
+            )
+            params.extend((timestamp, timestamp, data_id))
+        order = "DESC" if descending else "ASC"
+        query = (
+            f"SELECT {', '.join(self.columns)} FROM coin_data_table"
+            f" WHERE {' AND '.join(conditions) or 'TRUE'}"
+            f" ORDER BY timestamp {order}, data_id {order}"
+        )
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit)
+        return query, params
+
+    def token(self, row):
+        return encode_history_token(row[self.timestamp_index], row[self.id_index])
+
+    def page(
+        self,
+        coin_id=None,
+        exchange=None,
+        start=None,
+        end=None,
+        after=None,
+        descending=False,
+        limit=HISTORY_PAGE_ROWS,
+    ):
+        """
+        One page of at most `limit` rows and the token for the next one,
+        None once the range is exhausted. Database errors are raised rather
+        than returned as an empty last page.
+        """
+        if limit < 1:
+            raise ValueError(f"History page limit must be at least 1, got {limit}")
+        query, params = self.query(
+            coin_id, exchange, start, end, after, descending, limit
+        )
+        conn = self.db_manager.conn
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+        except Exception:
+            conn.rollback()
+            raise
+        return rows, self.token(rows[-1]) if rows and len(rows) == limit else None
+
+    def stream(
+        self,
+        coin_id=None,
+        exchange=None,
+        start=None,
+        end=None,
+        after=None,
+        descending=False,
+        chunk_size=HISTORY_CHUNK_ROWS,
+    ):
+        """
+        Yields (rows, token) chunks of the whole range from one server-side
+        cursor; a reader that stops can pick up later with after=token.
+        """
+        query, params = self.query(coin_id, exchange, start, end, after, descending)
+        self.streams += 1
+        # Named per stream: cursors on one connection must not share a name
+        name = f"history_{id(self)}_{self.streams}"
+        for rows in self.db_manager.stream_query(query, params, chunk_size, name):
+            yield rows, self.token(rows[-1])
+
+
+class BatchWriter:
+    """
+    Buffers rows in memory and writes them in a single statement and commit,
+    either through COPY ... FROM STDIN or a multi-row INSERT (execute_values).
+    A flush happens once flush_size rows are buffered or flush_interval
+    seconds have passed since the last one, whichever comes first. A batch
+    the database rejects because of its data is retried row by row, so only
+    the offending rows are dropped. With a spill buffer, rows that could not
+    reach the database go to disk instead of being lost.
+    """
+
+    def __init__(
+        self,
+        db_manager,
+        table,
+        columns,
+        flush_size=DEFAULT_FLUSH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        method="copy",
+        template=None,
+        latest_store=None,
+        on_flush=None,
+        spill=None,
+        notifier=None,
+    ):
+        if method not in ("copy", "values"):
+            raise ValueError(f"Unknown batch write method: {method}")
+        if method == "copy" and template is not None:
+            raise ValueError("A row template is only supported with method='values'")
+        self.db_manager = db_manager
+        self.table = table
+        self.columns = tuple(columns)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.method = method
+        self.template = template
+        self.latest_store = latest_store
+        self.on_flush = on_flush  # Called with the rows of every committed flush
+        self.spill = spill
+        self.notifier = notifier  # Announces the rows in the flush's transaction
+        self.failed_at = None
+        self.last_error = None  # Of the last flush, None once one succeeds
+        self.rows = []
+        self.last_flush = time.monotonic()
+
+    def add(self, row):
+        self.rows.append(row)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        if len(self.rows) >= self.flush_size or (
+            self.rows and time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        rows, self.rows = self.rows, []
+        self.last_flush = time.monotonic()
+        if not rows:
+            return 0
+        if (
+            self.spill is not None
+            and self.failed_at is not None
+            and self.last_flush - self.failed_at < SPILL_RETRY_INTERVAL
+        ):
+            self._spill_rows(rows)
+            return 0
+        conn = self.db_manager.conn
+        started = time.perf_counter()
+        try:
+            if conn is None or conn.closed:
+                raise psycopg2.InterfaceError("no database connection")
+            try:
+                self._write(conn, rows)
+            except ROW_ERRORS as e:
+                print(f"Rows rejected by {self.table}: {e}, retrying row by row")
+                FLUSH_ERRORS.labels(self.table).inc()
+                conn.rollback()
+                rows = self._write(conn, rows, row_by_row=True)
+            FLUSH_SECONDS.labels(self.table).observe(time.perf_counter() - started)
+            FLUSH_ROWS.labels(self.table).observe(len(rows))
+            if self.latest_store is not None:
+                self.latest_store.clear_dirty()
+            self.failed_at = None
+            self.last_error = None
+        except Exception as e:
+            print(f"Error flushing {len(rows)} rows into {self.table}: {e}")
+            self.last_error = e
+            FLUSH_ERRORS.labels(self.table).inc()
+            if isinstance(e, CONNECTION_ERRORS):
+                self.db_manager.reconnect()
+            elif not conn.closed:
+                conn.rollback()  # Rollback the transaction on error
+            if self.spill is not None and isinstance(e, CONNECTION_ERRORS):
+                self.failed_at = self.last_flush
+                self._spill_rows(rows)
+            return 0
+        call_on_flush(self.on_flush, self.table, rows)
+        return len(rows)
+
+    def _write(self, conn, rows, row_by_row=False):
+        # Writes and commits the rows, returning the ones that were written
+        with conn.cursor() as cursor:
+            if row_by_row:
+                rows = self._insert_each(cursor, rows)
+            elif self.method == "copy":
+                self._copy_rows(cursor, rows)
+            else:
+                self._insert_rows(cursor, rows)
+            if self.latest_store is not None:
+                self.latest_store.add_rows(rows)
+                self.latest_store.upsert(cursor)
+            if self.notifier is not None:
+                self.notifier.notify(cursor, rows)
+        conn.commit()
+        return rows
+
+    def _spill_rows(self, rows):
+        if self.latest_store is not None:
+            # Still tracked, so the next successful flush upserts them
+            self.latest_store.add_rows(rows)
+        self.spill.append(rows)
+
+    def _copy_rows(self, cursor, rows):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(_copy_value(value) for value in row))
+            buffer.write("\n")
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {self.table} ({', '.join(self.columns)}) FROM STDIN",
+            buffer,
+        )
+
+    def _insert_each(self, cursor, rows):
+        # One INSERT per row behind a savepoint, so a rejected row only
+        # rolls back itself and the rest commit together
+        query = f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES %s"
+        written = []
+        for row in rows:
+            cursor.execute("SAVEPOINT batch_row")
+            try:
+                execute_values(cursor, query, [row], template=self.template)
+            except ROW_ERRORS as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT batch_row")
+                print(f"Skipping row {row!r} of {self.table}: {e}")
+                SKIPPED_ROWS.labels(self.table).inc()
+                continue
+            cursor.execute("RELEASE SAVEPOINT batch_row")
+            written.append(row)
+        return written
+
+    def _insert_rows(self, cursor, rows):
+        execute_values(
+            cursor,
+            f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES %s",
+            rows,
+            template=self.template,
+            page_size=len(rows),
+        )
+
+
+def call_on_flush(on_flush, table, rows):
+    # Outside the flush's error handling: the rows are committed by now, so
+    # a failing callback must not be counted or retried as a failed flush
+    if on_flush is None:
+        return
+    try:
+        on_flush(rows)
+    except Exception as e:
+        print(f"Error in flush callback of {table}: {e}")
+
+
+def _copy_value(value):
+    # Serialise a value for COPY's text format
+    if value is None:
+        return "\\N"
+    if isinstance(value, float):
+        return repr(value)
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
@@ -0,0 +1,171 @@
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+
+# JSON backend for exchange payloads: auto picks orjson, then msgspec, then json
+JSON_DECODER = os.getenv("JSON_DECODER", "auto")
+
+# 16 + MAX_WBITS: expect a gzip header, like gzip.decompress
+GZIP_WBITS = 31
+
+
+def load_backend(name=JSON_DECODER):
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+
+            return "orjson", orjson.loads
+        except ImportError:
+            if name == "orjson":
+                raise
+    if name in ("auto", "msgspec"):
+        try:
+            import msgspec
+
+            return "msgspec", msgspec.json.Decoder().decode
+        except ImportError:
+            if name == "msgspec":
+                raise
+    if name not in ("auto", "json"):
+        raise ValueError(f"Unknown JSON decoder: {name}")
+    # json.loads takes bytes as well, so there is no separate utf-8 decode step
+    return "json", json.loads
+
+
+JSON_BACKEND, loads = load_backend()
+
+
+def inflate(frame):
+    # Each Coinex frame is a complete gzip member; one zlib call skips the
+    # Python-level member loop of gzip.decompress
+    return zlib.decompress(frame, GZIP_WBITS)
+
+
+class Tick:
+    """
+    Top of book for one symbol as it arrives from an exchange. timestamp is
+    the exchange event time in epoch milliseconds and version the value used
+    to drop stale duplicates (Binance update id, Coinex updated_at).
+    """
+
+    __slots__ = (
+        "symbol",
+        "exchange",
+        "timestamp",
+        "best_bid",
+        "best_ask",
+        "best_bid_qty",
+        "best_ask_qty",
+        "mark_price",
+        "last_price",
+        "version",
+    )
+
+    def __init__(
+        self,
+        symbol,
+        exchange,
+        timestamp,
+        best_bid,
+        best_ask,
+        best_bid_qty,
+        best_ask_qty,
+        mark_price=None,
+        last_price=None,
+        version=None,
+    ):
+        self.symbol = symbol
+        self.exchange = exchange
+        self.timestamp = timestamp
+        self.best_bid = best_bid
+        self.best_ask = best_ask
+        self.best_bid_qty = best_bid_qty
+        self.best_ask_qty = best_ask_qty
+        self.mark_price = mark_price
+        self.last_price = last_price
+        self.version = version
+
+    @property
+    def time(self):
+        return datetime.fromtimestamp(self.timestamp / 1000, timezone.utc)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"Tick({fields})"
+
+
+def coinex_tick(frame):
+    """
+    Decode a gzip bbo.update frame into a Tick, or None for other messages.
+    Prices stay as the exchange's decimal strings: the COPY writer sends them
+    as text anyway, so parsing them to float here would be wasted work.
+    """
+    message = loads(inflate(frame))
+    data = message.get("data")
+    if not data or "market" not in data:
+        return None
+    return Tick(
+        data["market"],
+        "COINEX",
+        data["updated_at"],
+        data["best_bid_price"],
+        data["best_ask_price"],
+        data["best_bid_size"],
+        data["best_ask_size"],
+        version=data["updated_at"],
+    )
+
+
+def coinex_depth_tick(data):
+    """
+    Top of book from a /v2/futures/depth REST response (the data object),
+    used to fill gaps after a reconnect; None if a side of the book is empty.
+    """
+    depth = data["depth"]
+    if not depth.get("bids") or not depth.get("asks"):
+        return None
+    (bid, bid_size), (ask, ask_size) = depth["bids"][0][:2], depth["asks"][0][:2]
+    return Tick(
+        data["market"],
+        "COINEX",
+        depth["updated_at"],
+        bid,
+        ask,
+        bid_size,
+        ask_size,
+        last_price=depth.get("last"),
+        version=depth["updated_at"],
+    )
+
+
+def binance_tick(data, mark_price=None):
+    # bookTicker event from the combined stream
+    return Tick(
+        data["s"],
+        "BINANCE",
+        data.get("T", 0),
+        float(data["b"]),
+        float(data["a"]),
+        float(data["B"]),
+        float(data["A"]),
+        mark_price,
+        mark_price,
+        data.get("u", 0),
+    )
+
+
+def binance_rest_tick(book_ticker, mark_price=None):
+    # /fapi/v1/ticker/bookTicker response
+    return Tick(
+        book_ticker["symbol"],
+        "BINANCE",
+        book_ticker.get("time", 0),
+        float(book_ticker.get("bidPrice", 0)),
+        float(book_ticker.get("askPrice", 0)),
+        float(book_ticker.get("bidQty", 0)),
+        float(book_ticker.get("askQty", 0)),
+        mark_price,
+        mark_price,
+        book_ticker.get("lastUpdateId", 0),
+    )
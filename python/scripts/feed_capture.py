@@ -0,0 +1,170 @@
+import glob
+import gzip
+import heapq
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from metrics import REGISTRY, Counter
+
+# Raw exchange frames are recorded here when set (see feed_replay.py)
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "")
+CAPTURE_SEGMENT_BYTES = int(os.getenv("CAPTURE_SEGMENT_BYTES", str(256 * 1024 * 1024)))
+CAPTURE_SEGMENT_SECONDS = float(os.getenv("CAPTURE_SEGMENT_SECONDS", "3600"))
+CAPTURE_COMPRESSLEVEL = int(os.getenv("CAPTURE_COMPRESSLEVEL", "1"))
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "100000"))
+
+MAGIC = b"FEEDCAP1"
+# Receive time (epoch ns), frame type, payload length
+RECORD = struct.Struct("<qBI")
+TEXT = 0
+BINARY = 1
+
+CAPTURED = REGISTRY.register(
+    Counter("collector_captured_frames", "Raw frames captured or dropped", ["result"])
+)
+captured = CAPTURED.labels("captured")
+capture_dropped = CAPTURED.labels("dropped")
+
+
+class FeedCapture:
+    """
+    Records raw websocket frames with their receive time into gzip segment
+    files <directory>/<name>-<start>-<n>.cap.gz, each starting with MAGIC and
+    a JSON header. write() only timestamps and queues the frame; a
+    background thread compresses, so capturing never slows the feed down. A
+    full queue drops frames (counted) rather than blocking.
+    """
+
+    def __init__(
+        self,
+        directory,
+        name,
+        segment_bytes=CAPTURE_SEGMENT_BYTES,
+        segment_seconds=CAPTURE_SEGMENT_SECONDS,
+        compresslevel=CAPTURE_COMPRESSLEVEL,
+    ):
+        self.directory = directory
+        self.name = name
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.compresslevel = compresslevel
+        self.queue = queue.Queue(CAPTURE_QUEUE_SIZE)
+        self.file = None
+        self.sequence = 0
+        self.written = 0
+        self.opened_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(
+            target=self.run, name=f"capture-{name}", daemon=True
+        )
+        self.thread.start()
+
+    def write(self, payload):
+        try:
+            self.queue.put_nowait((time.time_ns(), payload))
+        except queue.Full:
+            capture_dropped.inc()
+
+    def _open(self):
+        self.sequence += 1
+        started = datetime.now(timezone.utc)
+        path = os.path.join(
+            self.directory,
+            f"{self.name}-{started:%Y%m%dT%H%M%S}-{self.sequence:04d}.cap.gz",
+        )
+        self.file = gzip.open(path, "wb", compresslevel=self.compresslevel)
+        header = json.dumps({"name": self.name, "started": started.isoformat()})
+        self.file.write(MAGIC + struct.pack("<H", len(header)) + header.encode())
+        self.written = 0
+        self.opened_at = time.monotonic()
+        print(f"Capturing {self.name} frames to {path}")
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            recv_ns, payload = item
+            if (
+                self.file is None
+                or self.written >= self.segment_bytes
+                or time.monotonic() - self.opened_at >= self.segment_seconds
+            ):
+                self._close()
+                self._open()
+            if isinstance(payload, str):
+                kind, payload = TEXT, payload.encode()
+            else:
+                kind = BINARY
+            self.file.write(RECORD.pack(recv_ns, kind, len(payload)))
+            self.file.write(payload)
+            self.written += RECORD.size + len(payload)
+            captured.inc()
+        self._close()
+
+    def close(self):
+        # Writes out what is queued and closes the current segment
+        self.queue.put(None)
+        self.thread.join()
+
+
+def open_capture(name):
+    # FeedCapture under CAPTURE_DIR, or None when capturing is off
+    return FeedCapture(CAPTURE_DIR, name) if CAPTURE_DIR else None
+
+
+def capture_files(paths):
+    """
+    Capture files from files, directories or globs, by name: a collector's
+    segments are named after their start time.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "*.cap.gz")))
+        else:
+            files.extend(glob.glob(path) or [path])
+    return sorted(files, key=os.path.basename)
+
+
+def read_capture(path):
+    """
+    Yields (recv_ns, payload) from one capture file; text frames come back
+    as str and binary ones as bytes. A segment cut short by a crash ends at
+    its last complete frame.
+    """
+    with gzip.open(path, "rb") as file:
+        try:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a feed capture")
+            (length,) = struct.unpack("<H", file.read(2))
+            file.read(length)
+            while True:
+                head = file.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    return
+                recv_ns, kind, length = RECORD.unpack(head)
+                payload = file.read(length)
+                if len(payload) < length:
+                    return
+                yield recv_ns, payload.decode() if kind == TEXT else payload
+        except (EOFError, zlib.error) as e:
+            print(f"{path} ends early: {e}")
+
+
+def read_captures(paths):
+    # Frames of all files in receive order, so the shards of one run interleave
+    return heapq.merge(
+        *(read_capture(path) for path in capture_files(paths)),
+        key=lambda frame: frame[0],
+    )
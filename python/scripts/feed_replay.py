@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import math
+import time
+from dotenv import load_dotenv
+import feed_capture
+import quote_board
+import spill_buffer
+from db_manager import DBManager
+from feed_capture import capture_files, read_captures
+from metrics import start_metrics_server
+from ws_binance import BinanceStreamTicker
+from ws_coinex import CoinexWebSocket
+
+# Replayed Binance frames between writer flush checks
+FLUSH_EVERY = 1000
+
+
+def parse_speed(value):
+    # "max" replays without waiting, a number scales the recorded pacing
+    if value == "max":
+        return math.inf
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError(f"Speed must be positive, got {value}")
+    return speed
+
+
+class Pacer:
+    """
+    Spaces replayed frames like they were received, `speed` times faster,
+    measured from the first frame so a slow handler does not add up drift.
+    """
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.first_ns = None
+        self.started = 0.0
+
+    def delay(self, recv_ns):
+        if self.speed == math.inf:
+            return 0.0
+        if self.first_ns is None:
+            self.first_ns = recv_ns
+            self.started = time.monotonic()
+            return 0.0
+        due = (recv_ns - self.first_ns) / 1e9 / self.speed
+        return due - (time.monotonic() - self.started)
+
+
+def replay_coinex(paths, speed):
+    db_manager = DBManager()
+    collector = CoinexWebSocket(None, None, db_manager)
+    collector.start_pipeline()
+    pacer = Pacer(speed)
+    frames = 0
+    try:
+        for recv_ns, frame in read_captures(paths):
+            delay = pacer.delay(recv_ns)
+            if delay > 0:
+                time.sleep(delay)
+            collector.on_message(None, frame)
+            frames += 1
+    finally:
+        collector.stop()
+        db_manager.close()
+    return frames
+
+
+async def replay_binance(paths, speed):
+    collector = BinanceStreamTicker()
+    await collector.connect_db()
+    conflation = collector.start_conflation()
+    pacer = Pacer(speed)
+    frames = 0
+    try:
+        for recv_ns, frame in read_captures(paths):
+            delay = pacer.delay(recv_ns)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            collector.on_frame(frame)
+            frames += 1
+            if frames % FLUSH_EVERY == 0:
+                collector.writer.flush_if_due()
+                await asyncio.sleep(0)  # Lets async flushes run
+        collector.writer.flush_if_due()
+    finally:
+        await collector.stop_conflation(conflation)
+        await collector.close_db()
+    return frames
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Feed captured exchange frames through a collector offline."
+    )
+    parser.add_argument("collector", choices=["coinex", "binance"])
+    parser.add_argument(
+        "paths", nargs="+", help="Capture files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "--speed",
+        type=parse_speed,
+        default=1.0,
+        help="1 for recorded pace, N for N times faster, max for no waiting",
+    )
+    args = parser.parse_args()
+    if not capture_files(args.paths):
+        parser.error("No capture files found")
+
+    # A replay is not captured again, and must not open the live collector's
+    # spill directory (its replayer would take over segments still written)
+    # or publish historical quotes to the live board
+    feed_capture.CAPTURE_DIR = ""
+    spill_buffer.SPILL_DIR = ""
+    quote_board.QUOTE_BOARD_DIR = ""
+    start_metrics_server()
+    started = time.monotonic()
+    if args.collector == "coinex":
+        frames = replay_coinex(args.paths, args.speed)
+    else:
+        frames = asyncio.run(replay_binance(args.paths, args.speed))
+    elapsed = time.monotonic() - started
+    print(f"Replayed {frames} frames in {elapsed:.1f}s")
@@ -1,15 +1,22 @@
 # Import the get_coins function from the coin_manager module
 from coin_list import get_coins
+from quote_board import QuoteBoard
 import time
 
 
 def trading_logic():
+    # Latest quotes published by the collectors, read without the DB
+    board = QuoteBoard()
     while True:
         # Access the cached coin list
         coin_list = get_coins()
         print(f"Using the following coin list: {coin_list}")
+        board.refresh()  # The only filesystem access per pass
+        quotes = {coin: board.quotes(coin) for coin in coin_list}
+        quoted = [coin for coin, exchanges in quotes.items() if len(exchanges) > 1]
+        print(f"Quoted on both exchanges: {quoted}")
 
-        # Your trading logic here using coin_list
+        # Your trading logic here using coin_list and quotes
         # ...
 
         time.sleep(0.1)  # Run every 100ms
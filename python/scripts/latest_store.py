@@ -0,0 +1,75 @@
+from psycopg2.extras import execute_values
+
+LATEST_COLUMNS = (
+    "coin_id",
+    "timestamp",
+    "best_bid",
+    "best_ask",
+    "best_bid_qty",
+    "best_ask_qty",
+    "mark_price",
+    "last_price",
+    "updated_at",
+    "exchange",
+)
+
+
+class LatestQuoteStore:
+    """
+    Newest coin_data_table row per (coin_id, exchange), kept in memory and
+    written to latest_coin_data_table with one multi-row upsert per flush.
+    Replaces the per-row update_latest_trigger for collectors that disable it.
+    """
+
+    def __init__(self, columns):
+        # Only the columns the writer actually sends; anything else keeps its default
+        self.columns = [column for column in LATEST_COLUMNS if column in columns]
+        self.indexes = [columns.index(column) for column in self.columns]
+        self.coin_index = columns.index("coin_id")
+        self.exchange_index = columns.index("exchange")
+        self.timestamp_index = columns.index("timestamp")
+        self.quotes = {}
+        self.dirty = set()
+
+    def add_rows(self, rows):
+        for row in rows:
+            key = (row[self.coin_index], row[self.exchange_index])
+            current = self.quotes.get(key)
+            timestamp = row[self.timestamp_index]
+            if current is None or current[self.timestamp_index] <= timestamp:
+                self.quotes[key] = row
+                self.dirty.add(key)
+
+    def get(self, coin_id, exchange):
+        return self.quotes.get((coin_id, exchange))
+
+    def dirty_rows(self):
+        return [
+            tuple(self.quotes[key][index] for index in self.indexes)
+            for key in self.dirty
+        ]
+
+    def upsert_query(self, values_clause):
+        # data_id is not known with COPY; writing EXCLUDED.data_id would set
+        # it to NULL, so an existing row keeps the one it had
+        updated = [c for c in self.columns if c not in ("coin_id", "exchange")]
+        if "updated_at" not in updated:
+            updated.append("updated_at")
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in updated)
+        return f"""
+        INSERT INTO latest_coin_data_table ({", ".join(self.columns)})
+        VALUES {values_clause}
+        ON CONFLICT (coin_id, exchange) DO UPDATE SET {updates}
+        WHERE latest_coin_data_table.timestamp <= EXCLUDED.timestamp;
+        """
+
+    def upsert(self, cursor):
+        values = self.dirty_rows()
+        if values:
+            execute_values(
+                cursor, self.upsert_query("%s"), values, page_size=len(values)
+            )
+        return len(values)
+
+    def clear_dirty(self):
+        self.dirty.clear()
@@ -0,0 +1,276 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 0 disables the endpoint
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "1000"))
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s - %(levelname)s - %(message)s")
+
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def _label_text(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, child in list(self.children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}_total{self._label_text(values)} {child.value}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.callbacks = {}
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function, *values):
+        # Evaluated on every scrape, e.g. a queue's current depth
+        self.callbacks[values] = function
+
+    def render(self):
+        for values, function in list(self.callbacks.items()):
+            try:
+                self.labels(*values).set(function())
+            except Exception as e:
+                logging.warning(f"Error evaluating gauge {self.name}: {e}")
+        return super().render()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_text(values)} {child.value}"]
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            labels = self._label_text(values, ("le", le))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {child.sum}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+MESSAGES_RECEIVED = REGISTRY.register(
+    Counter("collector_messages_received", "Exchange messages received", ["exchange"])
+)
+DECODE_SECONDS = REGISTRY.register(
+    Histogram("collector_decode_seconds", "Time to decode a message", ["exchange"])
+)
+EXCHANGE_LAG_SECONDS = REGISTRY.register(
+    Histogram(
+        "collector_exchange_lag_seconds",
+        "Exchange event time to local receive time",
+        ["exchange"],
+    )
+)
+QUEUE_WAIT_SECONDS = REGISTRY.register(
+    Histogram("collector_queue_wait_seconds", "Time ticks spend queued", ["queue"])
+)
+QUEUE_DEPTH = REGISTRY.register(
+    Gauge("collector_queue_depth", "Ticks waiting in the queue", ["queue"])
+)
+QUEUE_DROPPED = REGISTRY.register(
+    Gauge("collector_queue_dropped", "Ticks dropped by backpressure", ["queue"])
+)
+FLUSH_SECONDS = REGISTRY.register(
+    Histogram("collector_db_flush_seconds", "Duration of a DB batch flush", ["table"])
+)
+FLUSH_ROWS = REGISTRY.register(
+    Histogram(
+        "collector_db_flush_rows", "Rows per DB batch flush", ["table"], SIZE_BUCKETS
+    )
+)
+FLUSH_ERRORS = REGISTRY.register(
+    Counter("collector_db_flush_errors", "Failed DB batch flushes", ["table"])
+)
+SKIPPED_ROWS = REGISTRY.register(
+    Counter(
+        "collector_db_skipped_rows", "Rows the database rejected, dropped", ["table"]
+    )
+)
+RECONNECTS = REGISTRY.register(
+    Counter("collector_reconnects", "Websocket and DB reconnects", ["target"])
+)
+
+
+def observe_lag(exchange, event_time_ms):
+    if event_time_ms:
+        EXCHANGE_LAG_SECONDS.labels(exchange).observe(
+            max(0.0, time.time() - event_time_ms / 1000)
+        )
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would otherwise log every request
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.warning(f"Could not start metrics endpoint on port {port}: {e}")
+        return None
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logging.info(f"Metrics available on http://{host}:{port}/metrics")
+    return server
+
+
+class SampledLogger:
+    """
+    Debug logging for per-tick events: only every `every`-th call is
+    formatted and logged, and nothing at all unless DEBUG is enabled.
+    """
+
+    def __init__(self, name, every=LOG_SAMPLE_EVERY):
+        self.logger = logging.getLogger(name)
+        self.every = max(1, every)
+        self.calls = 0
+
+    def debug(self, message, *args):
+        self.calls += 1
+        if self.calls % self.every == 0 and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(message, *args)
@@ -0,0 +1,162 @@
+import argparse
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from db_manager import DBManager
+
+PARTITION_DAYS_AHEAD = int(os.getenv("PARTITION_DAYS_AHEAD", "3"))
+# Unset keeps every partition; expired data is only dropped when asked for
+PARTITION_RETENTION_DAYS = os.getenv("PARTITION_RETENTION_DAYS")
+if PARTITION_RETENTION_DAYS:
+    PARTITION_RETENTION_DAYS = int(PARTITION_RETENTION_DAYS)
+else:
+    PARTITION_RETENTION_DAYS = None
+PARTITION_CHECK_INTERVAL = int(os.getenv("PARTITION_CHECK_INTERVAL", "3600"))
+PARTITIONED_TABLES = ("coin_data_table", "coin_tick_table", "coin_bar_1s")
+
+
+class PartitionManager:
+    """
+    Maintains the daily range partitions of a tick table: creates the
+    upcoming ones ahead of time and detaches and drops the ones that fall
+    out of the retention window, so retention never deletes rows one by one.
+    """
+
+    def __init__(self, db_manager, table="coin_data_table"):
+        self.db_manager = db_manager
+        self.table = table
+        self.name_pattern = re.compile(rf"^{table}_p(\d{{8}})$")
+
+    def exists(self):
+        result = self.db_manager.execute_query(
+            "SELECT to_regclass(%s) IS NOT NULL;", (self.table,)
+        )
+        return bool(result and result[0][0])
+
+    def is_partitioned(self):
+        result = self.db_manager.execute_query(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table"
+            " WHERE partrelid = to_regclass(%s));",
+            (self.table,),
+        )
+        return bool(result and result[0][0])
+
+    def partition_name(self, day):
+        return f"{self.table}_p{day:%Y%m%d}"
+
+    def list_partitions(self):
+        query = """
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s;
+        """
+        result = self.db_manager.execute_query(query, (self.table,))
+        partitions = {}
+        for (name,) in result or []:
+            match = self.name_pattern.match(name)
+            if match:
+                day = datetime.strptime(match.group(1), "%Y%m%d").date()
+                partitions[day] = name
+        return partitions
+
+    def create_partition(self, day):
+        start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {self.partition_name(day)}
+        PARTITION OF {self.table}
+        FOR VALUES FROM (%s) TO (%s);
+        """
+        params = (start, start + timedelta(days=1))
+        if self.db_manager.execute_command(query, params) is None:
+            return False
+        self.db_manager.commit()
+        print(f"Created partition {self.partition_name(day)}")
+        return True
+
+    def drop_partition(self, name):
+        for query in (
+            f"ALTER TABLE {self.table} DETACH PARTITION {name};",
+            f"DROP TABLE {name};",
+        ):
+            if self.db_manager.execute_command(query) is None:
+                return False
+        self.db_manager.commit()
+        print(f"Dropped partition {name}")
+        return True
+
+    def ensure_partitions(self, days_ahead=PARTITION_DAYS_AHEAD, today=None):
+        today = today or datetime.now(timezone.utc).date()
+        existing = self.list_partitions()
+        created = []
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            if day not in existing and self.create_partition(day):
+                created.append(day)
+        return created
+
+    def drop_expired(self, retention_days, today=None):
+        today = today or datetime.now(timezone.utc).date()
+        cutoff = today - timedelta(days=retention_days)
+        dropped = []
+        for day, name in sorted(self.list_partitions().items()):
+            # A partition expires once its whole day is older than the cutoff
+            if day < cutoff and self.drop_partition(name):
+                dropped.append(day)
+        return dropped
+
+    def default_partition_rows(self):
+        result = self.db_manager.execute_query(
+            f"SELECT count(*) FROM {self.table}_default;"
+        )
+        return result[0][0] if result else 0
+
+    def run(
+        self, days_ahead=PARTITION_DAYS_AHEAD, retention_days=PARTITION_RETENTION_DAYS
+    ):
+        self.ensure_partitions(days_ahead)
+        if retention_days is not None:
+            self.drop_expired(retention_days)
+        rows = self.default_partition_rows()
+        if rows:
+            print(f"Warning: {rows} rows landed in {self.table}_default")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Create upcoming and drop expired tick table partitions."
+    )
+    parser.add_argument(
+        "--tables", nargs="+", default=PARTITIONED_TABLES, help="Partitioned tables"
+    )
+    parser.add_argument("--days-ahead", type=int, default=PARTITION_DAYS_AHEAD)
+    parser.add_argument("--retention-days", type=int, default=PARTITION_RETENTION_DAYS)
+    parser.add_argument(
+        "--loop", action="store_true", help="Keep running every check interval"
+    )
+    args = parser.parse_args()
+
+    db_manager = DBManager()
+    managers = [PartitionManager(db_manager, table) for table in args.tables]
+    # Databases created before a table was added simply do not manage it
+    managers = [manager for manager in managers if manager.exists()]
+    unpartitioned = [m.table for m in managers if not m.is_partitioned()]
+    if unpartitioned:
+        db_manager.close()
+        raise SystemExit(
+            f"{', '.join(unpartitioned)} not partitioned: the database predates"
+            " partitioning, upgrade it with sql/migrate.sql"
+        )
+    try:
+        while True:
+            for manager in managers:
+                manager.run(args.days_ahead, args.retention_days)
+            if not args.loop:
+                break
+            time.sleep(PARTITION_CHECK_INTERVAL)
+    finally:
+        db_manager.close()
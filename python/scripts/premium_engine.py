@@ -0,0 +1,334 @@
+import argparse
+import json
+import math
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+from coin_listener import CoinListener
+from db_manager import DBManager
+from tick_notify import TICK_CHANNEL
+
+# Tick-count windows for the rolling premium mean/std, e.g. "100,1000"
+PREMIUM_WINDOWS = tuple(
+    int(size) for size in os.getenv("PREMIUM_WINDOWS", "100,1000").split(",")
+)
+PREMIUM_EWMA_HALFLIFE = float(os.getenv("PREMIUM_EWMA_HALFLIFE", "100"))  # ticks
+# Changed premiums are published at most this often
+PREMIUM_PUBLISH_INTERVAL = float(os.getenv("PREMIUM_PUBLISH_INTERVAL", "0.2"))
+PREMIUM_CHANNEL = os.getenv("PREMIUM_CHANNEL", "premium_updates")
+
+
+class RollingWindow:
+    """
+    Mean and standard deviation of the last `size` values from an array ring
+    buffer with running sums. The sums are recomputed from the buffer every
+    time it wraps so floating point drift cannot build up.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = array("d", bytes(8 * size))
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def push(self, value):
+        if self.count == self.size:
+            old = self.values[self.index]
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.count += 1
+        self.values[self.index] = value
+        self.total += value
+        self.total_sq += value * value
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+            self.total = math.fsum(self.values[: self.count])
+            self.total_sq = math.fsum(v * v for v in self.values[: self.count])
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return None
+        mean = self.total / self.count
+        variance = (self.total_sq - self.count * mean * mean) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+
+class Ewma:
+    # Exponentially weighted mean and variance, half-life in ticks
+    def __init__(self, halflife):
+        self.alpha = 1 - 0.5 ** (1 / halflife)
+        self.mean = None
+        self.variance = 0.0
+
+    def push(self, value):
+        if self.mean is None:
+            self.mean = value
+            return
+        delta = value - self.mean
+        self.mean += self.alpha * delta
+        self.variance = (1 - self.alpha) * (self.variance + self.alpha * delta * delta)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.mean is not None else None
+
+
+class PremiumState:
+    __slots__ = ("quotes", "timestamp", "premium", "entry", "exit", "ewma", "windows")
+
+    def __init__(self, windows, halflife):
+        self.quotes = {}  # exchange -> (timestamp, bid, ask)
+        self.timestamp = None
+        self.premium = None
+        self.entry = None
+        self.exit = None
+        self.ewma = Ewma(halflife)
+        self.windows = [RollingWindow(size) for size in windows]
+
+
+class PremiumEngine:
+    """
+    Cross-exchange premium per coin, updated in O(1) per tick. With `base`
+    Binance and `other` Coinex, in percent:
+
+      premium        other mid / base mid - 1
+      entry_premium  other bid / base ask - 1   (buy base, sell other)
+      exit_premium   other ask / base bid - 1   (unwind that position)
+
+    The mid premium feeds an EWMA and fixed tick-count windows. A tick that
+    is not newer than the last one seen for its coin and exchange is ignored.
+    """
+
+    def __init__(
+        self,
+        base="BINANCE",
+        other="COINEX",
+        windows=PREMIUM_WINDOWS,
+        halflife=PREMIUM_EWMA_HALFLIFE,
+    ):
+        self.base = base
+        self.other = other
+        self.window_sizes = tuple(windows)
+        self.halflife = halflife
+        self.states = {}
+        self.changed = set()
+
+    def on_tick(self, coin_id, exchange, timestamp, bid, ask):
+        if exchange not in (self.base, self.other) or not bid or not ask:
+            return False
+        state = self.states.get(coin_id)
+        if state is None:
+            state = self.states[coin_id] = PremiumState(
+                self.window_sizes, self.halflife
+            )
+        last = state.quotes.get(exchange)
+        if last is not None and last[0] >= timestamp:
+            return False
+        state.quotes[exchange] = (timestamp, bid, ask)
+        base = state.quotes.get(self.base)
+        other = state.quotes.get(self.other)
+        if base is None or other is None:
+            return False
+        _, base_bid, base_ask = base
+        _, other_bid, other_ask = other
+        state.timestamp = max(base[0], other[0])
+        state.premium = 100 * ((other_bid + other_ask) / (base_bid + base_ask) - 1)
+        state.entry = 100 * (other_bid / base_ask - 1)
+        state.exit = 100 * (other_ask / base_bid - 1)
+        state.ewma.push(state.premium)
+        for window in state.windows:
+            window.push(state.premium)
+        self.changed.add(coin_id)
+        return True
+
+    def snapshot(self, coin_id):
+        state = self.states.get(coin_id)
+        if state is None or state.premium is None:
+            return None
+        return {
+            "coin_id": coin_id,
+            "timestamp": state.timestamp,
+            "premium": state.premium,
+            "entry_premium": state.entry,
+            "exit_premium": state.exit,
+            "ewma_mean": state.ewma.mean,
+            "ewma_std": state.ewma.std,
+            "windows": {
+                str(window.size): {"mean": window.mean, "std": window.std}
+                for window in state.windows
+            },
+        }
+
+    def drain(self):
+        # Snapshots of every coin whose premium changed since the last drain
+        changed, self.changed = self.changed, set()
+        return [self.snapshot(coin_id) for coin_id in sorted(changed)]
+
+
+class PremiumPublisher:
+    """
+    Upserts premium snapshots into premium_table and announces them on a
+    NOTIFY channel, one JSON payload per coin, in a single transaction.
+    """
+
+    def __init__(self, db_manager, channel=PREMIUM_CHANNEL):
+        self.db_manager = db_manager
+        self.channel = channel
+
+    def publish(self, snapshots):
+        if not snapshots:
+            return 0
+        conn = self.db_manager.conn
+        try:
+            with conn.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO premium_table (
+                        coin_id, timestamp, premium, entry_premium, exit_premium,
+                        ewma_mean, ewma_std, window_stats
+                    )
+                    VALUES %s
+                    ON CONFLICT (coin_id) DO UPDATE SET
+                        timestamp = EXCLUDED.timestamp,
+                        premium = EXCLUDED.premium,
+                        entry_premium = EXCLUDED.entry_premium,
+                        exit_premium = EXCLUDED.exit_premium,
+                        ewma_mean = EXCLUDED.ewma_mean,
+                        ewma_std = EXCLUDED.ewma_std,
+                        window_stats = EXCLUDED.window_stats,
+                        updated_at = CURRENT_TIMESTAMP;
+                    """,
+                    [
+                        (
+                            s["coin_id"],
+                            s["timestamp"],
+                            s["premium"],
+                            s["entry_premium"],
+                            s["exit_premium"],
+                            s["ewma_mean"],
+                            s["ewma_std"],
+                            json.dumps(s["windows"]),
+                        )
+                        for s in snapshots
+                    ],
+                    page_size=len(snapshots),
+                )
+                cursor.execute(
+                    "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload;",
+                    (
+                        self.channel,
+                        [json.dumps(s, default=str) for s in snapshots],
+                    ),
+                )
+            conn.commit()
+            return len(snapshots)
+        except Exception as e:
+            print(f"Error publishing {len(snapshots)} premiums: {e}")
+            conn.rollback()
+            return 0
+
+
+class TickFeed:
+    """
+    Feeds the engine every tick the collectors commit, from the
+    notifications their tick writers send on TICK_CHANNEL (tick_notify.py).
+    The current quotes are seeded from latest_coin_data_table after LISTEN
+    on every (re)connect, so nothing committed in between is missed; ticks
+    seen twice are dropped by PremiumEngine.on_tick, which ignores anything
+    not newer than its coin and exchange's last tick.
+    """
+
+    def __init__(self, db_manager, channel=TICK_CHANNEL):
+        self.db_manager = db_manager
+        self.listener = CoinListener(channel)
+
+    def seed(self):
+        # Latest quote per coin and exchange, None on a database error
+        rows = self.db_manager.execute_query("""
+            SELECT coin_id, exchange, timestamp, best_bid, best_ask
+            FROM latest_coin_data_table ORDER BY timestamp;
+            """)
+        self.db_manager.commit()  # Do not keep a snapshot open
+        return rows
+
+    def poll(self, timeout):
+        """
+        Ticks as (coin_id, exchange, timestamp, bid, ask), waiting up to
+        timeout seconds for the first notification.
+        """
+        listener = self.listener
+        if listener.conn is None and not listener.connect():
+            time.sleep(timeout)
+            return []
+        ticks = []
+        try:
+            if listener.resync_due:
+                rows = self.seed()
+                if rows is None:
+                    raise RuntimeError("could not read latest_coin_data_table")
+                ticks.extend(rows)
+                listener.resync_due = False
+            if listener.wait(timeout):
+                for payload in listener.events():
+                    for coin_id, exchange, timestamp, bid, ask in payload:
+                        timestamp = datetime.fromtimestamp(
+                            timestamp / 1000, timezone.utc
+                        )
+                        ticks.append((coin_id, exchange, timestamp, bid, ask))
+        except Exception as e:
+            print(f"Tick feed error: {e}, reconnecting")
+            listener.close()
+            if self.db_manager.conn is None or self.db_manager.conn.closed:
+                self.db_manager.reconnect()
+            time.sleep(timeout)
+        return ticks
+
+
+def run(engine, feed, publisher, interval=PREMIUM_PUBLISH_INTERVAL):
+    while True:
+        deadline = time.monotonic() + interval
+        remaining = interval
+        while remaining > 0:
+            for coin_id, exchange, timestamp, bid, ask in feed.poll(remaining):
+                engine.on_tick(coin_id, exchange, timestamp, bid, ask)
+            remaining = deadline - time.monotonic()
+        publisher.publish(engine.drain())
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Publish live Binance/Coinex premiums to premium_table."
+    )
+    parser.add_argument(
+        "--publish-interval", type=float, default=PREMIUM_PUBLISH_INTERVAL
+    )
+    parser.add_argument("--channel", default=PREMIUM_CHANNEL)
+    parser.add_argument("--tick-channel", default=TICK_CHANNEL)
+    args = parser.parse_args()
+
+    db_manager = DBManager()
+    feed = TickFeed(db_manager, args.tick_channel)
+    try:
+        run(
+            PremiumEngine(),
+            feed,
+            PremiumPublisher(db_manager, args.channel),
+            args.publish_interval,
+        )
+    finally:
+        feed.listener.close()
+        db_manager.close()
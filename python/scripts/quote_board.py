@@ -0,0 +1,321 @@
+import fcntl
+import glob
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+# Collectors publish their latest quotes into memory-mapped files here,
+# one per collector process; empty disables the board. Processes in other
+# containers only see each other's boards through a shared tmpfs mount (the
+# quote_board volume in docker-compose.yml)
+QUOTE_BOARD_DIR = os.getenv("QUOTE_BOARD_DIR", "/dev/shm/quote_board")
+QUOTE_BOARD_SLOTS = int(os.getenv("QUOTE_BOARD_SLOTS", "4096"))  # Per file
+
+MAGIC = b"QUOTEBD1"
+# magic, slot size, slot capacity, creation time, slots in use
+HEADER = struct.Struct("<8sIIQQ")
+HEADER_SIZE = 64
+COUNT = struct.Struct("<Q")
+COUNT_OFFSET = 24
+
+# A slot is the sequence word, its (symbol, exchange) key, written once
+# when the slot is taken, and the quote the sequence word protects
+SLOT_SIZE = 128
+SEQUENCE = struct.Struct("<Q")
+KEY = struct.Struct("<24s8s")
+KEY_OFFSET = 8
+# Exchange time (epoch ms), publish time (epoch ns), bid, ask, bid qty,
+# ask qty, mark, last; NaN for prices the exchange does not send
+QUOTE = struct.Struct("<qq6d")
+QUOTE_OFFSET = KEY_OFFSET + KEY.size
+READ_RETRIES = 10000
+
+Quote = namedtuple(
+    "Quote",
+    [
+        "symbol",
+        "exchange",
+        "timestamp",
+        "published_ns",
+        "best_bid",
+        "best_ask",
+        "best_bid_qty",
+        "best_ask_qty",
+        "mark_price",
+        "last_price",
+    ],
+)
+
+
+def _price(value):
+    # Coinex ticks keep the exchange's decimal strings
+    return math.nan if value is None else float(value)
+
+
+# Bound once: the read path is a handful of C calls
+_unpack_sequence = SEQUENCE.unpack_from
+_unpack_quote = QUOTE.unpack_from
+_new_quote = tuple.__new__
+
+
+def _read(data, offset):
+    # A slot's quote values, None if it stays mid-write (its writer died)
+    for _ in range(READ_RETRIES):
+        (sequence,) = _unpack_sequence(data, offset)
+        if sequence & 1:
+            continue  # Write in progress
+        values = _unpack_quote(data, offset + QUOTE_OFFSET)
+        if _unpack_sequence(data, offset)[0] == sequence:
+            return values
+    return None
+
+
+def _open_map(path, access=mmap.ACCESS_WRITE):
+    with open(path, "rb" if access == mmap.ACCESS_READ else "r+b") as file:
+        return mmap.mmap(file.fileno(), 0, access=access)
+
+
+class QuoteBoardWriter:
+    """
+    Latest top of book per (symbol, exchange) of one collector process, in a
+    fixed-layout file under QUOTE_BOARD_DIR (tmpfs, so it never hits a disk).
+    Each slot is guarded by a seqlock: the sequence word is odd while the
+    quote is being written, so readers in other processes never block the
+    writer and retry the rare read that overlaps a write. Slots are only
+    appended, and a restarted collector reuses its file so readers keep
+    their mapping. The seqlock needs a single writer per slot, so a board
+    another process is writing cannot be opened (OSError).
+    """
+
+    def __init__(self, directory, name, capacity=QUOTE_BOARD_SLOTS):
+        self.path = os.path.join(directory, f"{name}.board")
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.sequences = {}
+        self.timestamps = {}
+        self.full = False
+        os.makedirs(directory, exist_ok=True)
+        # Held on a side file: _create swaps the board file's inode
+        self.lock_file = open(self.path + ".lock", "a+b")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            raise OSError(f"{self.path} already has a writer") from None
+        self.map = self._reopen(capacity)
+        if self.map is None:
+            self.map = self._create(capacity)
+        self.capacity = HEADER.unpack_from(self.map)[2]
+        self.count = HEADER.unpack_from(self.map)[4]
+        for index in range(self.count):
+            offset = HEADER_SIZE + index * SLOT_SIZE
+            symbol, exchange = KEY.unpack_from(self.map, offset + KEY_OFFSET)
+            key = (symbol.rstrip(b"\0").decode(), exchange.rstrip(b"\0").decode())
+            sequence = SEQUENCE.unpack_from(self.map, offset)[0]
+            if sequence & 1:
+                # Torn by a crash mid-write; readers wait for an even value
+                sequence += 1
+                SEQUENCE.pack_into(self.map, offset, sequence)
+            self.slots[key] = offset
+            self.sequences[offset] = sequence
+            self.timestamps[offset] = QUOTE.unpack_from(
+                self.map, offset + QUOTE_OFFSET
+            )[0]
+
+    def _reopen(self, capacity):
+        try:
+            data = _open_map(self.path)
+        except (FileNotFoundError, ValueError):
+            return None
+        magic, slot_size, slots, _, _ = HEADER.unpack_from(data)
+        if magic == MAGIC and slot_size == SLOT_SIZE and slots == capacity:
+            return data
+        data.close()
+        return None
+
+    def _create(self, capacity):
+        # Built aside and renamed, so a reader never maps a half-made file
+        size = HEADER_SIZE + capacity * SLOT_SIZE
+        with open(self.path + ".tmp", "w+b") as file:
+            file.truncate(size)
+            data = mmap.mmap(file.fileno(), size)
+        HEADER.pack_into(data, 0, MAGIC, SLOT_SIZE, capacity, int(time.time()), 0)
+        os.replace(self.path + ".tmp", self.path)
+        return data
+
+    def _allocate(self, key):
+        if self.count == self.capacity:
+            if not self.full:
+                print(f"Quote board {self.path} is full, not publishing {key}")
+                self.full = True
+            return None
+        offset = HEADER_SIZE + self.count * SLOT_SIZE
+        KEY.pack_into(self.map, offset + KEY_OFFSET, key[0].encode(), key[1].encode())
+        QUOTE.pack_into(self.map, offset + QUOTE_OFFSET, 0, 0, *[math.nan] * 6)
+        SEQUENCE.pack_into(self.map, offset, 0)
+        self.count += 1
+        # Readers only look at slots below the count, so this publishes it
+        COUNT.pack_into(self.map, COUNT_OFFSET, self.count)
+        self.slots[key] = offset
+        self.sequences[offset] = 0
+        self.timestamps[offset] = 0
+        return offset
+
+    def publish(self, tick):
+        key = (tick.symbol, tick.exchange)
+        with self.lock:
+            offset = self.slots.get(key)
+            if offset is None:
+                offset = self._allocate(key)
+                if offset is None:
+                    return
+            if tick.timestamp < self.timestamps[offset]:
+                return  # Snapshots can be older than the live feed
+            sequence = self.sequences[offset] + 1
+            SEQUENCE.pack_into(self.map, offset, sequence)
+            QUOTE.pack_into(
+                self.map,
+                offset + QUOTE_OFFSET,
+                tick.timestamp,
+                time.time_ns(),
+                _price(tick.best_bid),
+                _price(tick.best_ask),
+                _price(tick.best_bid_qty),
+                _price(tick.best_ask_qty),
+                _price(tick.mark_price),
+                _price(tick.last_price),
+            )
+            SEQUENCE.pack_into(self.map, offset, sequence + 1)
+            self.sequences[offset] = sequence + 1
+            self.timestamps[offset] = tick.timestamp
+
+    def close(self):
+        # The file stays: its quotes age visibly through published_ns
+        with self.lock:
+            self.map.close()
+            self.lock_file.close()  # Releases the flock
+
+
+def open_quote_board(name):
+    # The collector's board writer, or None when QUOTE_BOARD_DIR is empty
+    if not QUOTE_BOARD_DIR:
+        return None
+    try:
+        return QuoteBoardWriter(QUOTE_BOARD_DIR, name)
+    except OSError as e:
+        print(f"Quote board disabled: {e}")
+        return None
+
+
+class QuoteBoard:
+    """
+    Read side for co-located processes. Quotes are unpacked straight from
+    the shared mapping under the slot's seqlock: a lookup is a dict hit and
+    three struct reads, with no lock, syscall or database round trip.
+
+        board = QuoteBoard()
+        quote = board.quote("BTCUSDT", "BINANCE")
+
+    New files and slots only show up after refresh(), which globs and
+    stats the directory; a polling loop calls it once per pass and reads
+    with quote(..., refresh=False), quotes() and snapshot(), which never
+    touch the filesystem. A symbol published by more than one file (a coin
+    that moved between shards) resolves to the newest quote.
+    """
+
+    def __init__(self, directory=QUOTE_BOARD_DIR):
+        self.directory = directory
+        self.boards = {}  # Path -> [mmap, inode, slots indexed]
+        self.index = {}  # (symbol, exchange) -> [(mmap, offset), ...]
+        self.exchanges = {}  # Symbol -> exchanges it is published for
+        self.refresh()
+
+    def refresh(self):
+        # Maps new board files and indexes slots taken since the last call
+        replaced = []
+        for path in glob.glob(os.path.join(self.directory, "*.board")):
+            try:
+                inode = os.stat(path).st_ino
+                board = self.boards.get(path)
+                if board is None or board[1] != inode:
+                    self.boards[path] = [_open_map(path, mmap.ACCESS_READ), inode, 0]
+                    if board is not None:
+                        replaced.append(board[0])
+            except (FileNotFoundError, ValueError):
+                continue
+        if replaced:
+            # A writer recreated its file: rebuild the index from scratch
+            self.index = {}
+            self.exchanges = {}
+            for board in self.boards.values():
+                board[2] = 0
+        for board in self.boards.values():
+            data = board[0]
+            count = COUNT.unpack_from(data, COUNT_OFFSET)[0]
+            for index in range(board[2], count):
+                self._add_slot(data, HEADER_SIZE + index * SLOT_SIZE)
+            board[2] = count
+        for data in replaced:
+            data.close()
+
+    def _add_slot(self, data, offset):
+        symbol, exchange = KEY.unpack_from(data, offset + KEY_OFFSET)
+        key = (symbol.rstrip(b"\0").decode(), exchange.rstrip(b"\0").decode())
+        slots = self.index.setdefault(key, [])
+        if not slots:
+            self.exchanges.setdefault(key[0], []).append(key[1])
+        slots.append((data, offset))
+
+    def quote(self, symbol, exchange, refresh=True):
+        """
+        Latest Quote of a symbol on an exchange, or None if never published.
+        An unknown key triggers refresh() unless refresh=False.
+        """
+        slots = self.index.get((symbol, exchange))
+        if slots is None:
+            if not refresh:
+                return None
+            self.refresh()
+            slots = self.index.get((symbol, exchange))
+            if slots is None:
+                return None
+        if len(slots) == 1:
+            values = _read(*slots[0])
+        else:
+            values = None
+            for slot in slots:
+                other = _read(*slot)
+                if other is not None and (values is None or other[0] > values[0]):
+                    values = other
+        if values is None or values[1] == 0:
+            return None  # Slot taken, quote not written yet
+        return _new_quote(Quote, (symbol, exchange, *values))
+
+    def quotes(self, symbol):
+        # The symbol's quote on every exchange known since the last refresh()
+        quotes = {}
+        for exchange in self.exchanges.get(symbol, ()):
+            quote = self.quote(symbol, exchange, refresh=False)
+            if quote is not None:
+                quotes[exchange] = quote
+        return quotes
+
+    def snapshot(self):
+        # Every quote known since the last refresh()
+        quotes = []
+        for symbol, exchange in list(self.index):
+            quote = self.quote(symbol, exchange, refresh=False)
+            if quote is not None:
+                quotes.append(quote)
+        return quotes
+
+    def close(self):
+        for board in self.boards.values():
+            board[0].close()
+        self.boards = {}
+        self.index = {}
+        self.exchanges = {}
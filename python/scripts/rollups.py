@@ -0,0 +1,392 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from psycopg2.extras import execute_values
+from db_manager import DBManager
+from metrics import REGISTRY, Counter
+
+# Bars kept by the collectors, in seconds, and the table each goes to
+ROLLUP_INTERVALS = {"1s": 1, "1m": 60, "1h": 3600}
+ROLLUP_TABLES = {name: f"coin_bar_{name}" for name in ROLLUP_INTERVALS}
+ROLLUPS = os.getenv("ROLLUPS", "on") != "off"
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "2"))
+# Bars per table kept for retry while the database is unreachable
+ROLLUP_MAX_PENDING = int(os.getenv("ROLLUP_MAX_PENDING", "100000"))
+
+ROLLUP_COLUMNS = (
+    "coin_id",
+    "exchange",
+    "bucket",
+    "open",
+    "high",
+    "low",
+    "close",
+    "ticks",
+    "spread_bps_avg",
+    "spread_bps_max",
+)
+
+# Bars are written as the ticks added since their last write and merged
+# into the stored bar: its open stays, high and low widen, the close written
+# last wins, tick counts add up and the average spread is weighted by them
+ROLLUP_UPSERT = (
+    f"INSERT INTO {{table}} AS bar ({', '.join(ROLLUP_COLUMNS)}) VALUES %s "
+    "ON CONFLICT (coin_id, exchange, bucket) DO UPDATE SET "
+    "high = GREATEST(bar.high, EXCLUDED.high), "
+    "low = LEAST(bar.low, EXCLUDED.low), "
+    "close = EXCLUDED.close, "
+    "ticks = bar.ticks + EXCLUDED.ticks, "
+    "spread_bps_avg = (bar.spread_bps_avg * bar.ticks "
+    "+ EXCLUDED.spread_bps_avg * EXCLUDED.ticks) / (bar.ticks + EXCLUDED.ticks), "
+    "spread_bps_max = GREATEST(bar.spread_bps_max, EXCLUDED.spread_bps_max)"
+)
+
+ROLLUP_TICKS = REGISTRY.register(
+    Counter(
+        "collector_rollup_ticks",
+        "Ticks added to rollups, late: after their 1s bar was written",
+        ["result"],
+    )
+)
+rollup_added = ROLLUP_TICKS.labels("added")
+rollup_late = ROLLUP_TICKS.labels("late")
+
+
+class Bar:
+    """
+    OHLC of the mid price with tick count and spread stats for one bucket.
+    open_time and close_time keep open and close right for late ticks.
+    """
+
+    __slots__ = (
+        "open",
+        "high",
+        "low",
+        "close",
+        "open_time",
+        "close_time",
+        "ticks",
+        "spread_sum",
+        "spread_max",
+    )
+
+    def __init__(self, timestamp, mid, spread):
+        self.open = self.high = self.low = self.close = mid
+        self.open_time = self.close_time = timestamp
+        self.ticks = 1
+        self.spread_sum = self.spread_max = spread
+
+    def add(self, timestamp, mid, spread):
+        if mid > self.high:
+            self.high = mid
+        elif mid < self.low:
+            self.low = mid
+        if timestamp >= self.close_time:
+            self.close, self.close_time = mid, timestamp
+        elif timestamp < self.open_time:
+            self.open, self.open_time = mid, timestamp
+        self.ticks += 1
+        self.spread_sum += spread
+        if spread > self.spread_max:
+            self.spread_max = spread
+
+    def merge(self, other):
+        if other.open_time < self.open_time:
+            self.open, self.open_time = other.open, other.open_time
+        if other.close_time >= self.close_time:
+            self.close, self.close_time = other.close, other.close_time
+        self.high = max(self.high, other.high)
+        self.low = min(self.low, other.low)
+        self.ticks += other.ticks
+        self.spread_sum += other.spread_sum
+        self.spread_max = max(self.spread_max, other.spread_max)
+
+    @classmethod
+    def from_row(cls, start, end, open_, high, low, close, ticks, avg, max_):
+        # A stored bar covering [start, end)
+        bar = cls(start, open_, max_ or 0.0)
+        bar.high, bar.low, bar.close, bar.ticks = high, low, close, ticks
+        bar.close_time = end
+        bar.spread_sum = (avg or 0.0) * ticks
+        return bar
+
+    def row(self, coin_id, exchange, bucket):
+        return (
+            coin_id,
+            exchange,
+            datetime.fromtimestamp(bucket, timezone.utc),
+            self.open,
+            self.high,
+            self.low,
+            self.close,
+            self.ticks,
+            self.spread_sum / self.ticks,
+            self.spread_max,
+        )
+
+
+class RollupAggregator:
+    """
+    Builds 1s/1m/1h bars from the rows a tick writer has committed (its
+    on_flush callback), so the bars never contain a tick that is not in the
+    raw table. due() hands out each closed bar once and forgets it. A tick
+    for a bar already handed out (late, or replayed from the spill buffer)
+    starts a new partial bar for the same bucket, which ROLLUP_UPSERT merges
+    into the stored one.
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.coin_index = self.columns.index("coin_id")
+        self.exchange_index = self.columns.index("exchange")
+        self.time_index = self.columns.index("timestamp")
+        self.bid_index = self.columns.index("best_bid")
+        self.ask_index = self.columns.index("best_ask")
+        # coin_tick_table rows carry scaled integer prices
+        self.scale_index = (
+            self.columns.index("price_scale") if "price_scale" in self.columns else None
+        )
+        self.written_until = -math.inf  # 1s bars before this may be written
+        self.bars = {name: {} for name in ROLLUP_INTERVALS}
+        self.dirty = {name: set() for name in ROLLUP_INTERVALS}
+        self.lock = threading.Lock()
+
+    def add_rows(self, rows):
+        added = late = 0
+        with self.lock:
+            for row in rows:
+                bid, ask = row[self.bid_index], row[self.ask_index]
+                if bid is None or ask is None:
+                    continue
+                bid, ask = float(bid), float(ask)
+                if self.scale_index is not None:
+                    factor = 10.0 ** -row[self.scale_index]
+                    bid, ask = bid * factor, ask * factor
+                mid = (bid + ask) / 2
+                if mid <= 0:
+                    continue
+                timestamp = row[self.time_index].timestamp()
+                self.add(
+                    (row[self.coin_index], row[self.exchange_index]),
+                    timestamp,
+                    mid,
+                    10000 * (ask - bid) / mid,
+                )
+                added += 1
+                if timestamp < self.written_until:
+                    late += 1
+        rollup_added.inc(added)
+        if late:
+            rollup_late.inc(late)
+
+    def add(self, key, timestamp, mid, spread):
+        for name, interval in ROLLUP_INTERVALS.items():
+            bucket = int(timestamp // interval) * interval
+            bar = self.bars[name].get((key, bucket))
+            if bar is None:
+                self.bars[name][(key, bucket)] = Bar(timestamp, mid, spread)
+            else:
+                bar.add(timestamp, mid, spread)
+            self.dirty[name].add((key, bucket))
+
+    def seed(self, name, rows, fine_interval, stored=()):
+        """
+        Rebuilds bars that were open when the process started from finer
+        bars of fine_interval seconds already in the database: rows are
+        (coin_id, exchange, bucket, open, high, low, close, ticks,
+        spread_bps_avg, spread_bps_max). Bars in `stored`, ((coin_id,
+        exchange), bucket) keys, were written at shutdown and are left to
+        the merging upsert. Seeded bars are only written once a new tick
+        lands in them.
+        """
+        interval = ROLLUP_INTERVALS[name]
+        stored = set(stored)
+        with self.lock:
+            bars = self.bars[name]
+            for coin_id, exchange, bucket, *values in rows:
+                fine_start = bucket.timestamp()
+                start = int(fine_start // interval) * interval
+                key = ((coin_id, exchange), start)
+                if key in stored:
+                    continue
+                # The close is somewhere inside the fine bar; just before its
+                # end keeps it behind any tick of a later fine bar
+                fine = Bar.from_row(
+                    fine_start, fine_start + fine_interval - 1e-6, *values
+                )
+                if key in bars:
+                    bars[key].merge(fine)
+                else:
+                    bars[key] = fine
+
+    def due(self, now=None):
+        """
+        Closed bars with ticks that were not handed out yet, per rollup
+        table, as {((coin_id, exchange), bucket): Bar}. Closed bars are
+        dropped either way: seeded ones no tick landed in are already stored.
+        """
+        now = time.time() if now is None else now
+        result = {}
+        with self.lock:
+            for name, interval in ROLLUP_INTERVALS.items():
+                bars = self.bars[name]
+                dirty = self.dirty[name]
+                result[name] = {}
+                for item in [item for item in bars if item[1] + interval <= now]:
+                    bar = bars.pop(item)
+                    if item in dirty:
+                        dirty.discard(item)
+                        result[name][item] = bar
+            if now != math.inf:
+                self.written_until = now // 1
+        return result
+
+
+class RollupWriter:
+    """
+    Upserts the aggregator's closed bars every ROLLUP_FLUSH_INTERVAL seconds
+    from a background thread with its own connection, so neither the
+    blocking nor the asyncio collectors wait on rollup writes.
+    """
+
+    def __init__(self, aggregator, exchange, interval=ROLLUP_FLUSH_INTERVAL):
+        self.aggregator = aggregator
+        self.exchange = exchange
+        self.interval = interval
+        self.db_manager = None
+        # Bars not written yet; one statement may not upsert a key twice, so
+        # ticks a retried bar gained meanwhile are merged into it here
+        self.pending = {name: {} for name in ROLLUP_INTERVALS}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        # Seeded before any tick arrives, so seeded bars are the older part
+        self.db_manager = DBManager()
+        if self.db_manager.conn is not None:
+            try:
+                self.seed()
+            except Exception as e:
+                print(f"Error seeding rollups: {e}")
+        self.thread = threading.Thread(
+            target=self.run, name=f"rollups-{self.exchange.lower()}", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def seed(self):
+        # Open 1m bars from this minute's 1s bars, open 1h bars from this
+        # hour's 1m bars plus this minute's 1s bars. A bar already stored
+        # was written at shutdown with every tick until then, so it is only
+        # rebuilt after a crash
+        now = time.time()
+        minute = datetime.fromtimestamp(now // 60 * 60, timezone.utc)
+        hour = datetime.fromtimestamp(now // 3600 * 3600, timezone.utc)
+        columns = ", ".join(ROLLUP_COLUMNS)
+        seconds = self.db_manager.execute_query(
+            f"SELECT {columns} FROM {ROLLUP_TABLES['1s']} "
+            "WHERE exchange = %s AND bucket >= %s ORDER BY bucket;",
+            (self.exchange, minute),
+        )
+        minutes = self.db_manager.execute_query(
+            f"SELECT {columns} FROM {ROLLUP_TABLES['1m']} "
+            "WHERE exchange = %s AND bucket >= %s AND bucket < %s ORDER BY bucket;",
+            (self.exchange, hour, minute),
+        )
+        stored_minutes = self.stored("1m", minute)
+        stored_hours = self.stored("1h", hour)
+        self.db_manager.commit()
+        self.aggregator.seed("1m", seconds or [], 1, stored_minutes)
+        self.aggregator.seed("1h", minutes or [], 60, stored_hours)
+        self.aggregator.seed("1h", seconds or [], 1, stored_hours)
+
+    def stored(self, name, bucket):
+        rows = self.db_manager.execute_query(
+            f"SELECT coin_id, exchange FROM {ROLLUP_TABLES[name]} "
+            "WHERE exchange = %s AND bucket = %s;",
+            (self.exchange, bucket),
+        )
+        if rows is None:
+            raise RuntimeError(f"Could not read the stored {name} bars")
+        return [((coin_id, exchange), bucket.timestamp()) for coin_id, exchange in rows]
+
+    def write(self, rows_by_name):
+        conn = self.db_manager.conn
+        try:
+            with conn.cursor() as cursor:
+                for name, rows in rows_by_name.items():
+                    if not rows:
+                        continue
+                    execute_values(
+                        cursor,
+                        ROLLUP_UPSERT.format(table=ROLLUP_TABLES[name]),
+                        [
+                            bar.row(key[0], key[1], bucket)
+                            for (key, bucket), bar in rows.items()
+                        ],
+                        page_size=len(rows),
+                    )
+            conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error writing rollups: {e}")
+            if not conn.closed:
+                conn.rollback()
+            return False
+
+    def flush(self, final=False):
+        # The final flush also writes the bars still open at shutdown
+        due = self.aggregator.due(math.inf if final else None)
+        for name, bars in due.items():
+            pending = self.pending[name]
+            for item, bar in bars.items():
+                if item in pending:
+                    pending[item].merge(bar)
+                else:
+                    pending[item] = bar
+        if not any(self.pending.values()):
+            return
+        if self.db_manager is None or self.db_manager.conn is None:
+            self.db_manager = DBManager()
+        if self.db_manager.conn is not None and self.write(self.pending):
+            self.pending = {name: {} for name in ROLLUP_INTERVALS}
+            return
+        if self.db_manager.conn is None or self.db_manager.conn.closed:
+            self.db_manager = None
+        # A failed batch was rolled back, so it is retried whole; the oldest
+        # bars go first if the database stays away too long
+        for rows in self.pending.values():
+            for key in list(rows)[: max(0, len(rows) - ROLLUP_MAX_PENDING)]:
+                del rows[key]
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing rollups: {e}")
+        try:
+            self.flush(final=True)
+        except Exception as e:
+            print(f"Error flushing rollups: {e}")
+        if self.db_manager is not None:
+            self.db_manager.close()
+
+
+def start_rollups(columns, exchange):
+    """
+    Started RollupWriter for one collector's tick rows: pass its
+    aggregator.add_rows as the tick writer's on_flush and stop() it after
+    the last tick flush. None with ROLLUPS=off.
+    """
+    if not ROLLUPS:
+        return None
+    writer = RollupWriter(RollupAggregator(columns), exchange)
+    writer.start()
+    return writer
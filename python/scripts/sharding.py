@@ -0,0 +1,67 @@
+import bisect
+import hashlib
+import os
+
+SHARD_REPLICAS = int(os.getenv("SHARD_REPLICAS", "128"))  # Ring points per shard
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash of coin names onto `count` shards. Each shard owns
+    `replicas` points on the ring, so adding or removing a coin only touches
+    the shard it hashes to, and changing the shard count only moves about
+    1/count of the coins.
+    """
+
+    def __init__(self, count, replicas=SHARD_REPLICAS):
+        if count < 1:
+            raise ValueError(f"Shard count must be at least 1, got {count}")
+        self.count = count
+        points = sorted(
+            (_hash(f"{shard}:{replica}"), shard)
+            for shard in range(count)
+            for replica in range(replicas)
+        )
+        self.keys = [key for key, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard_of(self, coin_name):
+        index = bisect.bisect(self.keys, _hash(coin_name)) % len(self.keys)
+        return self.shards[index]
+
+    def assign(self, coin_names):
+        assignment = {shard: [] for shard in range(self.count)}
+        for coin_name in sorted(coin_names):
+            assignment[self.shard_of(coin_name)].append(coin_name)
+        return assignment
+
+
+class Shard:
+    # One worker's slice of the ring: the coins it collects
+    def __init__(self, index, count, replicas=SHARD_REPLICAS):
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} outside 0..{count - 1}")
+        self.index = index
+        self.count = count
+        self.ring = HashRing(count, replicas)
+
+    def owns(self, coin_name):
+        return self.ring.shard_of(coin_name) == self.index
+
+    def __repr__(self):
+        return f"Shard({self.index}/{self.count})"
+
+
+def shard_from_env():
+    """
+    The shard a collector process was started for by supervisor.py
+    (SHARD_INDEX / SHARD_COUNT), or None when it collects every coin.
+    """
+    count = int(os.getenv("SHARD_COUNT", "1"))
+    if count <= 1:
+        return None
+    return Shard(int(os.getenv("SHARD_INDEX", "0")), count)
@@ -0,0 +1,421 @@
+import atexit
+import glob
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from db_manager import CONNECTION_ERRORS, DBManager
+from metrics import REGISTRY, Counter
+
+# Rows a writer could not get into Postgres go to fixed-width records in
+# memory-mapped segment files here, and are bulk loaded back once the
+# database is healthy. Empty disables spilling.
+SPILL_DIR = os.getenv(
+    "SPILL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "spill")
+)
+SPILL_SEGMENT_BYTES = int(os.getenv("SPILL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# Oldest segments are deleted unreplayed beyond either limit
+SPILL_MAX_BYTES = int(os.getenv("SPILL_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+SPILL_RETENTION_HOURS = float(os.getenv("SPILL_RETENTION_HOURS", "72"))
+SPILL_REPLAY_INTERVAL = float(os.getenv("SPILL_REPLAY_INTERVAL", "5"))
+SPILL_REPLAY_ROWS = int(os.getenv("SPILL_REPLAY_ROWS", "10000"))
+# Replays of a segment that fail this often for a reason other than a lost
+# connection move it to the quarantine/ directory beside it, for inspection
+SPILL_REPLAY_FAILURES = int(os.getenv("SPILL_REPLAY_FAILURES", "5"))
+
+SPILL_ROWS = REGISTRY.register(
+    Counter(
+        "collector_spill_rows",
+        "Rows spilled to disk, replayed, expired or quarantined unreplayed",
+        ["table", "action"],
+    )
+)
+
+MAGIC = b"TICKSPL1"
+# magic, record size, CRC of the column list, records replayed so far,
+# creation time (the file's mtime moves with every replay checkpoint)
+HEADER = struct.Struct("<8sIIQQ")
+HEADER_SIZE = 64
+REPLAYED_OFFSET = 16
+RECORD_CRC = struct.Struct("<I")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+EXCHANGES = ("BINANCE", "COINEX")
+NULL_INT = -(2**63)
+
+
+def _time_us(value):
+    if value is None:
+        return NULL_INT
+    if value.tzinfo is None:
+        value = value.astimezone(timezone.utc)  # Naive values are local time
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _float(value):
+    return math.nan if value is None else float(value)
+
+
+def _int(value):
+    return NULL_INT if value is None else value
+
+
+def _from_float(value):
+    return None if math.isnan(value) else value
+
+
+def _from_int(value):
+    return None if value == NULL_INT else value
+
+
+def _from_time(value):
+    return None if value == NULL_INT else EPOCH + timedelta(microseconds=value)
+
+
+class RecordCodec:
+    """
+    Fixed-width binary form of a writer's rows, built from its column list.
+    Prices and quantities are doubles, or int64 for the scaled integers of
+    coin_tick_table (scaled=True). NULLs are NaN or INT64_MIN.
+    """
+
+    def __init__(self, columns, scaled=False):
+        self.columns = tuple(columns)
+        codes, self.encoders, self.decoders = [], [], []
+        for column in self.columns:
+            if column in ("timestamp", "updated_at"):
+                code = ("q", _time_us, _from_time)
+            elif column == "exchange":
+                code = ("B", EXCHANGES.index, EXCHANGES.__getitem__)
+            elif column in ("coin_id", "price_scale", "qty_scale"):
+                code = ("q", _int, _from_int)
+            elif scaled:
+                code = ("q", _int, _from_int)
+            else:
+                code = ("d", _float, _from_float)
+            codes.append(code[0])
+            self.encoders.append(code[1])
+            self.decoders.append(code[2])
+        self.struct = struct.Struct("<" + "".join(codes))
+        self.record_size = RECORD_CRC.size + self.struct.size
+        self.columns_crc = zlib.crc32(",".join(self.columns).encode())
+
+    def encode(self, row):
+        payload = self.struct.pack(
+            *[encode(value) for encode, value in zip(self.encoders, row)]
+        )
+        return RECORD_CRC.pack(zlib.crc32(payload)) + payload
+
+    def decode(self, record):
+        # None for a torn or never written record
+        payload = record[RECORD_CRC.size :]
+        if RECORD_CRC.unpack_from(record)[0] != zlib.crc32(payload):
+            return None
+        return tuple(
+            decode(value)
+            for decode, value in zip(self.decoders, self.struct.unpack(payload))
+        )
+
+
+class SpillBuffer:
+    """
+    Append-only spill of one table's rows. Records go into a preallocated,
+    memory-mapped segment of SPILL_SEGMENT_BYTES; a full segment is sealed
+    (truncated to its records) and the next one started. Only one segment is
+    mapped at a time, so memory stays bounded however long the outage.
+    Sealed segments are replayed oldest first by SpillReplayer, which keeps
+    its progress in the segment header so a restart does not load rows twice.
+    """
+
+    def __init__(
+        self,
+        directory,
+        table,
+        columns,
+        scaled=False,
+        segment_bytes=SPILL_SEGMENT_BYTES,
+        max_bytes=SPILL_MAX_BYTES,
+        retention_hours=SPILL_RETENTION_HOURS,
+    ):
+        self.directory = os.path.join(directory, table)
+        self.table = table
+        self.codec = RecordCodec(columns, scaled)
+        self.capacity = (segment_bytes - HEADER_SIZE) // self.codec.record_size
+        if self.capacity < 1:
+            raise ValueError(f"Spill segments of {segment_bytes} bytes hold no rows")
+        self.max_bytes = max_bytes
+        self.retention = retention_hours * 3600
+        self.lock = threading.Lock()
+        self.file = None
+        self.map = None
+        self.path = None
+        self.count = 0
+        os.makedirs(self.directory, exist_ok=True)
+        # A segment a previous run was still writing is replayed up to its
+        # last valid record like a sealed one
+        for path in glob.glob(os.path.join(self.directory, "*.seg.tmp")):
+            os.replace(path, path[: -len(".tmp")])
+        existing = self.segments()
+        self.sequence = int(os.path.basename(existing[-1])[:12]) if existing else 0
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "*.seg")))
+
+    def _open_segment(self):
+        self.sequence += 1
+        self.path = os.path.join(self.directory, f"{self.sequence:012d}.seg")
+        size = HEADER_SIZE + self.capacity * self.codec.record_size
+        self.file = open(self.path + ".tmp", "w+b")
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        HEADER.pack_into(
+            self.map,
+            0,
+            MAGIC,
+            self.codec.record_size,
+            self.codec.columns_crc,
+            0,
+            int(time.time()),
+        )
+        self.count = 0
+
+    def _seal(self):
+        if self.map is None:
+            return
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(HEADER_SIZE + self.count * self.codec.record_size)
+        self.file.close()
+        # The .seg name is only given once the segment is complete
+        os.replace(self.path + ".tmp", self.path)
+        self.file = self.map = self.path = None
+        self.count = 0
+
+    def append(self, rows):
+        record_size = self.codec.record_size
+        with self.lock:
+            for row in rows:
+                if self.map is None:
+                    self._open_segment()
+                offset = HEADER_SIZE + self.count * record_size
+                self.map[offset : offset + record_size] = self.codec.encode(row)
+                self.count += 1
+                if self.count == self.capacity:
+                    self._seal()
+                    self.enforce_limits()
+        SPILL_ROWS.labels(self.table, "spilled").inc(len(rows))
+        return len(rows)
+
+    def seal(self):
+        # Makes the rows spilled so far replayable
+        with self.lock:
+            if self.count:
+                self._seal()
+
+    def pending(self):
+        return bool(self.count) or bool(self.segments())
+
+    @staticmethod
+    def created(path):
+        with open(path, "rb") as file:
+            return HEADER.unpack(file.read(HEADER.size))[4]
+
+    def enforce_limits(self):
+        segments = self.segments()
+        sizes = [os.path.getsize(path) for path in segments]
+        total = sum(sizes)
+        cutoff = time.time() - self.retention
+        for path, size in zip(segments, sizes):
+            if total <= self.max_bytes and self.created(path) >= cutoff:
+                break
+            rows = (size - HEADER_SIZE) // self.codec.record_size
+            print(f"Spill limits reached, dropping {rows} rows in {path}")
+            SPILL_ROWS.labels(self.table, "expired").inc(rows)
+            os.remove(path)
+            total -= size
+
+    def read(self, path, chunk_rows=SPILL_REPLAY_ROWS):
+        """
+        Yields (end, rows) chunks of a sealed segment from where replay last
+        stopped; pass end to mark_replayed once the rows are committed.
+        """
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic, record_size, columns_crc, replayed, _ = HEADER.unpack_from(data)
+                if (
+                    magic != MAGIC
+                    or record_size != self.codec.record_size
+                    or columns_crc != self.codec.columns_crc
+                ):
+                    raise ValueError(f"{path} was spilled with another row layout")
+                total = (len(data) - HEADER_SIZE) // record_size
+                index = replayed
+                while index < total:
+                    rows = []
+                    end = min(total, index + chunk_rows)
+                    for i in range(index, end):
+                        offset = HEADER_SIZE + i * record_size
+                        row = self.codec.decode(data[offset : offset + record_size])
+                        if row is None:
+                            total = i  # Torn tail of a crashed writer
+                            break
+                        rows.append(row)
+                    if rows:
+                        yield index + len(rows), rows
+                    index = end
+            finally:
+                data.close()
+
+    def quarantine(self, path):
+        # Moves a segment that cannot be replayed out of the replay order
+        directory = os.path.join(self.directory, "quarantine")
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "rb") as file:
+            replayed = HEADER.unpack(file.read(HEADER.size))[3]
+        rows = (os.path.getsize(path) - HEADER_SIZE) // self.codec.record_size
+        target = os.path.join(directory, os.path.basename(path))
+        os.replace(path, target)
+        SPILL_ROWS.labels(self.table, "quarantined").inc(max(0, rows - replayed))
+        return target
+
+    def mark_replayed(self, path, end):
+        with open(path, "r+b") as file:
+            file.seek(REPLAYED_OFFSET)
+            file.write(struct.pack("<Q", end))
+
+    def close(self):
+        with self.lock:
+            self._seal()
+
+
+class SpillReplayer:
+    """
+    Background thread that bulk loads spilled rows with COPY once the
+    database answers again, on its own connection so the collector's writer
+    is never blocked by a replay. Replayed rows skip latest_coin_data_table,
+    since the live writer has newer quotes by then, but go to the writer's
+    on_flush callback like any committed rows. A segment whose replay keeps
+    failing while the database is reachable is quarantined after
+    SPILL_REPLAY_FAILURES attempts, so it cannot hold up the ones after it.
+    """
+
+    def __init__(
+        self,
+        spill,
+        interval=SPILL_REPLAY_INTERVAL,
+        on_flush=None,
+        max_failures=SPILL_REPLAY_FAILURES,
+    ):
+        self.spill = spill
+        self.interval = interval
+        self.on_flush = on_flush
+        self.max_failures = max_failures
+        self.failures = {}  # Segment path -> failed replays
+        self.db_manager = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name=f"spill-replay-{self.spill.table}", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def healthy(self):
+        if self.db_manager is None or self.db_manager.conn is None:
+            self.db_manager = DBManager()
+        if self.db_manager.conn is None or self.db_manager.conn.closed:
+            self.db_manager = None
+            return False
+        return self.db_manager.execute_query("SELECT 1;") is not None
+
+    def replay(self):
+        if not self.spill.pending() or not self.healthy():
+            return 0
+        self.spill.seal()
+        writer = self.db_manager.create_batch_writer(
+            self.spill.table,
+            self.spill.codec.columns,
+            flush_size=SPILL_REPLAY_ROWS,
+            on_flush=self.on_flush,
+        )
+        self.db_manager.writers.remove(writer)  # Flushed here, not on close()
+        replayed = 0
+        for path in self.spill.segments():
+            try:
+                for end, rows in self.spill.read(path):
+                    writer.rows = rows
+                    writer.flush()
+                    if writer.last_error is not None:
+                        raise writer.last_error
+                    self.spill.mark_replayed(path, end)
+                    SPILL_ROWS.labels(self.spill.table, "replayed").inc(len(rows))
+                    replayed += len(rows)
+            except CONNECTION_ERRORS:
+                print(f"Replay of {path} stopped, retrying later")
+                return replayed
+            except Exception as e:
+                if not self.failed(path, e):
+                    return replayed
+                continue
+            self.failures.pop(path, None)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Expired by enforce_limits meanwhile
+        if replayed:
+            print(f"Replayed {replayed} spilled rows into {self.spill.table}")
+        return replayed
+
+    def failed(self, path, error):
+        # Counts a failed replay of a segment; True once it is quarantined
+        failures = self.failures.get(path, 0) + 1
+        if failures < self.max_failures:
+            self.failures[path] = failures
+            print(f"Replay of {path} failed ({failures}): {error}, retrying later")
+            return False
+        self.failures.pop(path, None)
+        target = self.spill.quarantine(path)
+        print(f"Replay of {path} failed {failures} times ({error}), moved to {target}")
+        return True
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.replay()
+            except Exception as e:
+                print(f"Error replaying spilled rows: {e}")
+                if self.db_manager is not None:
+                    self.db_manager.close()
+                    self.db_manager = None
+
+
+_spills = {}
+_spills_lock = threading.Lock()
+
+
+def open_spill(name, table, columns, scaled=False, on_flush=None):
+    """
+    The spill buffer for a collector's table, shared by all of its writers
+    and replayed by one background thread, which hands the replayed rows to
+    on_flush; None when SPILL_DIR is empty.
+    """
+    if not SPILL_DIR:
+        return None
+    directory = os.path.join(SPILL_DIR, name)
+    with _spills_lock:
+        spill = _spills.get((directory, table))
+        if spill is None:
+            spill = SpillBuffer(directory, table, columns, scaled)
+            SpillReplayer(spill, on_flush=on_flush).start()
+            atexit.register(spill.close)
+            _spills[(directory, table)] = spill
+    return spill
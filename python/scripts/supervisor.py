@@ -0,0 +1,187 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+from coin_listener import CoinSet, run_listener_thread
+from metrics import METRICS_PORT, REGISTRY, Counter, Gauge, start_metrics_server
+from sharding import SHARD_REPLICAS, HashRing
+
+COLLECTORS = {
+    "coinex": "ws_coinex.py",
+    "binance": "ws_binance.py",
+}
+COLLECTOR_SHARDS = int(os.getenv("COLLECTOR_SHARDS", str(os.cpu_count() or 1)))
+RESTART_DELAY = float(os.getenv("SHARD_RESTART_DELAY", "1"))
+MAX_RESTART_DELAY = float(os.getenv("SHARD_MAX_RESTART_DELAY", "60"))
+# A shard that stayed up this long starts again from RESTART_DELAY
+STABLE_SECONDS = float(os.getenv("SHARD_STABLE_SECONDS", "60"))
+
+SHARD_RESTARTS = REGISTRY.register(
+    Counter("supervisor_shard_restarts", "Collector shard restarts", ["shard"])
+)
+SHARD_COINS = REGISTRY.register(
+    Gauge("supervisor_shard_coins", "Collecting coins per shard", ["shard"])
+)
+
+
+class ShardProcess:
+    """
+    One collector process for one shard. Its coin list, DB connection and
+    writer are its own: it filters coins_table through the same HashRing
+    (SHARD_INDEX / SHARD_COUNT) and follows coins_changed by itself.
+    """
+
+    def __init__(self, collector, index, count, metrics_port=0):
+        self.collector = collector
+        self.index = index
+        self.count = count
+        self.name = f"{collector}-{index}"
+        self.metrics_port = metrics_port
+        self.process = None
+        self.started_at = 0.0
+        self.restart_delay = RESTART_DELAY
+        self.restart_at = 0.0
+
+    def environment(self):
+        env = dict(os.environ)
+        env["SHARD_INDEX"] = str(self.index)
+        env["SHARD_COUNT"] = str(self.count)
+        env["SHARD_REPLICAS"] = str(SHARD_REPLICAS)
+        env["METRICS_PORT"] = str(self.metrics_port)
+        env["PYTHONUNBUFFERED"] = "1"
+        return env
+
+    def start(self):
+        script = os.path.join(os.path.dirname(__file__), COLLECTORS[self.collector])
+        self.process = subprocess.Popen(
+            [sys.executable, script], env=self.environment()
+        )
+        self.started_at = time.monotonic()
+        print(f"Started shard {self.name} (pid {self.process.pid})")
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def check(self, now):
+        """
+        Restarts the process if it exited, with a doubling delay while it
+        keeps failing. Other shards are not touched.
+        """
+        if self.running():
+            if now - self.started_at >= STABLE_SECONDS:
+                self.restart_delay = RESTART_DELAY
+            return
+        if self.process is not None:
+            print(
+                f"Shard {self.name} exited with {self.process.returncode}, "
+                f"restarting in {self.restart_delay:.0f}s"
+            )
+            self.process = None
+            self.restart_at = now + self.restart_delay
+            self.restart_delay = min(self.restart_delay * 2, MAX_RESTART_DELAY)
+            SHARD_RESTARTS.labels(self.name).inc()
+        if now >= self.restart_at:
+            self.start()
+
+    def stop(self, timeout=10):
+        if not self.running():
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            print(f"Shard {self.name} did not stop, killing it")
+            self.process.kill()
+            self.process.wait()
+
+
+class Supervisor:
+    """
+    Runs `shards` processes per collector. Coins are spread over them by
+    consistent hashing on coin_name, so a coin added to or removed from
+    coins_table is picked up by exactly one shard (through its own
+    coins_changed listener) and the others keep their sockets.
+    """
+
+    def __init__(self, collectors, shards, metrics_port=METRICS_PORT):
+        self.ring = HashRing(shards)
+        self.coins = CoinSet()
+        self.stop_event = threading.Event()
+        self.processes = []
+        for i, (collector, index) in enumerate(
+            (collector, index) for collector in collectors for index in range(shards)
+        ):
+            # Shard endpoints follow the supervisor's own, 0 keeps them off
+            port = metrics_port + 1 + i if metrics_port else 0
+            self.processes.append(ShardProcess(collector, index, shards, port))
+
+    def on_coin_events(self, events):
+        for event in events:
+            self.coins.apply(event)
+        self.report()
+
+    def on_coin_resync(self, coins):
+        self.coins.update(coins)
+        self.report()
+
+    def report(self):
+        # The shards rebalance themselves; this only exposes the spread
+        assignment = self.ring.assign(self.coins)
+        for index, coins in assignment.items():
+            SHARD_COINS.labels(str(index)).set(len(coins))
+        counts = ", ".join(
+            f"{index}: {len(coins)}" for index, coins in assignment.items()
+        )
+        print(f"{len(self.coins)} collecting coins over shards ({counts})")
+
+    def run(self, interval=1.0):
+        run_listener_thread(self.on_coin_events, self.on_coin_resync, self.stop_event)
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                for process in self.processes:
+                    process.check(now)
+                self.stop_event.wait(interval)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        for process in self.processes:
+            if process.running():
+                process.process.terminate()
+        for process in self.processes:
+            process.stop()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Run the collectors as consistently hashed shards."
+    )
+    parser.add_argument(
+        "--collectors",
+        nargs="+",
+        choices=sorted(COLLECTORS),
+        default=sorted(COLLECTORS),
+        help="Collectors to shard (default all)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=COLLECTOR_SHARDS,
+        help="Processes per collector (default COLLECTOR_SHARDS or CPU count)",
+    )
+    args = parser.parse_args()
+
+    supervisor = Supervisor(args.collectors, args.shards)
+    signal.signal(signal.SIGTERM, lambda *_: supervisor.stop_event.set())
+    start_metrics_server()
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
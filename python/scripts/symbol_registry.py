@@ -0,0 +1,74 @@
+class SymbolRegistry:
+    """
+    In-memory coin_name -> coin_id map over coins_table, shared by the
+    collectors so the hot path never queries coins_table per tick.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.ids = {}
+        self.precisions = {}
+        self.refresh()
+
+    def refresh(self):
+        result = self.db_manager.execute_query(
+            "SELECT coin_name, coin_id, precision_binance, precision_coinex "
+            "FROM coins_table;"
+        )
+        if result is not None:
+            self.ids = {coin_name: coin_id for coin_name, coin_id, _, _ in result}
+            self.precisions = {
+                (coin_id, exchange): precision
+                for _, coin_id, binance, coinex in result
+                for exchange, precision in (("BINANCE", binance), ("COINEX", coinex))
+                if precision is not None
+            }
+            print(f"Symbol registry loaded {len(self.ids)} coins")
+        return self.ids
+
+    def get(self, coin_name):
+        return self.ids.get(coin_name)
+
+    def precision(self, coin_id, exchange):
+        # Decimal places of the coin's prices and quantities on the exchange,
+        # None when not known
+        return self.precisions.get((coin_id, exchange))
+
+    def remember(self, coin_name, coin_id):
+        # A coin_id learnt elsewhere, e.g. from a coins_changed notification
+        self.ids[coin_name] = coin_id
+
+    def get_or_create(self, coin_name):
+        coin_id = self.ids.get(coin_name)
+        if coin_id is None:
+            coin_id = self.resolve([coin_name]).get(coin_name)
+        return coin_id
+
+    def resolve(self, coin_names):
+        missing = sorted({name for name in coin_names if name not in self.ids})
+        if missing:
+            self.create(missing)
+        return {name: self.ids.get(name) for name in coin_names}
+
+    def create(self, coin_names):
+        # Insert all unknown coins in one round trip; rows that already exist
+        # (e.g. added by another collector) are picked up from coins_table
+        query = """
+        WITH inserted AS (
+            INSERT INTO coins_table (coin_name)
+            SELECT unnest(%s::text[])
+            ON CONFLICT (coin_name) DO NOTHING
+            RETURNING coin_name, coin_id
+        )
+        SELECT coin_name, coin_id FROM inserted
+        UNION ALL
+        SELECT coin_name, coin_id FROM coins_table WHERE coin_name = ANY(%s::text[]);
+        """
+        result = self.db_manager.execute_query(query, (coin_names, coin_names))
+        if result is None:
+            print(f"Error: Could not create coins {coin_names}")
+            return {}
+        self.db_manager.commit()
+        created = dict(result)
+        self.ids.update(created)
+        return created
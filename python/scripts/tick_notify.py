@@ -0,0 +1,79 @@
+import json
+import os
+
+# Channel the collectors announce their committed ticks on, for
+# premium_engine.py; empty turns the notifications off
+TICK_CHANNEL = os.getenv("TICK_CHANNEL", "ticks")
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+TICK_PAYLOAD_BYTES = 7000
+
+NOTIFY_QUERY = "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload;"
+ASYNC_NOTIFY_QUERY = "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload"
+
+
+class TickNotifier:
+    """
+    Turns the rows of a tick flush into NOTIFY payloads on TICK_CHANNEL: JSON
+    lists of [coin_id, exchange, epoch ms, bid, ask] ticks, as many as fit in
+    one payload. The writers send them inside the flush's transaction, so
+    listeners hear about exactly the committed ticks, once they commit.
+    """
+
+    def __init__(self, columns, channel=TICK_CHANNEL):
+        columns = tuple(columns)
+        self.channel = channel
+        self.coin_index = columns.index("coin_id")
+        self.exchange_index = columns.index("exchange")
+        self.time_index = columns.index("timestamp")
+        self.bid_index = columns.index("best_bid")
+        self.ask_index = columns.index("best_ask")
+        # coin_tick_table rows carry scaled integer prices
+        self.scale_index = (
+            columns.index("price_scale") if "price_scale" in columns else None
+        )
+
+    def payloads(self, rows):
+        payloads, parts, size = [], [], 2
+        for row in rows:
+            bid, ask = row[self.bid_index], row[self.ask_index]
+            if bid is None or ask is None:
+                continue
+            bid, ask = float(bid), float(ask)
+            if self.scale_index is not None:
+                divisor = 10.0 ** row[self.scale_index]
+                bid, ask = bid / divisor, ask / divisor
+            part = json.dumps(
+                [
+                    row[self.coin_index],
+                    row[self.exchange_index],
+                    round(row[self.time_index].timestamp() * 1000),
+                    bid,
+                    ask,
+                ],
+                separators=(",", ":"),
+            )
+            if parts and size + len(part) + 1 > TICK_PAYLOAD_BYTES:
+                payloads.append(f"[{','.join(parts)}]")
+                parts, size = [], 2
+            parts.append(part)
+            size += len(part) + 1
+        if parts:
+            payloads.append(f"[{','.join(parts)}]")
+        return payloads
+
+    def notify(self, cursor, rows):
+        payloads = self.payloads(rows)
+        if payloads:
+            cursor.execute(NOTIFY_QUERY, (self.channel, payloads))
+        return len(payloads)
+
+    async def notify_async(self, conn, rows):
+        payloads = self.payloads(rows)
+        if payloads:
+            await conn.execute(ASYNC_NOTIFY_QUERY, self.channel, payloads)
+        return len(payloads)
+
+
+def open_tick_notifier(columns):
+    # TickNotifier for a tick writer's rows, or None when TICK_CHANNEL is empty
+    return TickNotifier(columns) if TICK_CHANNEL else None
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from metrics import QUEUE_DEPTH, QUEUE_DROPPED, QUEUE_WAIT_SECONDS
+
+POLICIES = ("drop_oldest", "coalesce", "block")
+
+
+class TickPipeline:
+    """
+    Bounded hand-off between a websocket receive callback and DB writer
+    threads. put() never touches the database; worker threads drain the
+    buffer in batches and pass each batch to the handler they were given.
+
+    When the buffer is full the policy decides what happens:
+      drop_oldest - evict the oldest tick to make room
+      coalesce    - keep one pending tick per key (newest wins), evicting the
+                    oldest key when a new key arrives and the buffer is full
+      block       - wait in put() until a worker frees space
+    """
+
+    def __init__(
+        self,
+        handler_factory,
+        maxsize=10000,
+        policy="drop_oldest",
+        workers=1,
+        batch_size=500,
+        poll_interval=0.1,
+        name="ticks",
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.handler_factory = handler_factory
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.buffer = OrderedDict() if policy == "coalesce" else deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.running = False
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.name = name
+        QUEUE_DEPTH.set_function(lambda: len(self.buffer), name)
+        QUEUE_DROPPED.set_function(lambda: self.dropped, name)
+        self.threads = [
+            threading.Thread(target=self._worker, name=f"tick-writer-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        self.running = True
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=10):
+        with self.lock:
+            self.running = False
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def put(self, key, item):
+        with self.lock:
+            self.received += 1
+            entry = (time.monotonic(), item)
+            if self.policy == "coalesce":
+                if key in self.buffer:
+                    # Keep the original enqueue time so queue wait stays honest
+                    self.buffer[key] = (self.buffer[key][0], item)
+                    self.coalesced += 1
+                    return
+                if len(self.buffer) >= self.maxsize:
+                    self.buffer.popitem(last=False)
+                    self.dropped += 1
+                self.buffer[key] = entry
+            else:
+                if self.policy == "block":
+                    while len(self.buffer) >= self.maxsize and self.running:
+                        self.not_full.wait()
+                elif len(self.buffer) >= self.maxsize:
+                    self.buffer.popleft()
+                    self.dropped += 1
+                self.buffer.append(entry)
+            self.not_empty.notify()
+
+    def get_batch(self):
+        with self.lock:
+            if not self.buffer and self.running:
+                self.not_empty.wait(self.poll_interval)
+            entries = []
+            while self.buffer and len(entries) < self.batch_size:
+                if self.policy == "coalesce":
+                    entries.append(self.buffer.popitem(last=False)[1])
+                else:
+                    entries.append(self.buffer.popleft())
+            if entries:
+                self.not_full.notify_all()
+        now = time.monotonic()
+        wait = QUEUE_WAIT_SECONDS.labels(self.name)
+        for enqueued_at, _ in entries:
+            wait.observe(now - enqueued_at)
+        return [item for _, item in entries]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "queue_depth": len(self.buffer),
+                "queue_capacity": self.maxsize,
+                "received": self.received,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "processed": self.processed,
+            }
+
+    def _worker(self):
+        handler = self.handler_factory()
+        while True:
+            batch = self.get_batch()
+            try:
+                handler(batch)
+            except Exception as e:
+                print(f"Error in tick writer: {e}")
+            with self.lock:
+                self.processed += len(batch)
+                if not self.running and not self.buffer:
+                    break
+        try:
+            handler(None)  # Signals shutdown so the handler can flush what it holds
+        except Exception as e:
+            print(f"Error flushing tick writer on shutdown: {e}")
@@ -1,24 +1,115 @@
 import aiohttp
 import asyncio
+import json
+import os
+import signal
+import time
 from datetime import datetime, timedelta, timezone
-from db_manager import DBManager
+from async_db_manager import DB_ASYNC, AsyncDBManager
+from coin_listener import CoinSet, listen
+from compact_ticks import (
+    STORAGE_MODE,
+    CompactEncoder,
+    create_tick_writer,
+    tick_columns,
+)
+from conflator import DEFAULT_CONFLATE_INTERVAL, TickConflator
+from db_manager import LATEST_UPSERT, DBManager
+from decoders import binance_rest_tick, binance_tick, loads
+from feed_capture import open_capture
+from metrics import (
+    DECODE_SECONDS,
+    MESSAGES_RECEIVED,
+    RECONNECTS,
+    REGISTRY,
+    Gauge,
+    SampledLogger,
+    observe_lag,
+    start_metrics_server,
+)
+from quote_board import open_quote_board
+from rollups import start_rollups
+from sharding import shard_from_env
+from symbol_registry import SymbolRegistry
+
+BINANCE_COLUMNS = (
+    "coin_id",
+    "timestamp",
+    "best_bid",
+    "best_ask",
+    "best_bid_qty",
+    "best_ask_qty",
+    "mark_price",
+    "last_price",
+    "exchange",
+)
+
+COINS_API_URL = os.getenv("COINS_API_URL", "http://nestjs:3000/coins")
+BINANCE_REST_URL = os.getenv("BINANCE_REST_URL", "https://fapi.binance.com")
+BINANCE_STREAM_URL = os.getenv("BINANCE_STREAM_URL", "wss://fstream.binance.com")
+
+# Binance allows at most 200 streams per connection; each symbol uses two
+SYMBOLS_PER_CONNECTION = int(os.getenv("BINANCE_SYMBOLS_PER_CONNECTION", "100"))
+
+# Bulk REST mode: request weight Binance allows per minute and the share of
+# it the poller may use, leaving room for other clients on the same IP
+BINANCE_WEIGHT_LIMIT = int(os.getenv("BINANCE_WEIGHT_LIMIT", "2400"))
+BINANCE_WEIGHT_TARGET = float(os.getenv("BINANCE_WEIGHT_TARGET", "0.5"))
+BULK_MIN_INTERVAL = float(os.getenv("BINANCE_BULK_MIN_INTERVAL", "0.5"))
+BULK_MAX_INTERVAL = float(os.getenv("BINANCE_BULK_MAX_INTERVAL", "10"))
+# All-symbol bookTicker (5) plus premiumIndex (10), until measured
+BULK_CYCLE_WEIGHT = float(os.getenv("BINANCE_BULK_CYCLE_WEIGHT", "15"))
+
+USED_WEIGHT = REGISTRY.register(
+    Gauge("collector_binance_used_weight", "Binance REST weight used this minute")
+)
+received = MESSAGES_RECEIVED.labels("BINANCE")
+decode_seconds = DECODE_SECONDS.labels("BINANCE")
+tick_log = SampledLogger("ws_binance")
 
 
 class BinanceFuturesTicker:
     def __init__(self):
+        self.shard = shard_from_env()
+        self.coins = CoinSet(shard=self.shard)
         self.symbols = []
+        self.symbols_changed = asyncio.Event()
         self.session = None
         self.next_update_time = datetime.now(timezone.utc)
         self.db_manager = DBManager()
+        self.registry = SymbolRegistry(self.db_manager)
+        # The async pool keeps COPY flushes off the event loop; the blocking
+        # DBManager is still used for the occasional registry lookup
+        self.async_db_manager = AsyncDBManager() if DB_ASYNC else None
+        self.rollups = start_rollups(tick_columns(BINANCE_COLUMNS), "BINANCE")
+        self.name = "binance" if self.shard is None else f"binance-{self.shard.index}"
+        self.writer = create_tick_writer(
+            self.async_db_manager or self.db_manager,
+            BINANCE_COLUMNS,
+            LATEST_UPSERT,
+            self.name,
+            self.rollups.aggregator.add_rows if self.rollups else None,
+        )
+        self.encoder = CompactEncoder(self.registry, "BINANCE")
+        self.board = open_quote_board(self.name)
+        self.conflator = None
+        if DEFAULT_CONFLATE_INTERVAL > 0:
+            self.conflator = TickConflator(self.save_to_database)
 
     async def update_symbols(self):
         if datetime.now(timezone.utc) >= self.next_update_time:
             try:
-                coin_url = "http://nestjs:3000/coins"
-                async with self.session.get(coin_url) as response:
+                async with self.session.get(COINS_API_URL) as response:
                     if response.status == 200:
-                        coins_data = await response.json()
-                        self.symbols = [coin["coin_name"] for coin in coins_data]
+                        coins_data = await response.json(loads=loads)
+                        self.registry.refresh()
+                        await self.apply_symbol_changes(
+                            *self.coins.update(
+                                coin["coin_name"]
+                                for coin in coins_data
+                                if coin.get("collecting")
+                            )
+                        )
                         self.next_update_time += timedelta(days=1)
                         print(f"Updated symbols: {self.symbols}")
                     else:
@@ -28,104 +119,498 @@ class BinanceFuturesTicker:
             except Exception as e:
                 print(f"Error fetching coin list from NestJS backend: {e}")
 
+    async def apply_symbol_changes(self, added, removed):
+        if not added and not removed:
+            return
+        print(f"Symbols changed: +{added} -{removed}")
+        self.symbols = list(self.coins)
+        self.registry.resolve(added)
+        self.symbols_changed.set()
+
+    async def on_coin_events(self, events):
+        added, removed = set(), set()
+        for event in events:
+            if event.get("coin_id") is not None and event.get("op") != "DELETE":
+                self.registry.remember(event["coin_name"], event["coin_id"])
+            event_added, event_removed = self.coins.apply(event)
+            added.update(event_added)
+            removed.update(event_removed)
+        await self.apply_symbol_changes(
+            sorted(added - removed), sorted(removed - added)
+        )
+
+    async def on_coin_resync(self, coins):
+        await self.apply_symbol_changes(*self.coins.update(coins))
+
+    async def wait_for_symbols(self, timeout=3600):
+        self.symbols_changed.clear()
+        try:
+            await asyncio.wait_for(self.symbols_changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
     async def get_book_ticker_and_mark_price(self, symbol):
         try:
             book_ticker_url = (
-                f"https://fapi.binance.com/fapi/v1/ticker/bookTicker?symbol={symbol}"
+                f"{BINANCE_REST_URL}/fapi/v1/ticker/bookTicker?symbol={symbol}"
             )
             async with self.session.get(book_ticker_url) as book_ticker_response:
                 if book_ticker_response.status == 200:
-                    book_ticker_data = await book_ticker_response.json()
+                    book_ticker_data = await book_ticker_response.json(loads=loads)
                 else:
                     print(
                         f"Error fetching book ticker for {symbol}: {book_ticker_response.status}"
                     )
                     return None
 
-            mark_price_url = (
-                f"https://fapi.binance.com/fapi/v1/premiumIndex?symbol={symbol}"
-            )
+            mark_price_url = f"{BINANCE_REST_URL}/fapi/v1/premiumIndex?symbol={symbol}"
             async with self.session.get(mark_price_url) as mark_price_response:
                 if mark_price_response.status == 200:
-                    mark_price_data = await mark_price_response.json()
+                    mark_price_data = await mark_price_response.json(loads=loads)
                 else:
                     print(
                         f"Error fetching mark price for {symbol}: {mark_price_response.status}"
                     )
                     return None
 
-            combined_data = {
-                "symbol": symbol,
-                "bidPrice": float(book_ticker_data.get("bidPrice", 0)),
-                "bidQty": float(book_ticker_data.get("bidQty", 0)),
-                "askPrice": float(book_ticker_data.get("askPrice", 0)),
-                "askQty": float(book_ticker_data.get("askQty", 0)),
-                "time": datetime.fromtimestamp(
-                    book_ticker_data.get("time", 0) / 1000, timezone.utc
-                ),
-                "lastUpdateId": book_ticker_data.get("lastUpdateId", 0),
-                "mark_price": float(mark_price_data.get("markPrice", 0)),
-            }
-            return combined_data
+            book_ticker_data.setdefault("symbol", symbol)
+            return binance_rest_tick(
+                book_ticker_data, float(mark_price_data.get("markPrice", 0))
+            )
 
         except Exception as e:
             print(f"Exception in fetching data for {symbol}: {e}")
             return None
 
-    def save_to_database(self, data):
-        query = """
-        INSERT INTO coin_data_table (coin_id, timestamp, best_bid, best_ask, best_bid_qty, best_ask_qty, mark_price, last_price, exchange)
-        VALUES ((SELECT coin_id FROM coins_table WHERE coin_name = %s), %s, %s, %s, %s, %s, %s, %s, 'BINANCE')
-        RETURNING data_id;
-        """
+    async def poll(self):
+        # One REST cycle: two symbol-scoped requests per tracked symbol
+        tasks = [self.get_book_ticker_and_mark_price(symbol) for symbol in self.symbols]
+        ticks = []
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Task failed with exception: {result}")
+            elif result:
+                ticks.append(result)
+        return ticks
+
+    def poll_interval(self):
+        return 0.5  # Modify sleep duration as needed
+
+    def save_to_database(self, tick):
         try:
-            self.db_manager.execute_query(
-                query,
+            coin_id = self.registry.get_or_create(tick.symbol)
+            if coin_id is None:
+                print(f"Error: Could not find or insert coin_id for {tick.symbol}")
+                return
+            if STORAGE_MODE == "compact":
+                self.writer.add(self.encoder.row(coin_id, tick))
+                return
+            self.writer.add(
                 (
-                    data["symbol"],
-                    data["time"],
-                    data["bidPrice"],
-                    data["askPrice"],
-                    data["bidQty"],
-                    data["askQty"],
-                    data["mark_price"],
-                    data["mark_price"],
-                ),
+                    coin_id,
+                    tick.time,
+                    tick.best_bid,
+                    tick.best_ask,
+                    tick.best_bid_qty,
+                    tick.best_ask_qty,
+                    tick.mark_price,
+                    tick.last_price,
+                    "BINANCE",
+                )
             )
-            self.db_manager.commit()
         except Exception as e:
             print(f"Error saving data to database: {e}")
 
+    def handle_tick(self, tick):
+        if self.board:
+            self.board.publish(tick)
+        if self.conflator:
+            self.conflator.offer(tick.symbol, "BINANCE", tick.version, tick)
+        else:
+            self.save_to_database(tick)
+
+    async def conflation_loop(self):
+        while True:
+            await asyncio.sleep(self.conflator.interval)
+            self.conflator.flush()
+
+    def start_conflation(self):
+        if self.conflator:
+            return asyncio.create_task(self.conflation_loop())
+        return None
+
+    async def stop_conflation(self, task):
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self.conflator.flush()
+
+    async def connect_db(self):
+        if self.async_db_manager:
+            await self.async_db_manager.connect()
+
+    async def close_db(self):
+        if self.async_db_manager:
+            await self.async_db_manager.close()
+        self.db_manager.close()
+        if self.rollups:
+            self.rollups.stop()  # After the last tick flush
+        if self.board:
+            self.board.close()
+
     async def run(self):
         self.session = aiohttp.ClientSession()
+        await self.connect_db()
+        conflation = self.start_conflation()
+        listener = asyncio.create_task(listen(self.on_coin_events, self.on_coin_resync))
         try:
             while True:
                 await self.update_symbols()
 
                 if not self.symbols:
-                    print("No symbols available, skipping data fetch.")
-                    await asyncio.sleep(3600)  # Sleep for an hour if no symbols
+                    print("No symbols available, waiting for coins_table changes.")
+                    await self.wait_for_symbols()
                     continue
 
-                tasks = [
-                    self.get_book_ticker_and_mark_price(symbol)
-                    for symbol in self.symbols
-                ]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
+                for tick in await self.poll():
+                    received.inc()
+                    observe_lag("BINANCE", tick.timestamp)
+                    tick_log.debug("Data for %s: %s", tick.symbol, tick)
+                    self.handle_tick(tick)
+                self.writer.flush_if_due()
+
+                await asyncio.sleep(self.poll_interval())
+        finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+            await self.stop_conflation(conflation)
+            await self.session.close()
+            await self.close_db()
+
+
+class WeightBudget:
+    """
+    Paces bulk REST cycles by the X-MBX-USED-WEIGHT-1M header: the weight a
+    cycle really costs is measured from the header, and the next cycle is
+    scheduled so that the weight left in the current minute lasts until
+    the minute ends, never faster than the target share of the limit
+    allows. A 429 or 418 answer pauses polling for its Retry-After.
+    """
 
-                for result in results:
-                    if isinstance(result, Exception):
-                        print(f"Task failed with exception: {result}")
-                    elif result:
-                        print(f"Data for {result['symbol']}: {result}")
-                        self.save_to_database(result)
+    def __init__(
+        self,
+        limit=BINANCE_WEIGHT_LIMIT,
+        target=BINANCE_WEIGHT_TARGET,
+        min_interval=BULK_MIN_INTERVAL,
+        max_interval=BULK_MAX_INTERVAL,
+        cycle_weight=BULK_CYCLE_WEIGHT,
+    ):
+        self.budget = limit * target
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.cycle_weight = cycle_weight
+        self.used = 0
+        self.used_at = 0.0  # Wall clock of the last header
+        self.cycle_start = None
+        self.retry_at = 0.0
 
-                await asyncio.sleep(0.5)  # Modify sleep duration as needed
+    @staticmethod
+    def minute(wall_time):
+        return int(wall_time // 60)
+
+    def observe(self, status, headers):
+        used = headers.get("X-MBX-USED-WEIGHT-1M", headers.get("X-MBX-USED-WEIGHT"))
+        if used is not None:
+            self.used = int(used)
+            self.used_at = time.time()
+            USED_WEIGHT.set(self.used)
+        if status in (418, 429):
+            retry_after = int(headers.get("Retry-After", "60"))
+            print(f"Binance REST answered {status}, pausing for {retry_after}s")
+            self.retry_at = time.monotonic() + retry_after
+
+    def start_cycle(self):
+        self.cycle_start = (self.used, self.used_at)
+
+    def end_cycle(self):
+        used, used_at = self.cycle_start
+        if self.used_at and self.minute(used_at) == self.minute(self.used_at):
+            spent = self.used - used
+            if spent > 0:
+                # Smoothed, since other clients on the IP add to the header
+                self.cycle_weight += (spent - self.cycle_weight) / 4
+
+    def delay(self):
+        now = time.time()
+        paused = self.retry_at - time.monotonic()
+        if paused > 0:
+            return paused
+        window_left = 60 - now % 60
+        used = self.used if self.minute(self.used_at) == self.minute(now) else 0
+        remaining = self.budget - used
+        if remaining < self.cycle_weight:
+            return window_left  # Budget spent, wait for the next minute
+        interval = max(
+            self.cycle_weight * 60 / self.budget,
+            window_left * self.cycle_weight / remaining,
+        )
+        return min(max(interval, self.min_interval), self.max_interval)
+
+
+class BinanceBulkTicker(BinanceFuturesTicker):
+    """
+    REST polling with two all-symbol requests per cycle instead of two per
+    symbol: /fapi/v1/ticker/bookTicker and /fapi/v1/premiumIndex without a
+    symbol, filtered to the tracked symbols in memory. Books whose
+    lastUpdateId did not move since the previous cycle are skipped, and the
+    cadence follows WeightBudget.
+    """
+
+    def __init__(self, budget=None):
+        super().__init__()
+        self.budget = budget or WeightBudget()
+        self.update_ids = {}
+
+    async def get_json(self, path):
+        try:
+            async with self.session.get(f"{BINANCE_REST_URL}{path}") as response:
+                self.budget.observe(response.status, response.headers)
+                if response.status != 200:
+                    print(f"Error fetching {path}: {response.status}")
+                    return None
+                return await response.json(loads=loads)
+        except Exception as e:
+            print(f"Exception in fetching {path}: {e}")
+            return None
+
+    async def poll(self):
+        self.budget.start_cycle()
+        book_tickers, premium_index = await asyncio.gather(
+            self.get_json("/fapi/v1/ticker/bookTicker"),
+            self.get_json("/fapi/v1/premiumIndex"),
+        )
+        self.budget.end_cycle()
+        if not book_tickers:
+            return []
+        tracked = set(self.symbols)
+        mark_prices = {
+            entry["symbol"]: float(entry["markPrice"])
+            for entry in premium_index or ()
+            if entry.get("symbol") in tracked
+        }
+        for symbol in set(self.update_ids) - tracked:
+            del self.update_ids[symbol]
+        ticks = []
+        for book_ticker in book_tickers:
+            symbol = book_ticker.get("symbol")
+            if symbol not in tracked:
+                continue
+            update_id = book_ticker.get("lastUpdateId")
+            if update_id is not None and self.update_ids.get(symbol) == update_id:
+                continue
+            self.update_ids[symbol] = update_id
+            ticks.append(binance_rest_tick(book_ticker, mark_prices.get(symbol)))
+        return ticks
+
+    def poll_interval(self):
+        return self.budget.delay()
+
+
+class StreamConnection:
+    # One combined-stream websocket and the symbols it is subscribed to
+    def __init__(self):
+        self.symbols = set()
+        self.ws = None
+        self.task = None
+        self.request_id = 0
+
+    async def send(self, method, symbols):
+        # Without an open socket the next connect subscribes self.symbols
+        if self.ws is None or self.ws.closed or not symbols:
+            return
+        self.request_id += 1
+        await self.ws.send_str(
+            json.dumps(
+                {
+                    "method": method,
+                    "params": BinanceStreamTicker.stream_names(symbols),
+                    "id": self.request_id,
+                }
+            )
+        )
+
+
+class BinanceStreamTicker(BinanceFuturesTicker):
+    """
+    Collects the same rows as BinanceFuturesTicker from the combined-stream
+    websocket API: <sym>@bookTicker and <sym>@markPrice@1s for every symbol,
+    spread over a few connections of SYMBOLS_PER_CONNECTION symbols each.
+    """
+
+    def __init__(
+        self,
+        stream_url=BINANCE_STREAM_URL,
+        symbols_per_connection=SYMBOLS_PER_CONNECTION,
+        reconnect_delay=1.0,
+    ):
+        super().__init__()
+        self.stream_url = stream_url
+        self.symbols_per_connection = symbols_per_connection
+        self.reconnect_delay = reconnect_delay
+        self.mark_prices = {}
+        self.connections = []
+        self.capture = open_capture(self.name)
+
+    @staticmethod
+    def stream_names(symbols):
+        streams = []
+        for symbol in symbols:
+            streams.append(f"{symbol.lower()}@bookTicker")
+            streams.append(f"{symbol.lower()}@markPrice@1s")
+        return streams
+
+    def handle_stream_message(self, payload):
+        data = payload.get("data")
+        if not data:
+            return None  # Subscription acks and other control frames
+        event = data.get("e")
+        if event == "markPriceUpdate":
+            self.mark_prices[data["s"]] = float(data["p"])
+            return None
+        if event != "bookTicker":
+            return None
+        tick = binance_tick(data, self.mark_prices.get(data["s"]))
+        observe_lag("BINANCE", data.get("E"))
+        tick_log.debug("Data for %s: %s", tick.symbol, tick)
+        self.handle_tick(tick)
+        return tick
+
+    def on_frame(self, data):
+        # One text frame as received, live or from a capture (feed_replay.py)
+        if self.capture:
+            self.capture.write(data)
+        started = time.perf_counter()
+        payload = loads(data)
+        decode_seconds.observe(time.perf_counter() - started)
+        received.inc()
+        return self.handle_stream_message(payload)
+
+    async def stream_connection(self, connection):
+        while True:
+            try:
+                async with self.session.ws_connect(
+                    f"{self.stream_url}/stream", heartbeat=30
+                ) as ws:
+                    connection.ws = ws
+                    symbols = sorted(connection.symbols)
+                    await connection.send("SUBSCRIBE", symbols)
+                    print(f"Subscribed to {len(symbols)} symbols on {self.stream_url}")
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self.on_frame(msg.data)
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            print(f"Stream error: {ws.exception()}")
+                            break
+                print("Stream connection closed, reconnecting...")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Exception in stream connection: {e}")
+            finally:
+                connection.ws = None
+            RECONNECTS.labels("binance").inc()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def apply_symbol_changes(self, added, removed):
+        """
+        Moves the live subscriptions to the new symbol set without
+        reconnecting: removed symbols are unsubscribed on the connection that
+        carries them, added ones subscribed where there is room, and a new
+        connection is only opened once every existing one is full.
+        """
+        await super().apply_symbol_changes(added, removed)
+        if self.session is None:
+            return
+        removed = set(removed)
+        for connection in self.connections:
+            dropped = sorted(connection.symbols & removed)
+            connection.symbols -= removed
+            await connection.send("UNSUBSCRIBE", dropped)
+        for symbol in removed:
+            self.mark_prices.pop(symbol, None)
+        pending = {}
+        for symbol in added:
+            connection = next(
+                (
+                    c
+                    for c in self.connections
+                    if len(c.symbols) < self.symbols_per_connection
+                ),
+                None,
+            )
+            if connection is None:
+                connection = StreamConnection()
+                self.connections.append(connection)
+            connection.symbols.add(symbol)
+            pending.setdefault(connection, []).append(symbol)
+        for connection, symbols in pending.items():
+            if connection.task is None:
+                connection.task = asyncio.create_task(
+                    self.stream_connection(connection)
+                )
+            else:
+                await connection.send("SUBSCRIBE", symbols)
+
+    async def stop_connections(self):
+        tasks = [c.task for c in self.connections if c.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.connections = []
+
+    async def close_db(self):
+        if self.capture:
+            self.capture.close()
+        await super().close_db()
+
+    async def run(self):
+        self.session = aiohttp.ClientSession()
+        await self.connect_db()
+        conflation = self.start_conflation()
+        listener = asyncio.create_task(listen(self.on_coin_events, self.on_coin_resync))
+        try:
+            while True:
+                # Connections follow the symbol set in apply_symbol_changes
+                await self.update_symbols()
+                self.writer.flush_if_due()
+                await asyncio.sleep(self.writer.flush_interval)
         finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+            await self.stop_connections()
+            await self.stop_conflation(conflation)
             await self.session.close()
-            self.db_manager.close()
+            await self.close_db()
+
+
+async def main(ticker):
+    # SIGTERM (docker stop, the supervisor) cancels run(), whose cleanup
+    # flushes the writers before the process exits
+    task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    try:
+        await ticker.run()
+    except asyncio.CancelledError:
+        print("Stopped")
 
 
 if __name__ == "__main__":
-    ticker = BinanceFuturesTicker()
-    asyncio.run(ticker.run())
+    start_metrics_server()
+    mode = os.getenv("BINANCE_MODE", "stream")
+    if mode == "rest":
+        ticker = BinanceFuturesTicker()
+    elif mode == "bulk":
+        ticker = BinanceBulkTicker()
+    else:
+        ticker = BinanceStreamTicker()
+    asyncio.run(main(ticker))
@@ -1,22 +1,123 @@
 import json
+import random
+import signal
+import threading
 import time
+import requests
 import websocket
-import gzip
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, timezone
-from db_manager import DBManager
+from datetime import datetime, timezone
+from coin_listener import CoinSet, collecting_coins, run_listener_thread
+from compact_ticks import (
+    STORAGE_MODE,
+    CompactEncoder,
+    create_tick_writer,
+    tick_columns,
+)
+from conflator import DEFAULT_CONFLATE_INTERVAL, TickConflator
+from db_manager import LATEST_UPSERT, DBManager
+from decoders import coinex_depth_tick, coinex_tick, inflate, loads
+from feed_capture import open_capture
+from metrics import (
+    DECODE_SECONDS,
+    MESSAGES_RECEIVED,
+    RECONNECTS,
+    SampledLogger,
+    observe_lag,
+    start_metrics_server,
+)
+from quote_board import open_quote_board
+from rollups import start_rollups
+from sharding import shard_from_env
+from symbol_registry import SymbolRegistry
+from tick_pipeline import TickPipeline
 import os
 
+COINEX_COLUMNS = (
+    "coin_id",
+    "timestamp",
+    "best_bid",
+    "best_ask",
+    "best_bid_qty",
+    "best_ask_qty",
+    "mark_price",
+    "last_price",
+    "updated_at",
+    "exchange",
+)
+
+COINEX_WS_URL = os.getenv("COINEX_WS_URL", "wss://socket.coinex.com/v2/futures")
+QUEUE_SIZE = int(os.getenv("COINEX_QUEUE_SIZE", "10000"))
+QUEUE_POLICY = os.getenv("COINEX_QUEUE_POLICY", "drop_oldest")
+WRITER_WORKERS = int(os.getenv("COINEX_WRITER_WORKERS", "1"))
+COINEX_REST_URL = os.getenv("COINEX_REST_URL", "https://api.coinex.com/v2")
+
+# Reconnect delay: full jitter over an exponential backoff, reset once a
+# connection has stayed up for RECONNECT_STABLE seconds
+RECONNECT_DELAY = float(os.getenv("COINEX_RECONNECT_DELAY", "0.5"))
+MAX_RECONNECT_DELAY = float(os.getenv("COINEX_MAX_RECONNECT_DELAY", "30"))
+RECONNECT_STABLE = float(os.getenv("COINEX_RECONNECT_STABLE", "60"))
+# Websocket ping/pong liveness: no pong within PING_TIMEOUT drops the socket
+PING_INTERVAL = float(os.getenv("COINEX_PING_INTERVAL", "15"))
+PING_TIMEOUT = float(os.getenv("COINEX_PING_TIMEOUT", "10"))
+# A subscribed market without a bbo.update for this long is resubscribed and
+# snapshotted; when every market is stale the connection is dropped instead
+STALE_SECONDS = float(os.getenv("COINEX_STALE_SECONDS", "120"))
+SNAPSHOT_WORKERS = int(os.getenv("COINEX_SNAPSHOT_WORKERS", "4"))
+
+# Connection states
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+OPEN = "open"
+BACKOFF = "backoff"
+STOPPED = "stopped"
+
+received = MESSAGES_RECEIVED.labels("COINEX")
+decode_seconds = DECODE_SECONDS.labels("COINEX")
+tick_log = SampledLogger("ws_coinex")
+
 
 class CoinexWebSocket:
     def __init__(self, access_id, signed_str, db_manager):
         self.access_id = access_id
         self.signed_str = signed_str
         self.db_manager = db_manager
-        self.next_update_time = datetime.now(
-            timezone.utc
-        )  # Initialize the update time first
-        self.coins = self.update_coin_list()  # Now it's safe to call update_coin_list
+        self.registry = SymbolRegistry(db_manager)
+        self.encoder = CompactEncoder(self.registry, "COINEX")
+        self.shard = shard_from_env()
+        self.rollups = start_rollups(tick_columns(COINEX_COLUMNS), "COINEX")
+        self.writer = self.create_writer(db_manager)
+        name = "coinex" if self.shard is None else f"coinex-{self.shard.index}"
+        self.capture = open_capture(name)
+        self.board = open_quote_board(name)
+        self.coins = CoinSet(collecting_coins(db_manager) or [], self.shard)
+        print(f"Collecting {len(self.coins)} coins: {list(self.coins)}")
+        self.ws = None
+        self.ws_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.state = DISCONNECTED
+        self.attempt = 0
+        self.connected_at = 0.0
+        self.last_message_at = None  # Wall clock, start of a disconnect gap
+        self.last_seen = {}  # Market -> monotonic time of its last update
+        self.session = requests.Session()
+        self.recovery_lock = threading.Lock()
+        self.gap_db_manager = None
+        self.handler_lock = threading.Lock()
+        self.worker_db_managers = []
+        self.worker_registries = []  # Besides self.registry
+        self.pipeline = TickPipeline(
+            self.create_batch_handler,
+            maxsize=QUEUE_SIZE,
+            policy=QUEUE_POLICY,
+            workers=WRITER_WORKERS,
+            batch_size=self.writer.flush_size,
+            name="coinex",
+        )
+        self.conflator = None
+        if DEFAULT_CONFLATE_INTERVAL > 0:
+            self.conflator = TickConflator(self.enqueue)
 
     def authenticate_request(self, timestamp=None):
         if timestamp is None:
@@ -34,9 +135,7 @@ class CoinexWebSocket:
 
     @staticmethod
     def decompress_message(compressed_message):
-        decompressed_bytes = gzip.decompress(compressed_message)
-        decompressed_str = decompressed_bytes.decode("utf-8")
-        return json.loads(decompressed_str)
+        return loads(inflate(compressed_message))
 
     def create_subscription_request(self, coins):
         payload = {
@@ -46,116 +145,385 @@ class CoinexWebSocket:
         }
         return json.dumps(payload)
 
-    def update_coin_list(self):
-        if datetime.now(timezone.utc) >= self.next_update_time:
-            query = "SELECT coin_name FROM coins_table;"
-            result = self.db_manager.execute_query(query)
-            self.coins = [coin[0] for coin in result]
-            self.next_update_time += timedelta(
-                days=1
-            )  # Update the next time we need to refresh
-            print(f"Coin list updated: {self.coins}")
-        return self.coins  # Return the current list of coins
-
-    def insert_data_into_db(self, parsed_data):
+    def create_unsubscription_request(self, coins):
+        payload = {
+            "method": "bbo.unsubscribe",
+            "params": {"market_list": coins},
+            "id": 1,
+        }
+        return json.dumps(payload)
+
+    def on_coin_events(self, events):
+        added, removed = set(), set()
+        with self.handler_lock:
+            registries = [self.registry, *self.worker_registries]
+        for event in events:
+            if event.get("coin_id") is not None and event.get("op") != "DELETE":
+                # Every writer thread's registry, so none of them has to
+                # look the new coin up in coins_table on its first tick
+                for registry in registries:
+                    registry.remember(event["coin_name"], event["coin_id"])
+            event_added, event_removed = self.coins.apply(event)
+            added.update(event_added)
+            removed.update(event_removed)
+        self.apply_coin_changes(sorted(added - removed), sorted(removed - added))
+
+    def on_coin_resync(self, coins):
+        self.apply_coin_changes(*self.coins.update(coins))
+
+    def apply_coin_changes(self, added, removed):
+        # Changes the live subscription in place; a socket that is not open
+        # subscribes the whole current set in on_open
+        if not added and not removed:
+            return
+        print(f"Coin list changed: +{added} -{removed}")
+        with self.ws_lock:
+            if self.ws is None:
+                return
+            # An empty market_list would mean every market, so never send one
+            if removed:
+                self.ws.send(self.create_unsubscription_request(removed))
+            if added:
+                self.ws.send(self.create_subscription_request(added))
+                self.last_seen.update(dict.fromkeys(added, time.monotonic()))
+
+    def insert_data_into_db(self, tick, writer=None, registry=None, encoder=None):
+        writer = writer or self.writer
+        registry = registry or self.registry
+        encoder = encoder or self.encoder
         try:
-            timestamp = datetime.fromtimestamp(parsed_data["timestamp"] / 1000.0)
-            query = "SELECT coin_id FROM coins_table WHERE coin_name = %s"
-            coin_id = self.db_manager.execute_query(query, (parsed_data["symbol"],))
-            if not coin_id:
-                insert_coin_query = (
-                    "INSERT INTO coins_table (coin_name) VALUES (%s) RETURNING coin_id"
-                )
-                coin_id = self.db_manager.execute_query(
-                    insert_coin_query, (parsed_data["symbol"],)
-                )
-                coin_id = coin_id[0][0] if coin_id else None
-            else:
-                coin_id = coin_id[0][0]
-
-            if coin_id:
-                insert_data_query = """
-                INSERT INTO coin_data_table (
-                    coin_id, timestamp, best_bid, best_ask, best_bid_qty, best_ask_qty, mark_price, last_price, updated_at, exchange
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-                """
-                self.db_manager.cursor.execute(
-                    insert_data_query,
+            timestamp = datetime.fromtimestamp(tick.timestamp / 1000.0)
+            coin_id = registry.get_or_create(tick.symbol)
+            if coin_id and STORAGE_MODE == "compact":
+                writer.add(encoder.row(coin_id, tick))
+            elif coin_id:
+                writer.add(
                     (
                         coin_id,
                         timestamp,
-                        parsed_data["best_bid"],
-                        parsed_data["best_ask"],
-                        parsed_data["best_bid_qty"],
-                        parsed_data["best_ask_qty"],
-                        parsed_data["mark_price"],
-                        parsed_data["last_price"],
+                        tick.best_bid,
+                        tick.best_ask,
+                        tick.best_bid_qty,
+                        tick.best_ask_qty,
+                        tick.mark_price,
+                        tick.last_price,
                         timestamp,
                         "COINEX",
-                    ),
+                    )
                 )
-                self.db_manager.commit()
             else:
                 print("Error: Could not find or insert coin_id")
         except Exception as e:
             print(f"Error inserting data into DB: {e}")
 
+    def create_writer(self, db_manager):
+        spill_name = "coinex" if self.shard is None else f"coinex-{self.shard.index}"
+        return create_tick_writer(
+            db_manager,
+            COINEX_COLUMNS,
+            LATEST_UPSERT,
+            spill_name,
+            self.rollups.aggregator.add_rows if self.rollups else None,
+        )
+
+    def create_batch_handler(self):
+        # The first writer thread reuses the collector's connection, any
+        # additional ones open their own so flushes can run in parallel. A
+        # worker's registry creates coins on its own connection too, since
+        # that commits and must not land in another worker's COPY.
+        with self.handler_lock:
+            if not self.worker_db_managers:
+                writer = self.writer
+                registry, encoder = self.registry, self.encoder
+                self.worker_db_managers.append(self.db_manager)
+            else:
+                db_manager = DBManager()
+                writer = self.create_writer(db_manager)
+                registry = SymbolRegistry(db_manager)
+                encoder = CompactEncoder(registry, "COINEX")
+                self.worker_db_managers.append(db_manager)
+                self.worker_registries.append(registry)
+
+        def handle(batch):
+            if batch is None:
+                writer.flush()
+                return
+            for tick in batch:
+                self.insert_data_into_db(tick, writer, registry, encoder)
+            writer.flush_if_due()
+
+        return handle
+
     def on_message(self, ws, message):
-        parsed_msg = self.decompress_message(message)
-        if "data" in parsed_msg:
-            data = parsed_msg["data"]
-            parsed_data = {
-                "symbol": data["market"],
-                "best_bid": data["best_bid_price"],
-                "best_ask": data["best_ask_price"],
-                "best_bid_qty": data["best_bid_size"],
-                "best_ask_qty": data["best_ask_size"],
-                "mark_price": None,
-                "last_price": None,
-                "timestamp": data["updated_at"],
-            }
-            try:
-                self.insert_data_into_db(parsed_data)
-            except Exception as e:
-                print(f"Error inserting data into DB: {e, parsed_data}")
+        if self.capture:
+            self.capture.write(message)
+        started = time.perf_counter()
+        tick = coinex_tick(message)
+        decode_seconds.observe(time.perf_counter() - started)
+        received.inc()
+        if tick is None:
+            return
+        self.last_seen[tick.symbol] = time.monotonic()
+        if self.board:
+            self.board.publish(tick)
+        observe_lag("COINEX", tick.timestamp)
+        tick_log.debug("Data for %s: %s", tick.symbol, tick)
+        if self.conflator:
+            self.conflator.offer(tick.symbol, "COINEX", tick.version, tick)
+        else:
+            self.enqueue(tick)
+
+    def enqueue(self, tick):
+        self.pipeline.put(tick.symbol, tick)
 
     def on_error(self, ws, error):
+        if isinstance(error, KeyboardInterrupt):
+            # run_forever swallows it and only reports it here
+            self.stop_event.set()
+            return
         print(f"Error: {error}")
 
     def on_close(self, ws, close_status_code, close_msg):
+        # run() reconnects once run_forever has returned, never from here
+        with self.ws_lock:
+            self.ws = None
         print(f"WebSocket closed: {close_status_code}, {close_msg}")
-        print("Reconnecting...")
-        time.sleep(0.5)
-        self.run()
 
     def on_open(self, ws):
-        auth_message = self.authenticate_request()
-        ws.send(auth_message)
-        print(f"Sent authentication message: {auth_message}")
-        coins = self.update_coin_list()
-        subscription_message = self.create_subscription_request(coins)
-        ws.send(subscription_message)
-        print(f"Sent subscription message for coins: {coins}")
+        if self.access_id:
+            # Market data is public, so the sign request is sent without
+            # waiting for its reply
+            ws.send(self.authenticate_request())
+        reconnected = self.last_message_at is not None
+        gap_start = self.last_message_at
+        with self.ws_lock:
+            self.ws = ws
+            self.set_state(OPEN)
+            self.connected_at = time.monotonic()
+            self.last_seen = dict.fromkeys(self.coins, self.connected_at)
+            coins = list(self.coins)
+            if not coins:
+                print("No collecting coins, waiting for coins_table changes")
+                return
+            ws.send(self.create_subscription_request(coins))
+        print(f"Sent subscription message for {len(coins)} coins")
+        if reconnected:
+            self.start_recovery(coins, gap_start, "disconnect")
+
+    def set_state(self, state):
+        if state != self.state:
+            print(f"Coinex connection {self.state} -> {state}")
+            self.state = state
+
+    def reconnect_delay(self):
+        if time.monotonic() - self.connected_at >= RECONNECT_STABLE:
+            self.attempt = 0
+        delay = min(MAX_RECONNECT_DELAY, RECONNECT_DELAY * 2**self.attempt)
+        self.attempt += 1
+        return random.uniform(0, delay)
 
     def run(self):
-        websocket_url = "wss://socket.coinex.com/v2/futures"
-        ws = websocket.WebSocketApp(
-            websocket_url,
-            on_open=self.on_open,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=self.on_close,
-        )
-        ws.run_forever()
+        """
+        Connection loop: connect, run until the socket drops (pong timeout,
+        server close, or the stale-feed check), then wait a jittered backoff
+        and connect again. Returns after stop().
+        """
+        while not self.stop_event.is_set():
+            self.set_state(CONNECTING)
+            ws = websocket.WebSocketApp(
+                COINEX_WS_URL,
+                on_open=self.on_open,
+                on_message=self.on_message,
+                on_error=self.on_error,
+                on_close=self.on_close,
+            )
+            try:
+                ws.run_forever(ping_interval=PING_INTERVAL, ping_timeout=PING_TIMEOUT)
+            except Exception as e:
+                print(f"Exception in Coinex connection: {e}")
+            with self.ws_lock:
+                self.ws = None
+                if self.state == OPEN:
+                    self.last_message_at = time.time()
+                    if self.last_seen:
+                        # Start the gap at the newest update actually received
+                        newest = max(self.last_seen.values())
+                        self.last_message_at -= time.monotonic() - newest
+            if self.stop_event.is_set():
+                break
+            RECONNECTS.labels("coinex").inc()
+            delay = self.reconnect_delay()
+            self.set_state(BACKOFF)
+            print(f"Reconnecting in {delay:.2f}s")
+            self.stop_event.wait(delay)
+        self.set_state(STOPPED)
+
+    def check_stale(self):
+        # Called periodically by the monitor thread
+        now = time.monotonic()
+        with self.ws_lock:
+            if self.ws is None or self.state != OPEN:
+                return
+            coins = list(self.coins)
+            stale = [
+                coin
+                for coin in coins
+                if now - self.last_seen.get(coin, now) > STALE_SECONDS
+            ]
+            if not stale:
+                return
+            ws = self.ws
+            oldest = min(self.last_seen.get(coin, now) for coin in stale)
+            if len(stale) < len(coins):
+                for coin in stale:
+                    self.last_seen[coin] = now
+                ws.send(self.create_unsubscription_request(stale))
+                ws.send(self.create_subscription_request(stale))
+        if len(stale) == len(coins):
+            # Closed outside ws_lock: on_close takes it from the socket thread
+            print(f"No updates for {STALE_SECONDS:.0f}s, dropping connection")
+            ws.close()
+            return
+        print(f"Resubscribed stale markets: {stale}")
+        self.start_recovery(stale, time.time() - (now - oldest), "stale")
+
+    def monitor(self):
+        while not self.stop_event.wait(min(STALE_SECONDS / 4, 30)):
+            try:
+                self.check_stale()
+            except Exception as e:
+                print(f"Error checking for stale markets: {e}")
+
+    def start_recovery(self, coins, gap_start, reason):
+        threading.Thread(
+            target=self.recover,
+            args=(coins, gap_start, reason),
+            name="coinex-recovery",
+            daemon=True,
+        ).start()
+
+    def fetch_snapshot(self, coin):
+        try:
+            response = self.session.get(
+                f"{COINEX_REST_URL}/futures/depth",
+                params={"market": coin, "limit": 5, "interval": "0"},
+                timeout=5,
+            )
+            response.raise_for_status()
+            message = loads(response.content)
+            if message.get("code") != 0:
+                print(f"Snapshot for {coin} failed: {message.get('message')}")
+                return None
+            return coinex_depth_tick(message["data"])
+        except Exception as e:
+            print(f"Error fetching snapshot for {coin}: {e}")
+            return None
+
+    def recover(self, coins, gap_start, reason):
+        """
+        One-shot REST fill after a gap: the current top of book of every
+        affected market goes through the normal pipeline, and the gap itself
+        is recorded in feed_gap_table so readers can tell it apart from a
+        quiet market.
+        """
+        gap_end = datetime.now(timezone.utc)
+        with ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS) as executor:
+            ticks = list(executor.map(self.fetch_snapshot, coins))
+        snapshot_at = datetime.now(timezone.utc)
+        filled = {}
+        for coin, tick in zip(coins, ticks):
+            if tick is not None:
+                if self.board:
+                    self.board.publish(tick)
+                self.enqueue(tick)
+                filled[coin] = snapshot_at
+        print(f"Filled {len(filled)}/{len(coins)} markets after {reason} gap")
+        start = datetime.fromtimestamp(gap_start, timezone.utc)
+        if reason == "disconnect":
+            rows = [(None, start, gap_end, reason, snapshot_at if filled else None)]
+        else:
+            rows = [
+                (self.registry.get(coin), start, gap_end, reason, filled.get(coin))
+                for coin in coins
+            ]
+        self.record_gaps(rows)
+
+    def record_gaps(self, rows):
+        with self.recovery_lock:
+            if self.gap_db_manager is None:
+                self.gap_db_manager = DBManager()
+            try:
+                self.gap_db_manager.cursor.executemany(
+                    "INSERT INTO feed_gap_table "
+                    "(exchange, coin_id, gap_start, gap_end, reason, snapshot_at) "
+                    "VALUES ('COINEX', %s, %s, %s, %s, %s);",
+                    rows,
+                )
+                self.gap_db_manager.commit()
+            except Exception as e:
+                print(f"Error recording feed gaps: {e}")
+                self.gap_db_manager.close()
+                self.gap_db_manager = None  # Reconnect on the next gap
+
+    def start(self):
+        run_listener_thread(self.on_coin_events, self.on_coin_resync, self.stop_event)
+        threading.Thread(
+            target=self.monitor, name="coinex-monitor", daemon=True
+        ).start()
+        self.start_pipeline()
+
+    def start_pipeline(self):
+        # Without the socket, listener and monitor, for feed_replay.py
+        self.pipeline.start()
+        if self.conflator:
+            self.conflator.start()
+
+    def close_socket(self):
+        with self.ws_lock:
+            ws = self.ws
+        if ws is not None:
+            ws.close()
+
+    def request_stop(self):
+        # Makes run() return; safe in a signal handler, which may interrupt
+        # a thread holding ws_lock, since the socket is closed elsewhere
+        self.stop_event.set()
+        threading.Thread(target=self.close_socket, name="coinex-stop").start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.close_socket()
+        if self.conflator:
+            self.conflator.stop()
+        self.pipeline.stop()
+        print(f"Tick pipeline stopped: {self.pipeline.stats()}")
+        for db_manager in self.worker_db_managers:
+            if db_manager is not self.db_manager:
+                db_manager.close()
+        if self.gap_db_manager is not None:
+            self.gap_db_manager.close()
+        if self.rollups:
+            self.writer.flush()  # Its rows still have to reach the rollups
+            self.rollups.stop()
+        if self.capture:
+            self.capture.close()
+        if self.board:
+            self.board.close()
 
 
 if __name__ == "__main__":
     load_dotenv()
+    start_metrics_server()
     db_manager = DBManager()
     access_id = os.getenv("APIKEYCOINEX")
     signed_str = os.getenv("APISECRETKEYCOINEX")
     coinex_ws = CoinexWebSocket(access_id, signed_str, db_manager)
+    # SIGTERM (docker stop, the supervisor) ends run(), so the writers
+    # are flushed below before the process exits
+    signal.signal(signal.SIGTERM, lambda *_: coinex_ws.request_stop())
+    coinex_ws.start()
     try:
         coinex_ws.run()
     finally:
+        coinex_ws.stop()
         db_manager.close()
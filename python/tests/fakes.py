@@ -0,0 +1,107 @@
+from db_manager import DBManager
+
+
+class FakeCursor:
+    # Records statements on its connection instead of running them
+    def __init__(self, conn, rows=None):
+        self.conn = conn
+        self.rows = rows or []
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.pending.append(("execute", query, params))
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def copy_expert(self, sql, buffer):
+        self.conn.pending.append(("copy", sql, buffer.read()))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """
+    Stand-in for a psycopg2 connection: statements pile up in `pending`
+    and move to `committed` on commit(), so tests see what a real
+    transaction would have made durable.
+    """
+
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.pending = []
+        self.committed = []
+        self.cursor_names = []
+        self.closed = 0
+
+    def cursor(self, name=None):
+        self.cursor_names.append(name)
+        return FakeCursor(self, self.rows)
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        self.closed = 1
+
+    def copied_rows(self):
+        # Committed COPY rows as lists of text fields
+        return [
+            line.split("\t")
+            for kind, _, data in self.committed
+            if kind == "copy"
+            for line in data.splitlines()
+        ]
+
+
+class FakeDBManager(DBManager):
+    # DBManager on a FakeConnection; rows are what every query returns
+    def __init__(self, rows=None):
+        self.rows = rows
+        super().__init__()
+
+    def connect(self):
+        self.conn = FakeConnection(self.rows)
+        self.cursor = self.conn.cursor()
+
+
+class FakeRegistry:
+    # SymbolRegistry without coins_table: coin ids are handed out in order
+    def __init__(self, db_manager=None):
+        self.ids = {}
+        self.precisions = {}
+
+    def refresh(self):
+        return self.ids
+
+    def get(self, coin_name):
+        return self.ids.get(coin_name)
+
+    def precision(self, coin_id, exchange):
+        return self.precisions.get((coin_id, exchange))
+
+    def remember(self, coin_name, coin_id):
+        self.ids[coin_name] = coin_id
+
+    def get_or_create(self, coin_name):
+        return self.resolve([coin_name])[coin_name]
+
+    def resolve(self, coin_names):
+        for name in coin_names:
+            self.ids.setdefault(name, len(self.ids) + 1)
+        return {name: self.ids[name] for name in coin_names}
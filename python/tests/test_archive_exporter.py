@@ -0,0 +1,80 @@
+import os
+from datetime import date
+import pyarrow as pa
+import pyarrow.parquet as pq
+from archive_exporter import ArchiveExporter, LocalDestination, marker_key
+from fakes import FakeDBManager
+
+DAYS = [date(2026, 1, 1), date(2026, 1, 2)]
+
+
+class FakeExporter(ArchiveExporter):
+    # Row counts per (exchange, day) instead of a tick table
+    def __init__(self, destination, tmp_dir):
+        super().__init__(FakeDBManager(), destination, tmp_dir=tmp_dir)
+        self.rows = {
+            (exchange, day): 3 for exchange in ("BINANCE", "COINEX") for day in DAYS
+        }
+        self.written = []
+        self.deleted = []
+
+    def days_to_export(self, older_than_days):
+        return DAYS
+
+    def count_rows(self, exchange, start, end):
+        return self.rows[(exchange, start.date())]
+
+    def write_day(self, exchange, day, path):
+        self.written.append((exchange, day))
+        rows = self.rows[(exchange, day)]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(pa.table({"data_id": list(range(rows))}), path)
+        return rows
+
+    def export_coins(self):
+        return True
+
+    def delete_day(self, day):
+        self.deleted.append(day)
+        return True
+
+
+def test_archived_days_are_skipped_by_later_runs(tmp_path):
+    exporter = FakeExporter(
+        LocalDestination(str(tmp_path / "dest")), str(tmp_path / "tmp")
+    )
+    exporter.run(7, delete=False)
+    assert len(exporter.written) == 4
+    assert exporter.exported(DAYS[0]) == {"BINANCE": 3, "COINEX": 3}
+    assert os.path.exists(tmp_path / "dest" / marker_key(DAYS[1]))
+    # Archived but kept: a --delete run drops them without exporting again
+    exporter.written = []
+    exporter.run(7, delete=True)
+    assert exporter.written == [] and exporter.deleted == DAYS
+
+
+def test_a_day_whose_rows_changed_is_exported_again(tmp_path):
+    exporter = FakeExporter(
+        LocalDestination(str(tmp_path / "dest")), str(tmp_path / "tmp")
+    )
+    exporter.run(7)
+    exporter.written = []
+    exporter.rows[("COINEX", DAYS[1])] = 5  # e.g. replayed from a spill
+    exporter.run(7)
+    assert exporter.written == [("BINANCE", DAYS[1]), ("COINEX", DAYS[1])]
+    assert exporter.exported(DAYS[1]) == {"BINANCE": 3, "COINEX": 5}
+
+
+def test_a_failed_upload_only_holds_back_its_day(tmp_path):
+    class FlakyDestination(LocalDestination):
+        def upload(self, path, key):
+            if "2026-01-01" in key:
+                raise ConnectionError("S3 unreachable")
+            return super().upload(path, key)
+
+    exporter = FakeExporter(
+        FlakyDestination(str(tmp_path / "dest")), str(tmp_path / "tmp")
+    )
+    exporter.run(7, delete=True)
+    assert exporter.deleted == [DAYS[1]]
+    assert exporter.exported(DAYS[0]) is None
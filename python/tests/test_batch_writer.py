@@ -0,0 +1,69 @@
+import psycopg2
+import pytest
+import db_manager
+from db_manager import BatchWriter
+from fakes import FakeDBManager
+
+BAD = -1
+
+
+@pytest.fixture
+def inserts(monkeypatch):
+    # execute_values that records its rows, failing on BAD values like a
+    # column constraint, or with `failure` when one is set
+    state = {"failure": None}
+
+    def execute_values(cursor, query, rows, template=None, page_size=None):
+        if state["failure"] is not None:
+            raise state["failure"]
+        if any(BAD in row for row in rows):
+            raise psycopg2.DataError("value out of range")
+        cursor.conn.pending.append(("insert", query, list(rows)))
+
+    monkeypatch.setattr(db_manager, "execute_values", execute_values)
+    return state
+
+
+def inserted_rows(conn):
+    return [row for kind, _, rows in conn.committed if kind == "insert" for row in rows]
+
+
+def test_a_rejected_batch_is_written_row_by_row(inserts):
+    manager = FakeDBManager()
+    flushed = []
+    writer = BatchWriter(
+        manager, "t", ("a", "b"), method="values", on_flush=flushed.append
+    )
+    conn = manager.conn
+    for row in [(1, 2), (3, BAD), (5, 6)]:
+        writer.add(row)
+    assert writer.flush() == 2
+    assert inserted_rows(conn) == [(1, 2), (5, 6)]
+    assert flushed == [[(1, 2), (5, 6)]]
+    statements = [query for kind, query, _ in conn.committed if kind == "execute"]
+    assert statements.count("ROLLBACK TO SAVEPOINT batch_row") == 1
+    assert manager.conn is conn  # Bad data is no reason to reconnect
+
+
+def test_connection_errors_reconnect_and_keep_nothing(inserts):
+    manager = FakeDBManager()
+    flushed = []
+    writer = BatchWriter(
+        manager, "t", ("a", "b"), method="values", on_flush=flushed.append
+    )
+    conn = manager.conn
+    inserts["failure"] = psycopg2.OperationalError("server closed the connection")
+    writer.add((1, 2))
+    assert writer.flush() == 0
+    assert manager.conn is not conn
+    assert inserted_rows(conn) == [] and flushed == []
+
+
+def test_other_errors_roll_back_without_reconnecting(inserts):
+    manager = FakeDBManager()
+    writer = BatchWriter(manager, "t", ("a", "b"), method="values")
+    conn = manager.conn
+    inserts["failure"] = psycopg2.ProgrammingError("column does not exist")
+    writer.add((1, 2))
+    assert writer.flush() == 0
+    assert manager.conn is conn and conn.committed == []
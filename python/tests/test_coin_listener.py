@@ -0,0 +1,61 @@
+import asyncio
+import socket
+import threading
+import coin_listener
+from coin_listener import CoinListener, CoinSet
+from sharding import Shard
+
+
+def test_coin_set_reports_only_changes():
+    coins = CoinSet(["BTCUSDT", "ETHUSDT"])
+    assert coins.update(["ETHUSDT", "XRPUSDT"]) == (["XRPUSDT"], ["BTCUSDT"])
+    event = {"op": "UPDATE", "coin_name": "SOLUSDT", "collecting": True}
+    assert coins.apply(event) == (["SOLUSDT"], [])
+    event = {"op": "UPDATE", "coin_name": "XRP2USDT", "old_coin_name": "XRPUSDT"}
+    assert coins.apply({**event, "collecting": True}) == (["XRP2USDT"], ["XRPUSDT"])
+    assert coins.apply({"op": "DELETE", "coin_name": "ETHUSDT"}) == ([], ["ETHUSDT"])
+    shard = Shard(0, 2)
+    sharded = CoinSet([f"COIN{i}USDT" for i in range(20)], shard)
+    assert all(shard.owns(coin) for coin in sharded)
+
+
+def test_listen_queries_the_database_off_the_event_loop(monkeypatch):
+    threads = []
+    ours, theirs = socket.socketpair()
+
+    def connect(listener):
+        threads.append(("connect", threading.current_thread()))
+        listener.conn = ours
+        listener.resync_due = True
+        return True
+
+    def collecting_coins(listener):
+        threads.append(("resync", threading.current_thread()))
+        return ["BTCUSDT"]
+
+    monkeypatch.setattr(CoinListener, "connect", connect)
+    monkeypatch.setattr(CoinListener, "collecting_coins", collecting_coins)
+    monkeypatch.setattr(CoinListener, "close", lambda listener: None)
+
+    async def run():
+        resynced = asyncio.Event()
+        received = []
+
+        async def on_resync(coins):
+            received.append(coins)
+            resynced.set()
+
+        task = asyncio.create_task(coin_listener.listen(None, on_resync))
+        await asyncio.wait_for(resynced.wait(), 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return received
+
+    try:
+        assert asyncio.run(run()) == [["BTCUSDT"]]
+    finally:
+        ours.close()
+        theirs.close()
+    main = threading.main_thread()
+    assert [name for name, _ in threads] == ["connect", "resync"]
+    assert all(thread is not main for _, thread in threads)
@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from compact_ticks import BIGINT_MAX, INT_MAX, CompactEncoder, scale_values
+from decoders import Tick
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+NOW_MS = int(NOW.timestamp() * 1000)
+
+
+class Registry:
+    def __init__(self, precisions):
+        self.precisions = precisions
+
+    def precision(self, coin_id, exchange):
+        return self.precisions.get((coin_id, exchange))
+
+
+def unscale(values, scale):
+    return [
+        None if value is None else Decimal(value).scaleb(-scale) for value in values
+    ]
+
+
+def test_prices_round_trip_at_their_precision():
+    values = ("43127.15", "43127.16", None, "43127.1")
+    scale, scaled = scale_values(values, 2)
+    assert scale == 2
+    assert scaled == [4312715, 4312716, None, 4312710]
+    assert unscale(scaled, scale) == [Decimal(v) if v else None for v in values]
+
+
+def test_large_quantities_round_trip_exactly():
+    values = ("98765432109.123456", 123456789012.5)
+    scale, scaled = scale_values(values, 6, BIGINT_MAX)
+    assert scale == 6
+    assert all(value <= BIGINT_MAX for value in scaled)
+    assert unscale(scaled, scale) == [
+        Decimal("98765432109.123456"),
+        Decimal("123456789012.5"),
+    ]
+
+
+def test_scale_is_lowered_to_fit_the_column():
+    scale, scaled = scale_values((123456.789,), 8)
+    assert scale < 8
+    assert abs(scaled[0]) <= INT_MAX
+    assert float(unscale(scaled, scale)[0]) == 123456.789
+
+
+def test_encoder_uses_the_coin_precision_for_prices_and_quantities():
+    encoder = CompactEncoder(Registry({(7, "BINANCE"): 3}), "BINANCE")
+    tick = Tick("ETHUSDT", "BINANCE", NOW_MS, 2500.125, 2500.25, 1234567890.5, 0.001)
+    row = encoder.row(7, tick)
+    assert row[:3] == (NOW, 7, "BINANCE")
+    assert row[3:5] == (2500125, 2500250)
+    assert row[7:9] == (1234567890500, 1)
+    assert row[9:] == (3, 3)
+
+
+def test_encoder_falls_back_to_the_default_scales():
+    encoder = CompactEncoder(Registry({}), "COINEX", price_scale=4, qty_scale=2)
+    tick = Tick("ETHUSDT", "COINEX", NOW_MS, "2500.1234", "2500.5", "10.25", "3")
+    row = encoder.row(7, tick)
+    assert row[3:5] == (25001234, 25005000)
+    assert row[7:] == (1025, 300, 4, 2)
@@ -0,0 +1,48 @@
+from conflator import TickConflator
+
+
+def test_keeps_the_latest_tick_per_symbol_and_exchange():
+    emitted = []
+    conflator = TickConflator(emitted.append, interval=1, slots=8)
+    assert conflator.offer("BTCUSDT", "BINANCE", 1, "btc-1")
+    assert conflator.offer("BTCUSDT", "BINANCE", 2, "btc-2")
+    assert conflator.offer("BTCUSDT", "COINEX", 1, "btc-coinex")
+    assert conflator.offer("ETHUSDT", "BINANCE", 5, "eth-5")
+    assert conflator.flush() == 3
+    assert emitted == ["btc-2", "btc-coinex", "eth-5"]
+    assert conflator.flush() == 0  # Nothing changed since
+
+
+def test_drops_versions_that_are_not_newer():
+    emitted = []
+    conflator = TickConflator(emitted.append, interval=1, slots=8)
+    conflator.offer("BTCUSDT", "BINANCE", 10, "btc-10")
+    assert not conflator.offer("BTCUSDT", "BINANCE", 10, "btc-10-again")
+    assert not conflator.offer("BTCUSDT", "BINANCE", 9, "btc-9")
+    conflator.flush()
+    # Still the newest after a flush, so a late duplicate stays out
+    assert not conflator.offer("BTCUSDT", "BINANCE", 10, "btc-10-late")
+    assert conflator.offer("BTCUSDT", "BINANCE", None, "btc-unversioned")
+    conflator.flush()
+    assert emitted == ["btc-10", "btc-unversioned"]
+    assert conflator.stats()["duplicates"] == 3
+
+
+def test_a_full_slot_table_passes_ticks_through():
+    emitted = []
+    conflator = TickConflator(emitted.append, interval=1, slots=1)
+    conflator.offer("BTCUSDT", "BINANCE", 1, "btc")
+    conflator.offer("ETHUSDT", "BINANCE", 1, "eth")
+    assert emitted == ["eth"]
+    conflator.flush()
+    assert emitted == ["eth", "btc"]
+    assert conflator.stats()["overflow"] == 1
+
+
+def test_stop_flushes_what_is_pending():
+    emitted = []
+    conflator = TickConflator(emitted.append, interval=60, slots=8)
+    conflator.start()
+    conflator.offer("BTCUSDT", "BINANCE", 1, "btc")
+    conflator.stop()
+    assert emitted == ["btc"]
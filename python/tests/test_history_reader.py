@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from db_manager import HistoryReader, decode_history_token, encode_history_token
+from fakes import FakeDBManager
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def history_rows(count):
+    columns = ("data_id", "timestamp", "best_bid")
+    rows = [(i, T0 + timedelta(seconds=i // 2), 100.0 + i) for i in range(count)]
+    return columns, rows
+
+
+def test_tokens_round_trip():
+    token = encode_history_token(T0, 42)
+    assert decode_history_token(token) == (T0, 42)
+    with pytest.raises(ValueError):
+        decode_history_token("not a token")
+
+
+def test_query_continues_after_the_token_row():
+    reader = HistoryReader(FakeDBManager(), ("data_id", "timestamp"))
+    token = encode_history_token(T0, 7)
+    query, params = reader.query(coin_id=3, after=token, limit=10)
+    assert "timestamp >= %s AND (timestamp > %s OR data_id > %s)" in query
+    assert query.endswith("ORDER BY timestamp ASC, data_id ASC LIMIT %s")
+    assert params == [3, T0, T0, 7, 10]
+    query, params = reader.query(after=token, descending=True)
+    assert "timestamp <= %s AND (timestamp < %s OR data_id < %s)" in query
+    assert "ORDER BY timestamp DESC, data_id DESC" in query
+    assert "OFFSET" not in query and "LIMIT" not in query
+
+
+def test_a_full_page_returns_the_token_of_its_last_row():
+    columns, rows = history_rows(3)
+    reader = HistoryReader(FakeDBManager(rows), columns)
+    page, token = reader.page(limit=3)
+    assert page == rows
+    assert decode_history_token(token) == (rows[-1][1], rows[-1][0])
+
+
+def test_a_short_or_empty_page_ends_the_range():
+    columns, rows = history_rows(2)
+    assert HistoryReader(FakeDBManager(rows), columns).page(limit=3)[1] is None
+    assert HistoryReader(FakeDBManager([]), columns).page(limit=3) == ([], None)
+    with pytest.raises(ValueError):
+        HistoryReader(FakeDBManager(rows), columns).page(limit=0)
+
+
+def test_page_raises_database_errors():
+    class BrokenCursor:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, query, params=None):
+            raise RuntimeError("connection lost")
+
+    db_manager = FakeDBManager()
+    db_manager.conn.cursor = lambda name=None: BrokenCursor()
+    with pytest.raises(RuntimeError):
+        HistoryReader(db_manager, ("data_id", "timestamp")).page()
+
+
+def test_stream_chunks_carry_tokens_and_cursors_get_their_own_names():
+    columns, rows = history_rows(5)
+    db_manager = FakeDBManager(rows)
+    reader = HistoryReader(db_manager, columns)
+    chunks = list(reader.stream(chunk_size=2))
+    assert [len(chunk) for chunk, _ in chunks] == [2, 2, 1]
+    for chunk, token in chunks:
+        assert decode_history_token(token) == (chunk[-1][1], chunk[-1][0])
+    list(reader.stream(chunk_size=2))
+    names = [name for name in db_manager.conn.cursor_names if name]
+    assert len(names) == 2 and names[0] != names[1]
+
+
+def test_columns_must_include_the_key():
+    with pytest.raises(ValueError):
+        HistoryReader(FakeDBManager(), ("timestamp", "best_bid"))
@@ -0,0 +1,26 @@
+from datetime import datetime, timezone
+from latest_store import LatestQuoteStore
+
+COLUMNS = ("coin_id", "timestamp", "best_bid", "best_ask", "exchange")
+
+
+def row(coin_id, second, bid):
+    timestamp = datetime(2026, 1, 1, 0, 0, second, tzinfo=timezone.utc)
+    return (coin_id, timestamp, bid, bid + 1.0, "BINANCE")
+
+
+def test_keeps_the_newest_row_per_coin_and_exchange():
+    store = LatestQuoteStore(COLUMNS)
+    store.add_rows([row(1, 5, 10.0), row(1, 3, 9.0), row(2, 1, 20.0)])
+    assert store.get(1, "BINANCE") == row(1, 5, 10.0)
+    assert sorted(store.dirty_rows()) == sorted([row(1, 5, 10.0), row(2, 1, 20.0)])
+    store.clear_dirty()
+    store.add_rows([row(1, 4, 11.0)])  # Older than what is held
+    assert store.dirty_rows() == []
+
+
+def test_the_upsert_never_touches_data_id():
+    query = LatestQuoteStore(COLUMNS).upsert_query("%s")
+    assert "data_id" not in query
+    assert "updated_at = EXCLUDED.updated_at" in query
+    assert "WHERE latest_coin_data_table.timestamp <= EXCLUDED.timestamp" in query
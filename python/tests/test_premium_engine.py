@@ -0,0 +1,90 @@
+import math
+import statistics
+from datetime import datetime, timedelta, timezone
+import pytest
+from premium_engine import Ewma, PremiumEngine, RollingWindow
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def at(seconds):
+    return T0 + timedelta(seconds=seconds)
+
+
+def test_rolling_window_matches_the_last_values():
+    window = RollingWindow(5)
+    assert window.mean is None and window.std is None
+    values = [1.5, -2.0, 3.25, 8.0, 0.5, 7.0, -1.0, 2.5, 4.0, 9.5, 3.0, 6.0]
+    for count, value in enumerate(values, 1):
+        window.push(value)
+        last = values[max(0, count - 5) : count]
+        assert window.mean == pytest.approx(statistics.mean(last))
+        if len(last) > 1:
+            assert window.std == pytest.approx(statistics.stdev(last))
+
+
+def test_rolling_window_does_not_drift():
+    # Premiums in percent, a million pushes through a small window
+    window = RollingWindow(7)
+    values = [0.35 + 0.001 * ((i * 7919) % 13) for i in range(1000000)]
+    for value in values:
+        window.push(value)
+    assert window.mean == pytest.approx(statistics.mean(values[-7:]), rel=1e-12)
+    assert window.std == pytest.approx(statistics.stdev(values[-7:]), rel=1e-9)
+
+
+def test_ewma_starts_at_the_first_value_and_follows_a_step():
+    ewma = Ewma(halflife=1)
+    ewma.push(10.0)
+    assert ewma.mean == 10.0 and ewma.std == 0.0
+    ewma.push(20.0)
+    assert ewma.mean == pytest.approx(15.0)
+    assert ewma.std > 0
+
+
+def test_premium_needs_both_exchanges():
+    engine = PremiumEngine(windows=(2,))
+    assert not engine.on_tick(1, "BINANCE", at(0), 100.0, 101.0)
+    assert engine.snapshot(1) is None
+    assert engine.drain() == []
+    assert engine.on_tick(1, "COINEX", at(1), 102.0, 103.0)
+    snapshot = engine.snapshot(1)
+    assert snapshot["timestamp"] == at(1)
+    assert snapshot["premium"] == pytest.approx(100 * (205 / 201 - 1))
+    assert snapshot["entry_premium"] == pytest.approx(100 * (102 / 101 - 1))
+    assert snapshot["exit_premium"] == pytest.approx(100 * (103 / 100 - 1))
+    assert snapshot["windows"]["2"]["mean"] == pytest.approx(snapshot["premium"])
+    assert [s["coin_id"] for s in engine.drain()] == [1]
+    assert engine.drain() == []
+
+
+def test_stale_duplicate_and_empty_ticks_are_ignored():
+    engine = PremiumEngine()
+    engine.on_tick(1, "BINANCE", at(5), 100.0, 101.0)
+    engine.on_tick(1, "COINEX", at(5), 100.0, 101.0)
+    engine.drain()
+    assert not engine.on_tick(1, "BINANCE", at(5), 50.0, 51.0)  # Seen already
+    assert not engine.on_tick(1, "BINANCE", at(4), 50.0, 51.0)  # Older
+    assert not engine.on_tick(1, "COINEX", at(6), None, 101.0)
+    assert not engine.on_tick(1, "KRAKEN", at(6), 100.0, 101.0)
+    assert engine.drain() == []
+    assert engine.snapshot(1)["premium"] == pytest.approx(0.0)
+    assert engine.on_tick(1, "BINANCE", at(6), 99.0, 100.0)
+    assert engine.snapshot(1)["premium"] > 0
+
+
+def test_windows_and_ewma_see_every_premium():
+    engine = PremiumEngine(windows=(3, 100), halflife=10)
+    premiums = []
+    for i in range(10):
+        engine.on_tick(1, "BINANCE", at(i), 100.0, 100.0)
+        engine.on_tick(1, "COINEX", at(i), 100.0 + i, 100.0 + i)
+        premiums.append(engine.snapshot(1)["premium"])
+    # Each round is two updates: the Binance tick repeats the last premium
+    pushed = [premiums[0]] + [p for pair in zip(premiums, premiums[1:]) for p in pair]
+    windows = engine.snapshot(1)["windows"]
+    assert windows["3"]["mean"] == pytest.approx(statistics.mean(pushed[-3:]))
+    assert windows["100"]["mean"] == pytest.approx(statistics.mean(pushed))
+    assert windows["100"]["std"] == pytest.approx(statistics.stdev(pushed))
+    assert min(pushed) < engine.snapshot(1)["ewma_mean"] < max(pushed)
+    assert not math.isnan(engine.snapshot(1)["ewma_std"])
@@ -0,0 +1,86 @@
+import threading
+import pytest
+import quote_board
+from decoders import Tick
+from quote_board import HEADER_SIZE, SEQUENCE, QuoteBoard, QuoteBoardWriter
+
+
+def tick(timestamp, bid, ask, symbol="BTCUSDT", exchange="BINANCE"):
+    return Tick(symbol, exchange, timestamp, bid, ask, 1.5, 2.5, last_price="101.5")
+
+
+def test_published_quotes_are_read_back(tmp_path):
+    writer = QuoteBoardWriter(str(tmp_path), "binance", capacity=8)
+    board = QuoteBoard(str(tmp_path))
+    assert board.quote("BTCUSDT", "BINANCE") is None
+    writer.publish(tick(1000, 100.0, 101.0))
+    quote = board.quote("BTCUSDT", "BINANCE")
+    assert (quote.timestamp, quote.best_bid, quote.best_ask) == (1000, 100.0, 101.0)
+    assert (quote.best_bid_qty, quote.best_ask_qty, quote.last_price) == (
+        1.5,
+        2.5,
+        101.5,
+    )
+    assert quote.published_ns > 0
+    writer.publish(tick(900, 90.0, 91.0))  # Older than what is on the board
+    assert board.quote("BTCUSDT", "BINANCE").best_bid == 100.0
+    writer.publish(tick(1000, 102.0, 103.0, exchange="COINEX"))
+    assert list(board.quotes("BTCUSDT")) == ["BINANCE"]  # Not refreshed yet
+    board.refresh()
+    assert sorted(board.quotes("BTCUSDT")) == ["BINANCE", "COINEX"]
+    assert len(board.snapshot()) == 2
+    board.close()
+    writer.close()
+
+
+def test_a_board_has_a_single_writer(tmp_path):
+    writer = QuoteBoardWriter(str(tmp_path), "binance", capacity=8)
+    with pytest.raises(OSError):
+        QuoteBoardWriter(str(tmp_path), "binance", capacity=8)
+    writer.publish(tick(1000, 100.0, 101.0))
+    writer.close()
+    # A restarted writer keeps its slots and quotes
+    writer = QuoteBoardWriter(str(tmp_path), "binance", capacity=8)
+    assert QuoteBoard(str(tmp_path)).quote("BTCUSDT", "BINANCE").best_bid == 100.0
+    writer.close()
+
+
+def test_a_slot_stuck_mid_write_reads_as_missing(tmp_path, monkeypatch):
+    monkeypatch.setattr(quote_board, "READ_RETRIES", 3)
+    writer = QuoteBoardWriter(str(tmp_path), "binance", capacity=8)
+    writer.publish(tick(1000, 100.0, 101.0))
+    board = QuoteBoard(str(tmp_path))
+    SEQUENCE.pack_into(writer.map, HEADER_SIZE, 3)
+    assert board.quote("BTCUSDT", "BINANCE") is None
+    writer.close()
+    # Reopening repairs the torn slot
+    writer = QuoteBoardWriter(str(tmp_path), "binance", capacity=8)
+    assert board.quote("BTCUSDT", "BINANCE").best_bid == 100.0
+    writer.close()
+
+
+def test_reads_never_see_a_half_written_quote(tmp_path):
+    writer = QuoteBoardWriter(str(tmp_path), "binance", capacity=8)
+    writer.publish(tick(0, 0.0, 1.0))
+    board = QuoteBoard(str(tmp_path))
+    done = threading.Event()
+
+    def publish():
+        for count in range(1, 20000):
+            writer.publish(tick(count, float(count), count + 1.0))
+        done.set()
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    reads = 0
+    while not done.is_set() or reads == 0:
+        quote = board.quote("BTCUSDT", "BINANCE", refresh=False)
+        # None when the GIL parks the writer mid-write for longer than the
+        # retries last; never a mix of two writes
+        if quote is not None:
+            assert quote.best_ask == quote.best_bid + 1.0
+            assert quote.timestamp == quote.best_bid
+            reads += 1
+    thread.join()
+    board.close()
+    writer.close()
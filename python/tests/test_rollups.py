@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+import rollups
+from fakes import FakeDBManager
+from rollups import ROLLUP_UPSERT, RollupAggregator, RollupWriter
+
+COLUMNS = ("coin_id", "exchange", "timestamp", "best_bid", "best_ask")
+KEY = (1, "BINANCE")
+T0 = 1767225600  # 2026-01-01 00:00:00 UTC, on an hour boundary
+
+
+def row(seconds, bid, ask=None):
+    timestamp = datetime.fromtimestamp(T0 + seconds, timezone.utc)
+    return (1, "BINANCE", timestamp, bid, bid + 2.0 if ask is None else ask)
+
+
+def test_closed_bars_are_handed_out_once():
+    aggregator = RollupAggregator(COLUMNS)
+    aggregator.add_rows(
+        [row(0.1, 99.0), row(0.5, 109.0), row(0.9, 89.0), row(1.2, 1.0)]
+    )
+    due = aggregator.due(T0 + 1)
+    bar = due["1s"][(KEY, T0)]
+    assert (bar.open, bar.high, bar.low, bar.close, bar.ticks) == (
+        100.0,
+        110.0,
+        90.0,
+        90.0,
+        3,
+    )
+    assert due["1m"] == {} and due["1h"] == {}
+    assert aggregator.due(T0 + 1)["1s"] == {}
+    assert list(aggregator.due(T0 + 2)["1s"]) == [(KEY, T0 + 1)]
+
+
+def test_late_ticks_start_a_partial_bar():
+    aggregator = RollupAggregator(COLUMNS)
+    aggregator.add_rows([row(0.1, 99.0), row(0.2, 101.0)])
+    assert aggregator.due(T0 + 5)["1s"][(KEY, T0)].ticks == 2
+    # Arrives after its 1s bar was written: merged into it by the upsert
+    aggregator.add_rows([row(0.3, 79.0)])
+    bar = aggregator.due(T0 + 6)["1s"][(KEY, T0)]
+    assert (bar.open, bar.low, bar.ticks) == (80.0, 80.0, 1)
+    assert aggregator.due(T0 + 60)["1m"][(KEY, T0)].ticks == 3
+
+
+def test_the_upsert_merges_into_the_stored_bar():
+    query = ROLLUP_UPSERT.format(table="coin_bar_1s")
+    assert "high = GREATEST(bar.high, EXCLUDED.high)" in query
+    assert "low = LEAST(bar.low, EXCLUDED.low)" in query
+    assert "ticks = bar.ticks + EXCLUDED.ticks" in query
+    assert "open =" not in query
+
+
+def test_seeding_skips_bars_written_at_shutdown():
+    aggregator = RollupAggregator(COLUMNS)
+    minute = datetime.fromtimestamp(T0, timezone.utc)
+    fine = [
+        (1, "BINANCE", minute, 100.0, 101.0, 99.0, 100.5, 4, 2.0, 3.0),
+        (2, "BINANCE", minute, 10.0, 11.0, 9.0, 10.5, 2, 2.0, 3.0),
+    ]
+    aggregator.seed("1m", fine, 1, stored=[((2, "BINANCE"), T0)])
+    aggregator.add_rows([row(5, 99.0), (2, "BINANCE", row(5, 0)[2], 9.0, 11.0)])
+    bars = aggregator.due(T0 + 60)["1m"]
+    assert bars[(KEY, T0)].ticks == 5  # Rebuilt after a crash
+    assert bars[((2, "BINANCE"), T0)].ticks == 1  # Only the new tick
+
+
+def test_a_failed_write_keeps_the_ticks_gained_meanwhile(monkeypatch):
+    aggregator = RollupAggregator(COLUMNS)
+    writer = RollupWriter(aggregator, "BINANCE")
+    writer.db_manager = FakeDBManager()
+    written = []
+    results = [False, True]
+
+    def write(pending):
+        written.append({item: bar.ticks for item, bar in pending["1s"].items()})
+        return results.pop(0)
+
+    monkeypatch.setattr(writer, "write", write)
+    monkeypatch.setattr(rollups.time, "time", lambda: T0 + 10)
+    aggregator.add_rows([row(0.1, 99.0), row(0.2, 99.0)])
+    writer.flush()
+    aggregator.add_rows([row(0.3, 99.0)])
+    writer.flush()
+    assert written == [{(KEY, T0): 2}, {(KEY, T0): 3}]
+    assert writer.pending["1s"] == {}
@@ -0,0 +1,39 @@
+import pytest
+from sharding import HashRing, Shard, shard_from_env
+
+COINS = [f"COIN{i}USDT" for i in range(2000)]
+
+
+def test_every_coin_has_exactly_one_shard():
+    ring = HashRing(4)
+    assignment = ring.assign(COINS)
+    assert sorted(c for coins in assignment.values() for c in coins) == sorted(COINS)
+    shards = [Shard(index, 4) for index in range(4)]
+    for coin in COINS[:200]:
+        assert [shard.owns(coin) for shard in shards].count(True) == 1
+
+
+def test_assignment_is_stable_and_balanced():
+    assert HashRing(4).assign(COINS) == HashRing(4).assign(COINS)
+    sizes = [len(coins) for coins in HashRing(4).assign(COINS).values()]
+    assert min(sizes) > len(COINS) / 4 * 0.7
+    assert max(sizes) < len(COINS) / 4 * 1.3
+
+
+def test_adding_a_shard_only_moves_coins_to_it():
+    before, after = HashRing(4), HashRing(5)
+    moved = [coin for coin in COINS if before.shard_of(coin) != after.shard_of(coin)]
+    assert all(after.shard_of(coin) == 4 for coin in moved)
+    assert len(moved) < len(COINS) / 5 * 1.3
+
+
+def test_shard_arguments_are_checked(monkeypatch):
+    with pytest.raises(ValueError):
+        HashRing(0)
+    with pytest.raises(ValueError):
+        Shard(4, 4)
+    monkeypatch.setenv("SHARD_COUNT", "1")
+    assert shard_from_env() is None
+    monkeypatch.setenv("SHARD_COUNT", "3")
+    monkeypatch.setenv("SHARD_INDEX", "2")
+    assert repr(shard_from_env()) == "Shard(2/3)"
@@ -0,0 +1,78 @@
+import os
+from datetime import datetime, timedelta, timezone
+import psycopg2
+import pytest
+import db_manager
+import spill_buffer
+from fakes import FakeDBManager
+from spill_buffer import HEADER_SIZE, SpillBuffer, SpillReplayer
+
+COLUMNS = ("coin_id", "exchange", "timestamp", "best_bid", "best_ask")
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def spill(tmp_path, monkeypatch):
+    monkeypatch.setattr(spill_buffer, "DBManager", FakeDBManager)
+    record_size = SpillBuffer(str(tmp_path / "size"), "t", COLUMNS).codec.record_size
+    # Two rows per segment
+    spill = SpillBuffer(
+        str(tmp_path),
+        "coin_data_table",
+        COLUMNS,
+        segment_bytes=HEADER_SIZE + 2 * record_size,
+    )
+    spill.append(
+        [(1, "BINANCE", T0 + timedelta(seconds=i), 1.0 + i, 2.0 + i) for i in range(4)]
+    )
+    return spill
+
+
+@pytest.fixture
+def failures(monkeypatch):
+    # Errors the next COPYs raise, in order
+    errors = []
+    copy_rows = db_manager.BatchWriter._copy_rows
+
+    def failing_copy(writer, cursor, rows):
+        if errors:
+            raise errors.pop(0)
+        copy_rows(writer, cursor, rows)
+
+    monkeypatch.setattr(db_manager.BatchWriter, "_copy_rows", failing_copy)
+    return errors
+
+
+def test_replayed_rows_reach_on_flush(spill, failures):
+    flushed = []
+    replayer = SpillReplayer(spill, on_flush=flushed.append)
+    assert replayer.replay() == 4
+    assert [row[3] for rows in flushed for row in rows] == [1.0, 2.0, 3.0, 4.0]
+    assert spill.segments() == []
+
+
+def test_a_segment_that_keeps_failing_is_quarantined(spill, failures):
+    first = spill.segments()[0]
+    failures.extend(
+        [psycopg2.ProgrammingError("bad"), psycopg2.ProgrammingError("bad")]
+    )
+    flushed = []
+    replayer = SpillReplayer(spill, on_flush=flushed.append, max_failures=2)
+    assert replayer.replay() == 0
+    assert first in spill.segments()
+    # The second failure moves it aside and the next segment replays
+    assert replayer.replay() == 2
+    assert os.path.exists(
+        os.path.join(spill.directory, "quarantine", os.path.basename(first))
+    )
+    assert spill.segments() == []
+    assert [row[3] for rows in flushed for row in rows] == [3.0, 4.0]
+
+
+def test_connection_errors_never_quarantine(spill, failures):
+    failures.extend([psycopg2.OperationalError("server closed")] * 3)
+    replayer = SpillReplayer(spill, max_failures=2)
+    for _ in range(3):
+        assert replayer.replay() == 0
+    assert len(spill.segments()) == 2
+    assert not os.path.exists(os.path.join(spill.directory, "quarantine"))
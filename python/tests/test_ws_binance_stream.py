@@ -0,0 +1,107 @@
+import asyncio
+import os
+import signal
+import socket
+import sys
+from datetime import datetime
+import pytest
+import quote_board
+import rollups
+import spill_buffer
+import ws_binance
+from fakes import FakeDBManager, FakeRegistry
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bench"))
+
+from mock_server import MockExchange, start_mock_server  # noqa: E402
+
+SYMBOLS = ["BENCH0USDT", "BENCH1USDT", "BENCH2USDT"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def idle(on_events, on_resync):
+    await asyncio.Event().wait()
+
+
+@pytest.fixture
+def port(monkeypatch):
+    # The collector on a fake database, fed only by the mock exchange
+    port = free_port()
+    monkeypatch.setattr(ws_binance, "COINS_API_URL", f"http://127.0.0.1:{port}/coins")
+    monkeypatch.setattr(ws_binance, "DB_ASYNC", False)
+    monkeypatch.setattr(ws_binance, "LATEST_UPSERT", False)
+    monkeypatch.setattr(ws_binance, "DBManager", FakeDBManager)
+    monkeypatch.setattr(ws_binance, "SymbolRegistry", FakeRegistry)
+    monkeypatch.setattr(ws_binance, "listen", idle)
+    monkeypatch.setattr(rollups, "ROLLUPS", False)
+    monkeypatch.setattr(spill_buffer, "SPILL_DIR", "")
+    monkeypatch.setattr(quote_board, "QUOTE_BOARD_DIR", "")
+    return port
+
+
+async def collect(port, rows):
+    runner = await start_mock_server(MockExchange(SYMBOLS, rate=300), port=port)
+    ticker = ws_binance.BinanceStreamTicker(stream_url=f"ws://127.0.0.1:{port}")
+    ticker.writer.flush_interval = 0.05
+    task = asyncio.create_task(ticker.run())
+    try:
+        for _ in range(200):
+            await asyncio.sleep(0.05)
+            if len(ticker.db_manager.conn.copied_rows()) >= rows:
+                break
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await runner.cleanup()
+    return ticker
+
+
+def test_stream_ticker_commits_the_mock_feed(port):
+    ticker = asyncio.run(collect(port, 100))
+    conn = ticker.db_manager.conn
+    rows = conn.copied_rows()
+    assert len(rows) >= 100
+    assert conn.closed and not conn.pending  # Flushed and closed on the way out
+
+    columns = ws_binance.BINANCE_COLUMNS
+    assert all(len(row) == len(columns) for row in rows)
+    rows = [dict(zip(columns, row)) for row in rows]
+    coin_ids = {str(ticker.registry.ids[symbol]) for symbol in SYMBOLS}
+    assert {row["coin_id"] for row in rows} == coin_ids
+    assert {row["exchange"] for row in rows} == {"BINANCE"}
+    for row in rows:
+        assert float(row["best_bid"]) < float(row["best_ask"])
+        assert float(row["best_bid_qty"]) > 0 and float(row["best_ask_qty"]) > 0
+        datetime.fromisoformat(row["timestamp"])
+    # markPrice frames are joined onto the following bookTicker rows
+    assert any(row["mark_price"] != "\\N" for row in rows)
+
+    # Every COPY was committed together with its tick notification
+    copies = [entry for entry in conn.committed if entry[0] == "copy"]
+    notifies = [entry for entry in conn.committed if "pg_notify" in entry[1]]
+    assert copies and len(notifies) == len(copies)
+    assert all(sql.startswith("COPY coin_data_table") for _, sql, _ in copies)
+
+
+def test_sigterm_flushes_before_exiting(port):
+    async def terminate(port):
+        runner = await start_mock_server(MockExchange(SYMBOLS, rate=300), port=port)
+        ticker = ws_binance.BinanceStreamTicker(stream_url=f"ws://127.0.0.1:{port}")
+        ticker.writer.flush_interval = 60  # Only the shutdown flushes
+        loop = asyncio.get_running_loop()
+        loop.call_later(1, os.kill, os.getpid(), signal.SIGTERM)
+        try:
+            await ws_binance.main(ticker)
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+            await runner.cleanup()
+        return ticker
+
+    ticker = asyncio.run(terminate(port))
+    conn = ticker.db_manager.conn
+    assert conn.closed and conn.copied_rows()
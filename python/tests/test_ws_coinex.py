@@ -0,0 +1,23 @@
+import threading
+import ws_coinex
+from coin_listener import CoinSet
+from fakes import FakeRegistry
+
+
+def test_coin_events_reach_every_writer_registry():
+    collector = ws_coinex.CoinexWebSocket.__new__(ws_coinex.CoinexWebSocket)
+    collector.registry = FakeRegistry()
+    collector.worker_registries = [FakeRegistry(), FakeRegistry()]
+    collector.handler_lock = threading.Lock()
+    collector.coins = CoinSet()
+    collector.ws_lock = threading.Lock()
+    collector.ws = None
+    collector.on_coin_events(
+        [
+            {"op": "INSERT", "coin_id": 42, "coin_name": "NEWUSDT", "collecting": True},
+            {"op": "DELETE", "coin_id": 7, "coin_name": "OLDUSDT"},
+        ]
+    )
+    for registry in [collector.registry, *collector.worker_registries]:
+        assert registry.ids == {"NEWUSDT": 42}
+    assert list(collector.coins) == ["NEWUSDT"]
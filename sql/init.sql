@@ -19,9 +19,10 @@ CREATE TABLE IF NOT EXISTS coins_table (
 );
 
 
--- Create coin_data_table if it doesn't exist
+-- Create coin_data_table if it doesn't exist, range partitioned by day on timestamp.
+-- Partitions are pre-created and expired by python/scripts/partition_manager.py
 CREATE TABLE IF NOT EXISTS coin_data_table (
-    data_id SERIAL PRIMARY KEY,
+    data_id SERIAL,
     coin_id INT REFERENCES coins_table(coin_id),
     timestamp TIMESTAMPTZ NOT NULL,
     best_bid REAL,
@@ -31,9 +32,131 @@ CREATE TABLE IF NOT EXISTS coin_data_table (
     mark_price REAL,
     last_price REAL,  
     updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP, 
-    exchange exchange_enum NOT NULL
+    exchange exchange_enum NOT NULL,
+    PRIMARY KEY (data_id, timestamp)  -- The partition key must be part of the primary key
+) PARTITION BY RANGE (timestamp);
+
+-- Catches rows outside the pre-created daily partitions
+CREATE TABLE IF NOT EXISTS coin_data_table_default PARTITION OF coin_data_table DEFAULT;
+
+CREATE INDEX IF NOT EXISTS coin_data_coin_exchange_timestamp_idx
+    ON coin_data_table (coin_id, exchange, timestamp);
+
+-- Rows arrive in timestamp order, so a BRIN index narrows time-range reads
+-- across all coins to the matching block ranges at a tiny fraction of a
+-- btree's size (HistoryReader in python/scripts/db_manager.py)
+CREATE INDEX IF NOT EXISTS coin_data_timestamp_brin_idx
+    ON coin_data_table USING BRIN (timestamp) WITH (pages_per_range = 32);
+
+-- Compact tick storage (STORAGE_MODE=compact in the collectors). Prices and
+-- quantities are integers scaled by 10^price_scale / 10^qty_scale, so there is
+-- no REAL rounding. Prices on the coin's tick grid fit an INT; quantities get a
+-- BIGINT so large sizes keep their digits. Columns are ordered so no alignment
+-- padding is needed, and there is no SERIAL id, primary key index or
+-- updated_at: 52 bytes of row data against 56 for coin_data_table.
+CREATE TABLE IF NOT EXISTS coin_tick_table (
+    timestamp TIMESTAMPTZ NOT NULL,
+    coin_id INT NOT NULL REFERENCES coins_table(coin_id),
+    exchange exchange_enum NOT NULL,
+    best_bid INT,
+    best_ask INT,
+    mark_price INT,
+    last_price INT,
+    best_bid_qty BIGINT,
+    best_ask_qty BIGINT,
+    price_scale SMALLINT NOT NULL,
+    qty_scale SMALLINT NOT NULL
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE IF NOT EXISTS coin_tick_table_default PARTITION OF coin_tick_table DEFAULT;
+
+CREATE INDEX IF NOT EXISTS coin_tick_coin_exchange_timestamp_idx
+    ON coin_tick_table (coin_id, exchange, timestamp);
+
+CREATE INDEX IF NOT EXISTS coin_tick_timestamp_brin_idx
+    ON coin_tick_table USING BRIN (timestamp) WITH (pages_per_range = 32);
+
+-- coin_tick_table with exact NUMERIC prices and quantities
+CREATE OR REPLACE VIEW coin_tick_view AS
+SELECT
+    timestamp,
+    coin_id,
+    exchange,
+    best_bid * power(10::NUMERIC, -price_scale) AS best_bid,
+    best_ask * power(10::NUMERIC, -price_scale) AS best_ask,
+    best_bid_qty * power(10::NUMERIC, -qty_scale) AS best_bid_qty,
+    best_ask_qty * power(10::NUMERIC, -qty_scale) AS best_ask_qty,
+    mark_price * power(10::NUMERIC, -price_scale) AS mark_price,
+    last_price * power(10::NUMERIC, -price_scale) AS last_price
+FROM coin_tick_table;
+
+-- Downsampled bars of the mid price per coin and exchange, kept by the
+-- collectors (python/scripts/rollups.py) so long-range charts never scan raw
+-- ticks. Spreads are in basis points of the mid. The 1s bars are partitioned
+-- by day like the tick tables; 1m and 1h stay small enough not to be.
+CREATE TABLE IF NOT EXISTS coin_bar_1s (
+    coin_id INT NOT NULL REFERENCES coins_table(coin_id),
+    exchange exchange_enum NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    open DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    low DOUBLE PRECISION NOT NULL,
+    close DOUBLE PRECISION NOT NULL,
+    ticks INT NOT NULL,
+    spread_bps_avg REAL,
+    spread_bps_max REAL,
+    PRIMARY KEY (coin_id, exchange, bucket)
+) PARTITION BY RANGE (bucket);
+
+CREATE TABLE IF NOT EXISTS coin_bar_1s_default PARTITION OF coin_bar_1s DEFAULT;
+
+CREATE TABLE IF NOT EXISTS coin_bar_1m (
+    coin_id INT NOT NULL REFERENCES coins_table(coin_id),
+    exchange exchange_enum NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    open DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    low DOUBLE PRECISION NOT NULL,
+    close DOUBLE PRECISION NOT NULL,
+    ticks INT NOT NULL,
+    spread_bps_avg REAL,
+    spread_bps_max REAL,
+    PRIMARY KEY (coin_id, exchange, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS coin_bar_1h (
+    coin_id INT NOT NULL REFERENCES coins_table(coin_id),
+    exchange exchange_enum NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    open DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    low DOUBLE PRECISION NOT NULL,
+    close DOUBLE PRECISION NOT NULL,
+    ticks INT NOT NULL,
+    spread_bps_avg REAL,
+    spread_bps_max REAL,
+    PRIMARY KEY (coin_id, exchange, bucket)
 );
 
+-- Create the daily partitions from yesterday up to three days ahead
+DO $$
+DECLARE
+    parent TEXT;
+    day DATE;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['coin_data_table', 'coin_tick_table', 'coin_bar_1s'] LOOP
+        FOR day IN SELECT generate_series(CURRENT_DATE - 1, CURRENT_DATE + 3, INTERVAL '1 day')::DATE LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                parent || '_p' || to_char(day, 'YYYYMMDD'),
+                parent,
+                day::TIMESTAMP AT TIME ZONE 'UTC',
+                (day + 1)::TIMESTAMP AT TIME ZONE 'UTC'
+            );
+        END LOOP;
+    END LOOP;
+END $$;
+
 CREATE TABLE IF NOT EXISTS orders (
     id SERIAL,                                 -- Unique identifier for each order
     coin_id INT REFERENCES coins_table(coin_id), -- Foreign key referencing the coins_table
@@ -54,7 +177,7 @@ CREATE TABLE IF NOT EXISTS orders (
 -- Create latest_coin_data_table to store the most recent value of the coin data
 CREATE TABLE IF NOT EXISTS latest_coin_data_table (
     coin_id INT REFERENCES coins_table(coin_id),
-    data_id INT REFERENCES coin_data_table(data_id) ON DELETE CASCADE,
+    data_id INT,  -- No foreign key: data_id alone is not unique on the partitioned coin_data_table
     timestamp TIMESTAMPTZ NOT NULL,
     best_bid REAL,
     best_ask REAL,
@@ -97,8 +220,75 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
--- Create trigger to update latest_coin_data_table after insert on coin_data_table
+-- Create trigger to update latest_coin_data_table after insert on coin_data_table.
+-- Sessions that maintain latest_coin_data_table themselves (the Python collectors,
+-- see LATEST_UPSERT) set coin_data.latest_trigger = off to skip it; it can also
+-- be switched off for the whole database with
+--   ALTER DATABASE "coinex-prices" SET coin_data.latest_trigger = 'off';
+-- Dropped and recreated so a rerun (sql/migrate.sql) applies the WHEN clause
+DROP TRIGGER IF EXISTS update_latest_trigger ON coin_data_table;
 CREATE TRIGGER update_latest_trigger
 AFTER INSERT ON coin_data_table
 FOR EACH ROW
+WHEN (COALESCE(current_setting('coin_data.latest_trigger', true), 'on') <> 'off')
 EXECUTE FUNCTION update_latest_coin_data();
+
+-- Live cross-exchange premium per coin (percent), maintained by
+-- python/scripts/premium_engine.py, which also announces every update on the
+-- premium_updates NOTIFY channel
+CREATE TABLE IF NOT EXISTS premium_table (
+    coin_id INT PRIMARY KEY REFERENCES coins_table(coin_id),
+    timestamp TIMESTAMPTZ NOT NULL,
+    premium DOUBLE PRECISION,        -- Coinex mid / Binance mid - 1
+    entry_premium DOUBLE PRECISION,  -- Coinex bid / Binance ask - 1
+    exit_premium DOUBLE PRECISION,   -- Coinex ask / Binance bid - 1
+    ewma_mean DOUBLE PRECISION,
+    ewma_std DOUBLE PRECISION,
+    window_stats JSONB,              -- {"<ticks>": {"mean": ..., "std": ...}}
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Announce coins_table changes so the collectors can subscribe and unsubscribe
+-- symbols on their live sockets (python/scripts/coin_listener.py)
+CREATE OR REPLACE FUNCTION notify_coins_changed()
+RETURNS TRIGGER AS $$
+DECLARE
+    row RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row := OLD;
+    ELSE
+        row := NEW;
+    END IF;
+    PERFORM pg_notify('coins_changed', json_build_object(
+        'op', TG_OP,
+        'coin_id', row.coin_id,
+        'coin_name', row.coin_name,
+        'old_coin_name', CASE WHEN TG_OP = 'UPDATE' THEN OLD.coin_name END,
+        'collecting', row.collecting
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS coins_changed_trigger ON coins_table;
+CREATE TRIGGER coins_changed_trigger
+AFTER INSERT OR DELETE OR UPDATE OF coin_name, collecting ON coins_table
+FOR EACH ROW
+EXECUTE FUNCTION notify_coins_changed();
+
+-- Periods a collector was not receiving a feed: a dropped connection (coin_id
+-- NULL, every subscribed coin) or a single coin that went stale. snapshot_at is
+-- when the REST snapshot that filled the gap was taken, NULL if it failed
+CREATE TABLE IF NOT EXISTS feed_gap_table (
+    gap_id SERIAL PRIMARY KEY,
+    exchange exchange_enum NOT NULL,
+    coin_id INT REFERENCES coins_table(coin_id),
+    gap_start TIMESTAMPTZ NOT NULL,
+    gap_end TIMESTAMPTZ NOT NULL,
+    reason TEXT NOT NULL,            -- 'disconnect' or 'stale'
+    snapshot_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS feed_gap_exchange_start_idx
+    ON feed_gap_table (exchange, gap_start);
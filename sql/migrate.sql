@@ -0,0 +1,95 @@
+-- Brings a database created by an earlier sql/init.sql up to date. init.sql
+-- only runs when the postgres data directory is first created, so existing
+-- databases run this once after upgrading. It is safe to run again:
+--   psql -v ON_ERROR_STOP=1 -h localhost -U postgres -d coinex-prices -f sql/migrate.sql
+-- An unpartitioned coin_data_table is replaced by the daily partitioned one and
+-- every row is copied over, in one transaction. Take a backup and stop the
+-- collectors first: the copy rewrites the whole table.
+BEGIN;
+
+-- Move an unpartitioned coin_data_table aside, with its sequence and indexes,
+-- so init.sql creates the partitioned one under the original names
+DO $$
+DECLARE
+    index_name TEXT;
+BEGIN
+    IF to_regclass('coin_data_table') IS NULL OR EXISTS (
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'coin_data_table'::regclass
+    ) THEN
+        RETURN;
+    END IF;
+    RAISE NOTICE 'Partitioning coin_data_table';
+    -- data_id alone is not unique on the partitioned table (see init.sql)
+    ALTER TABLE latest_coin_data_table
+        DROP CONSTRAINT IF EXISTS latest_coin_data_table_data_id_fkey;
+    ALTER TABLE coin_data_table RENAME TO coin_data_table_unpartitioned;
+    ALTER SEQUENCE IF EXISTS coin_data_table_data_id_seq
+        RENAME TO coin_data_table_unpartitioned_data_id_seq;
+    FOR index_name IN
+        SELECT class.relname
+        FROM pg_index
+        JOIN pg_class class ON class.oid = pg_index.indexrelid
+        WHERE pg_index.indrelid = 'coin_data_table_unpartitioned'::regclass
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', index_name, 'unpartitioned_' || index_name);
+    END LOOP;
+END $$;
+
+-- Quantities of coin_tick_table were INT before; a no-op once they are BIGINT.
+-- The view depends on the columns; init.sql below recreates it
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'coin_tick_table' AND column_name = 'best_bid_qty'
+            AND data_type = 'integer'
+    ) THEN
+        DROP VIEW IF EXISTS coin_tick_view;
+        ALTER TABLE coin_tick_table
+            ALTER COLUMN best_bid_qty TYPE BIGINT,
+            ALTER COLUMN best_ask_qty TYPE BIGINT;
+        RAISE NOTICE 'Widened coin_tick_table quantities to BIGINT';
+    END IF;
+END $$;
+
+-- Tables, indexes, partitions, functions and triggers added since
+\ir init.sql
+
+-- Copy the old rows into daily partitions covering every day they span, then
+-- drop the old table
+DO $$
+DECLARE
+    first_day DATE;
+    day DATE;
+BEGIN
+    IF to_regclass('coin_data_table_unpartitioned') IS NULL THEN
+        RETURN;
+    END IF;
+    SELECT (min(timestamp) AT TIME ZONE 'UTC')::DATE INTO first_day
+    FROM coin_data_table_unpartitioned;
+    FOR day IN SELECT generate_series(first_day, CURRENT_DATE, INTERVAL '1 day')::DATE LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF coin_data_table FOR VALUES FROM (%L) TO (%L)',
+            'coin_data_table_p' || to_char(day, 'YYYYMMDD'),
+            day::TIMESTAMP AT TIME ZONE 'UTC',
+            (day + 1)::TIMESTAMP AT TIME ZONE 'UTC'
+        );
+    END LOOP;
+    -- History only: latest_coin_data_table already holds the newest rows
+    PERFORM set_config('coin_data.latest_trigger', 'off', true);
+    INSERT INTO coin_data_table (
+        data_id, coin_id, timestamp, best_bid, best_ask, best_bid_qty, best_ask_qty,
+        mark_price, last_price, updated_at, exchange
+    )
+    SELECT
+        data_id, coin_id, timestamp, best_bid, best_ask, best_bid_qty, best_ask_qty,
+        mark_price, last_price, updated_at, exchange
+    FROM coin_data_table_unpartitioned;
+    -- New rows continue after the copied data_ids
+    PERFORM setval(pg_get_serial_sequence('coin_data_table', 'data_id'), max(data_id))
+    FROM coin_data_table_unpartitioned;
+    DROP TABLE coin_data_table_unpartitioned;
+    RAISE NOTICE 'Copied coin_data_table into daily partitions';
+END $$;
+
+COMMIT;